@@ -18,7 +18,7 @@ print("version="+tale.__version__)
 setup_args = dict(
     name='tale',
     version=tale.__version__,
-    packages=['tale', 'tale.cmds', 'tale.items', 'tale.io', 'tale.demo', 'tale.demo.zones'],
+    packages=['tale', 'tale.cmds', 'tale.items', 'tale.io', 'tale.demo', 'tale.demo.zones', 'tale.tools'],
     package_data={
         'tale': ['soul_adverbs.txt'],
         'tale.io': ['quill_pen_paper.ico', 'quill_pen_paper.gif']
@@ -34,6 +34,11 @@ class VillageIdiot(NPC):
                 self.location.tell("%s drools on %s." % (title, target.title),
                     specific_targets=[target], specific_target_msg="%s drools on you." % title)
 
+    def heartbeat_fastforward(self, ctx, ticks):
+        # when time is skipped (when waiting), count all skipped beats but drool at most once
+        self.beats_before_drool -= ticks - 1
+        self.heartbeat(ctx)
+
 
 class TownCrier(NPC):
     def init(self):
@@ -41,6 +46,10 @@ class TownCrier(NPC):
         # This is the preferred way (it's efficient).
         mud_context.driver.defer(2, self, self.do_cry)
 
+    def init_spawned(self):
+        # a new town crier that was spawned (by a zone reset) doesn't run init, but has to start yelling too
+        mud_context.driver.defer(2, self, self.do_cry)
+
     def do_cry(self, driver):
         self.tell_others("{Title} yells: welcome everyone!")
         message_nearby_locations(self.location, "Someone nearby is yelling: welcome everyone!")
@@ -62,6 +71,9 @@ class TownCrier(NPC):
 class WalkingRat(Monster):
     def init(self):
         super(WalkingRat, self).init()
+        self.init_spawned()
+
+    def init_spawned(self):
         mud_context.driver.defer(2, self, self.do_idle_action)
         mud_context.driver.defer(4, self, self.do_random_move)
 
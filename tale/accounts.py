@@ -0,0 +1,206 @@
+"""
+Player accounts for mud mode, kept in an sqlite database in the user storage.
+
+The account table has an index on the player name. The saved state of a player
+(their pickled attributes, with the objects of the world referred to by their id in
+the pristine world) is only read when the player logs in. Saves are collected and
+written to the database together, in a single transaction.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import binascii
+import datetime
+import hashlib
+import io
+import os
+import pickle
+import sqlite3
+import threading
+from . import base
+
+
+PASSWORD_ITERATIONS = 20000
+
+
+def hash_password(password, salt=None, iterations=PASSWORD_ITERATIONS):
+    """salted and stretched password hash, as 'iterations$salt$hash'"""
+    if salt is None:
+        salt = binascii.hexlify(os.urandom(16)).decode("ascii")
+    data = password.encode("utf-8")
+    if hasattr(hashlib, "pbkdf2_hmac"):
+        digest = hashlib.pbkdf2_hmac(str("sha256"), data, salt.encode("ascii"), iterations)   # Python 2 wants a native str
+    else:
+        digest = salt.encode("ascii")
+        for _ in range(iterations):
+            digest = hashlib.sha256(digest + data).digest()
+    return "%d$%s$%s" % (iterations, salt, binascii.hexlify(digest).decode("ascii"))
+
+
+class Account(object):
+    """A player account as stored in the database (without the saved state, which is loaded separately)"""
+    def __init__(self, name, title, description, gender, race, privileges, money, created, last_login, password):
+        self.name = name
+        self.title = title
+        self.description = description
+        self.gender = gender
+        self.race = race
+        self.privileges = privileges
+        self.money = money
+        self.created = created
+        self.last_login = last_login
+        self.password = password
+
+    def check_password(self, password):
+        iterations, salt, _ = self.password.split("$")
+        return hash_password(password, salt, int(iterations)) == self.password
+
+
+# the attributes of a connected player that are not part of its saved state
+CONNECTION_ATTRIBUTES = ["_input", "_output", "input_is_available", "transcript", "io", "input_log"]
+
+
+class StatePickler(pickle.Pickler):
+    """pickles a player's state, referring to the player itself and to world objects by id"""
+    def __init__(self, stream, player, world):
+        pickle.Pickler.__init__(self, stream, pickle.HIGHEST_PROTOCOL)
+        self.player = player
+        self.world = world
+
+    def persistent_id(self, obj):
+        if obj is self.player:
+            return "player"
+        return self.world.ids.get(id(obj))
+
+
+class StateUnpickler(pickle.Unpickler):
+    def __init__(self, stream, player, world):
+        pickle.Unpickler.__init__(self, stream)
+        self.player = player
+        self.world = world
+
+    def persistent_load(self, pid):
+        if pid == "player":
+            return self.player
+        try:
+            return self.world.objects[pid]
+        except KeyError:
+            raise pickle.UnpicklingError("saved player refers to unknown world object " + pid)
+
+
+class PlayerStore(object):
+    """The player accounts database. Can be used from any thread."""
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.lock = threading.Lock()
+        self.pending = {}   # name -> row of saved player state, to be written in the next commit
+        self.commits = 0
+        with self.lock, self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS account(
+                id integer PRIMARY KEY,
+                name text NOT NULL,
+                title text NOT NULL,
+                description text NOT NULL,
+                gender char(1) NOT NULL,
+                race text NOT NULL,
+                privileges text NOT NULL,
+                money real NOT NULL,
+                created timestamp NOT NULL,
+                last_login timestamp,
+                password text NOT NULL,
+                state blob)""")
+            self.connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS account_name ON account(name)")
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT count(*) FROM account").fetchone()[0]
+
+    def find(self, name):
+        """the account with the given name, or None"""
+        with self.lock:
+            row = self.connection.execute("SELECT name, title, description, gender, race, privileges, money, created, last_login, password"
+                                          " FROM account WHERE name=?", (name,)).fetchone()
+        if row:
+            row = list(row)
+            row[5] = set(row[5].split(",")) - {""}
+            return Account(*row)
+        return None
+
+    def create(self, player, password):
+        """create a new account for the player (right away)"""
+        now = datetime.datetime.now().replace(microsecond=0)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO account(name, title, description, gender, race, privileges, money, created, last_login, password)"
+                                    " VALUES (?,?,?,?,?,?,?,?,?,?)",
+                                    (player.name, player.title, player.description, player.gender, player.race, ",".join(sorted(player.privileges)),
+                                     player.money, now, now, hash_password(password)))
+
+    def save(self, player, world):
+        """
+        Take the player's current state, to be written to the database by the next commit.
+        Without a recorded world, only the basic attributes of the account are saved.
+        """
+        state = None
+        if world:
+            attributes = {name: value for name, value in vars(player).items() if name not in CONNECTION_ATTRIBUTES}
+            stream = io.BytesIO()
+            StatePickler(stream, player, world).dump(attributes)
+            state = sqlite3.Binary(stream.getvalue())
+        row = (player.title, player.description, player.gender, player.race, ",".join(sorted(player.privileges)), player.money, state, player.name)
+        with self.lock:
+            self.pending[player.name] = row
+
+    def commit(self):
+        """write all pending saves in one transaction"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            if pending:
+                with self.connection:
+                    self.connection.executemany("UPDATE account SET title=?, description=?, gender=?, race=?, privileges=?, money=?, state=? WHERE name=?",
+                                                pending.values())
+                self.commits += 1
+
+    def load(self, player, account, world):
+        """
+        Restore the account's saved player (when it logs in) into the player object.
+        Returns the location where the player was, or None if that's unknown.
+        """
+        player.init_names(account.name, account.title, account.description, None)
+        player.init_race(account.race, account.gender)
+        player.privileges = set(account.privileges)
+        player.money = account.money
+        with self.lock:
+            with self.connection:
+                self.connection.execute("UPDATE account SET last_login=? WHERE name=?", (datetime.datetime.now().replace(microsecond=0), account.name))
+            state = self.connection.execute("SELECT state FROM account WHERE name=?", (account.name,)).fetchone()[0]
+        if not state or not world:
+            return None
+        try:
+            attributes = StateUnpickler(io.BytesIO(bytes(state)), player, world).load()
+        except (pickle.PickleError, AttributeError, ImportError, EOFError):
+            return None   # the world has changed too much since the player was saved
+        location = attributes.pop("location", None)
+        if world.ids.get(id(location)) is None:
+            location = None   # not a location of the world (anymore)
+        inventory = attributes.get("_Living__inventory", set())
+        for item in list(inventory):
+            # an object of the world that the player was carrying might be somewhere else in the world by now
+            holder = getattr(item, "contained_in", None)
+            if holder is None or holder is player:
+                continue
+            if isinstance(holder, base.Living):
+                if holder.location is not None:
+                    inventory.discard(item)   # someone else has it now
+                    continue
+            else:
+                holder.remove(item, holder)
+            item.contained_in = player
+        player.__dict__.update(attributes)
+        player.location = base._Limbo
+        return location
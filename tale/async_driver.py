@@ -0,0 +1,428 @@
+"""
+Asyncio based driver core that runs many player sessions in mud mode.
+Requires Python 3.4 or newer (asyncio); on older Pythons the driver falls back
+to its threaded main loop for a single console player.
+
+The event loop owns the session registry, the round-robin queue of sessions
+that have input waiting, and the fixed rate server tick. The actual game code
+(commands, ticks, logins) runs on worker threads while holding the world lock,
+because it is synchronous and may block on a prompt such as util.input_confirm.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from . import mud_context
+from . import errors
+from . import util
+
+
+class WorldLock(object):
+    """
+    Lock that serializes all access to the game world.
+    It remembers the thread that holds it, so a blocking prompt can let go of it temporarily.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.owner = None
+
+    def acquire(self):
+        self._lock.acquire()
+        self.owner = threading.current_thread()
+
+    def release(self):
+        self.owner = None
+        self._lock.release()
+
+    def held(self):
+        """is the lock held by the current thread?"""
+        return self.owner is threading.current_thread()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class InputEvent(threading.Event):
+    """
+    Replaces the player's input_is_available event while it is connected to the async core.
+    Setting it notifies the event loop that the session has input waiting.
+    Waiting on it (from a prompt in the middle of a command) releases the world lock meanwhile,
+    so the rest of the world keeps running while the player is thinking.
+    If the session is closed while waiting, SessionExit is raised.
+    """
+    def __init__(self, core, session):
+        super(InputEvent, self).__init__()
+        self.core = core
+        self.session = session
+
+    def set(self):
+        super(InputEvent, self).set()
+        self.core.notify_input(self.session)
+
+    def wait(self, timeout=None):
+        lock = self.core.world_lock
+        if lock.held():
+            lock.release()
+            try:
+                result = super(InputEvent, self).wait(timeout)
+            finally:
+                lock.acquire()
+        else:
+            result = super(InputEvent, self).wait(timeout)
+        if self.session.closed:
+            raise errors.SessionExit()
+        return result
+
+
+class Session(object):
+    """A connected player. At most one command of a session is in flight at any time."""
+    def __init__(self, player):
+        self.player = player
+        self.logged_in = False
+        self.busy = False
+        self.queued = False
+        self.closed = False
+        self.connected = time.time()
+        self.bucket = None    # set by the command scheduler
+        self.throttled = 0    # number of times a command had to wait for the rate limit
+
+    def __repr__(self):
+        return "<Session for %r>" % self.player
+
+
+class TokenBucket(object):
+    """Rate limiter: allows 'rate' actions per second on average, with bursts of up to 'burst' actions."""
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def take(self, now):
+        """take a token if there is one available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now):
+        """seconds until the next token becomes available"""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class CommandScheduler(object):
+    """
+    Decides which session gets to run its next command.
+    Sessions with input waiting are served round-robin; each session has a token bucket
+    that limits its command rate, and there's a maximum number of commands per server tick
+    for all sessions together. A throttled session keeps its place in the queue.
+    """
+    def __init__(self, rate, burst, per_tick):
+        self.rate = rate
+        self.burst = burst
+        self.per_tick = per_tick     # None means no limit
+        self.budget = per_tick
+        self.ready = collections.deque()   # sessions with pending input, in round-robin order
+        self.dispatched = 0
+        self.throttled = 0           # commands that had to wait for their session's rate limit
+        self.over_budget = 0         # times the tick's command budget ran out
+
+    def enqueue(self, session):
+        if not session.queued:
+            session.queued = True
+            self.ready.append(session)
+
+    def new_tick(self):
+        """start a new server tick, which resets the command budget"""
+        self.budget = self.per_tick
+
+    def next(self, now):
+        """
+        Take the next session that may run a command.
+        Returns (session, None), or (None, delay) where delay is the number of seconds after which
+        a throttled session can continue (None if there's nothing to wait for, or if the tick budget is used up).
+        """
+        if self.budget is not None and self.budget <= 0:
+            if self.ready:
+                self.over_budget += 1
+            return None, None
+        waiting = []
+        delay = None
+        found = None
+        while self.ready:
+            session = self.ready.popleft()
+            if session.closed:
+                session.queued = False
+                continue
+            if session.bucket is None:
+                session.bucket = TokenBucket(self.rate, self.burst, now)
+            if session.bucket.take(now):
+                session.queued = False
+                found = session
+                break
+            session.throttled += 1
+            self.throttled += 1
+            wait = session.bucket.wait_time(now)
+            delay = wait if delay is None else min(delay, wait)
+            waiting.append(session)
+        self.ready.extend(waiting)
+        if found:
+            self.dispatched += 1
+            if self.budget is not None:
+                self.budget -= 1
+            return found, None
+        return None, delay
+
+    def queue_depth(self):
+        """number of sessions waiting, and the total number of input lines they have waiting"""
+        sessions = [s for s in self.ready if not s.closed]
+        return len(sessions), sum(s.player._input.qsize() for s in sessions)
+
+
+class AsyncDriverCore(object):
+    """
+    The mud mode main loop. Player input is dispatched one command per session at a time,
+    by the command scheduler, so a single fast typist can't starve the others.
+    The server tick runs at a fixed rate on the event loop's clock.
+    """
+    max_workers = 8
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.world_lock = WorldLock()
+        self.sessions = {}   # player -> Session
+        config = driver.config
+        per_tick = config.max_commands_per_tick if config.server_tick_method == "timer" else None
+        self.scheduler = CommandScheduler(config.command_rate, config.command_burst, per_tick)
+        self.loop = None
+        self.executor = None
+        self._ticking = False
+        self._retry = None    # timer handle to retry dispatching when a throttled session may continue
+
+    def add_session(self, player):
+        """connect a new player; the login dialog starts as soon as the core is running"""
+        session = Session(player)
+        player.input_is_available = InputEvent(self, session)
+        self.sessions[player] = session
+        self.driver.register_player(player)
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._start_login, session)
+        return session
+
+    def remove_session(self, player):
+        """disconnect the player's session and take the player out of the world (under the world lock)"""
+        session = self.sessions.pop(player, None)
+        if not session:
+            return
+        session.closed = True
+        player.input_is_available.set()   # wake up a prompt that is waiting for input
+        if session.logged_in:
+            self.driver.journal_record("logout", player.name)
+            self.driver.save_player(player)
+        self.driver.unregister_player(player)
+        ctx = util.Context(driver=self.driver)
+        ctx.lock()
+        player.destroy(ctx)
+
+    def disconnect(self, player):
+        """called from any thread when the player's connection has been lost"""
+        session = self.sessions.get(player)
+        if session and self.loop:
+            session.closed = True
+            self.loop.call_soon_threadsafe(self._schedule_remove, player)
+
+    def _schedule_remove(self, player):
+        self.loop.run_in_executor(self.executor, self._locked_remove_session, player)
+
+    def _locked_remove_session(self, player):
+        with self.world_lock:
+            self.remove_session(player)
+
+    def notify_input(self, session):
+        """called from any thread when a line of input was stored for the session"""
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.input_arrived, session)
+
+    def input_arrived(self, session):
+        """(event loop thread) queue the session for processing, unless it's busy or already queued"""
+        if session.closed or session.busy or not session.logged_in:
+            return
+        self.scheduler.enqueue(session)
+        self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            session, delay = self.scheduler.next(self.loop.time())
+            if not session:
+                break
+            session.busy = True
+            future = self.loop.run_in_executor(self.executor, self._run_command, session)
+            future.add_done_callback(lambda f, session=session: self._command_done(session))
+        if delay is not None and self._retry is None:
+            self._retry = self.loop.call_later(delay, self._retry_dispatch)
+
+    def _retry_dispatch(self):
+        self._retry = None
+        self._dispatch()
+
+    def _command_done(self, session):
+        session.busy = False
+        if not session.closed and not session.player._input.empty():
+            self.input_arrived(session)
+
+    def _run_command(self, session):
+        """(worker thread) run one command of the session's player, under the world lock"""
+        player = session.player
+        driver = self.driver
+        with self.world_lock:
+            if session.closed:
+                return
+            mud_context.player = player
+            player.input_log = []   # the command and the answers to its prompts go into the journal
+            cmd = player.get_next_input()
+            try:
+                try:
+                    driver.handle_player_command(player, cmd)
+                finally:
+                    driver.journal_record("command", player.name, player.input_log)
+                    player.input_log = None
+            except errors.SessionExit:
+                if session.closed:
+                    self.remove_session(player)   # connection was lost during a prompt
+                    return
+                player.tell("Goodbye, %s. Please come back again soon." % player.title, end=True)
+                player.write_output()
+                if player is driver.player:
+                    driver.stop_driver()
+                else:
+                    self.remove_session(player)
+                return
+            except errors.StoryCompleted:
+                pass   # in mud mode, the game can't be 'completed' in this way
+            except Exception:
+                txt = "* internal error:\n" + traceback.format_exc()
+                player.tell(txt, format=False)
+            driver.process_notifications()
+            if driver.config.server_tick_method == "command":
+                self._server_tick()
+            player.write_output()
+            player.io.write_input_prompt()
+
+    def _start_login(self, session):
+        # the login dialog can take a long time, so it gets a thread of its own instead of a worker
+        thread = threading.Thread(name="login", target=self._login, args=(session,))
+        thread.daemon = True
+        thread.start()
+
+    def _login(self, session):
+        """(login thread) greet the player and let them create their character"""
+        player = session.player
+        driver = self.driver
+        with self.world_lock:
+            mud_context.player = player
+            player.input_log = []
+            try:
+                driver.print_game_intro(player)
+                driver.create_player(player)
+                driver.show_motd(player)
+                player.look(short=False)
+                driver.journal_record("login", player.name, player.input_log)
+                player.input_log = None
+                player.write_output()
+                player.io.write_input_prompt()
+            except errors.SessionExit:
+                self.remove_session(player)   # connection was lost during the login
+                return
+            except Exception:
+                player.io.critical_error()
+                if player is driver.player:
+                    driver.stop_driver()
+                else:
+                    self.remove_session(player)
+                return
+            session.logged_in = True
+        if not player._input.empty():
+            self.loop.call_soon_threadsafe(self.input_arrived, session)
+
+    def _server_tick(self):
+        before = time.time()
+        self.driver.journal_record("tick")
+        self.driver.server_tick()
+        self.driver.process_notifications()
+        self.driver.journal_tick()
+        self.driver.save_tick()
+        self.driver.server_loop_durations.append(time.time() - before)
+
+    def _tick(self, when):
+        # reschedule first so the tick rate doesn't drift; skip a beat if the previous tick is still running
+        tick_time = self.driver.config.server_tick_time
+        when += tick_time
+        now = self.loop.time()
+        if when < now:
+            when = now + tick_time
+        self.loop.call_at(when, self._tick, when)
+        self.scheduler.new_tick()
+        self._dispatch()
+        if not self._ticking:
+            self._ticking = True
+            future = self.loop.run_in_executor(self.executor, self._locked_server_tick)
+            future.add_done_callback(self._tick_done)
+
+    def _locked_server_tick(self):
+        with self.world_lock:
+            self._server_tick()
+
+    def _tick_done(self, future):
+        self._ticking = False
+        try:
+            future.result()
+        except Exception:
+            # the next tick will run as usual, so report the error instead of stopping the server
+            txt = "* internal error in the server tick:\n" + traceback.format_exc()
+            print(txt, file=sys.stderr)
+            self.loop.run_in_executor(self.executor, self._report_tick_error, txt)
+
+    def _report_tick_error(self, txt):
+        """(worker thread) tell the wizards about the error, their output is written by the next tick"""
+        with self.world_lock:
+            for player in self.driver.all_players():
+                if "wizard" in player.privileges:
+                    player.tell(txt, format=False)
+
+    def run(self):
+        """run the event loop until the driver is stopped (called in the driver thread)"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        for session in list(self.sessions.values()):
+            self.loop.call_soon(self._start_login, session)
+        if self.driver.config.server_tick_method == "timer":
+            self.loop.call_soon(self._tick, self.loop.time())
+        try:
+            self.loop.run_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+
+    def stop(self):
+        """stop the event loop (can be called from any thread)"""
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,78 @@
+"""
+Autosave of the players in mud mode.
+
+The players that change are marked dirty (see base.DirtyTracking). Once every autosave
+interval the autosave takes the dirty players, and saves a few of them on every server tick
+until it has done them all, so that the work is spread out instead of making one tick slow.
+A player is also saved when they log out or lose their connection.
+The players are saved in the player accounts database, which is where they're restored
+from when they log in again, so the autosave requires the player accounts.
+It doesn't use the forked background save of the savegames (Driver.save_in_background):
+the child process can't use the sqlite connection of the player accounts, and saving
+a few small player records per tick is cheap already.
+The saved players refer to the objects of the world by their id in the pristine world;
+the world itself is kept by the checkpoints of the command journal.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import collections
+import time
+from . import base
+from . import player as _player
+
+
+class DirtyPlayers(set):
+    """the players that have changed; the autosave doesn't need the other objects of the world"""
+    def add(self, obj):
+        if isinstance(obj, _player.Player):
+            set.add(self, obj)
+
+
+class Autosave(object):
+    def __init__(self, driver, interval, batch_size):
+        self.driver = driver
+        self.interval = interval
+        self.batch_size = batch_size     # max. number of players saved per server tick
+        self.dirty = DirtyPlayers()
+        self.queue = collections.deque()   # players still to be saved in the current round
+        self.next_round = time.time() + interval
+        self.saved = 0
+        self.rounds = 0
+        base.DirtyTracking.track(self.dirty)
+
+    def stop(self):
+        base.DirtyTracking.untrack(self.dirty)
+
+    def tick(self):
+        """called every server tick"""
+        if not self.queue:
+            if time.time() < self.next_round:
+                return
+            self.start_round()
+        for _ in range(min(self.batch_size, len(self.queue))):
+            player = self.queue.popleft()
+            if self.driver.search_player(player.name) is player:    # skip players that have left in the meantime
+                self.save_player(player)
+
+    def start_round(self):
+        dirty = list(self.dirty)
+        self.dirty.clear()
+        online = set(self.driver.all_players())
+        self.queue.extend(player for player in dirty if player in online and self.logged_in(player))
+        self.next_round = time.time() + self.interval
+        self.rounds += 1
+
+    @staticmethod
+    def logged_in(player):
+        return player.location is not None and player.location is not base._Limbo
+
+    def save_player(self, player):
+        """save the player's state in the player accounts (at their next commit)"""
+        if not self.logged_in(player):
+            return
+        self.dirty.discard(player)
+        self.driver.player_store.save(player, self.driver.pristine_world)
+        self.saved += 1
@@ -6,6 +6,8 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 """
 
 from __future__ import absolute_import, print_function, division, unicode_literals
+import copy
+import numbers
 from textwrap import dedent
 from . import lang
 from . import util
@@ -14,6 +16,11 @@ from . import mud_context
 from .errors import ActionRefused
 from .races import races
 
+try:
+    from collections.abc import Set
+except ImportError:
+    from collections import Set
+
 """
 object hierarchy:
 
@@ -39,14 +46,303 @@ MudObject
         +-- Door
 
 
-Every object that can hold other objects does so in its "inventory" (a set).
-You can't access it directly, object.inventory returns a frozenset copy of it.
+Every object that can hold other objects does so in its "inventory" (a set, with a name index).
+You can't access it directly, object.inventory returns a read-only view on it.
 Except Location: it separates the items and livings it contains internally.
 Use its enter/leave methods instead.
 """
 
 
-class MudObject(object):
+class DirtyTracking(object):
+    """
+    Mixin that remembers which objects have changed, so that only those have to be saved.
+    Setting an attribute marks the object as dirty; methods that change the contents of
+    an object in place (such as insert and remove) have to call mark_dirty themselves.
+    Every consumer of the changes (such as the autosave) registers its own set with track,
+    and takes the dirty objects out of it whenever it wants. A consumer that only wants some
+    of the objects registers something else with an add method, that leaves out the others.
+    Setting attributes only goes through the tracking while there is a consumer.
+    """
+    dirty_sets = []
+
+    @staticmethod
+    def track(dirty):
+        """start adding the objects that change to the given set"""
+        DirtyTracking.dirty_sets.append(dirty)
+        DirtyTracking.__setattr__ = DirtyTracking._tracking_setattr
+
+    @staticmethod
+    def untrack(dirty):
+        DirtyTracking.dirty_sets.remove(dirty)
+        if not DirtyTracking.dirty_sets and "__setattr__" in vars(DirtyTracking):
+            del DirtyTracking.__setattr__
+
+    def _tracking_setattr(self, name, value):
+        object.__setattr__(self, name, value)
+        for dirty in DirtyTracking.dirty_sets:
+            dirty.add(self)
+
+    def mark_dirty(self):
+        for dirty in DirtyTracking.dirty_sets:
+            dirty.add(self)
+
+
+class TextTable(object):
+    """
+    The texts of the world (titles and descriptions), each of them stored just once: objects
+    with the same text share a single string, that is found in the table by the text itself.
+    Texts are added while the world is being built from the sources. After that the table is
+    sealed, so it doesn't grow with the texts that are made while the game runs.
+    A pickle contains a shared text only once (the pickler's memo takes care of that), and
+    the objects that are unpickled share their texts with the table again.
+    """
+    min_length = 32   # shorter texts aren't worth it
+
+    def __init__(self):
+        self.texts = {}   # text -> the shared copy of it
+        self.sealed = False
+
+    def share(self, text):
+        """returns the shared copy of the text, which is added to the table if it isn't sealed yet"""
+        if not text or len(text) < self.min_length:
+            return text
+        shared = self.texts.get(text)
+        if shared is not None:
+            return shared
+        if not self.sealed:
+            self.texts[text] = text
+        return text
+
+    def seal(self):
+        self.sealed = True
+
+
+static_texts = TextTable()
+
+
+prototypes = {}   # name -> registered prototype object
+
+
+def spawn(name):
+    """create a new object from the prototype that was registered with the given name"""
+    return prototypes[name].spawn()
+
+
+def _spawn_value(value):
+    """the value for an attribute of a spawned object: immutable values and references to mud objects are shared"""
+    if isinstance(value, (list, set, dict)):
+        return type(value)(value)
+    if value is None or isinstance(value, (util.basestring_type, bytes, numbers.Number, tuple, frozenset, MudObject)):
+        return value
+    return copy.copy(value)
+
+
+class NameIndex(object):
+    """
+    Multi-map of mud objects by their name, aliases and lowercased title.
+    The titles of objects whose title is a property are only known when they're looked up.
+    """
+    def __init__(self, objects=()):
+        self.names = {}      # name -> set of objects
+        self.aliases = {}    # alias -> set of objects
+        self.titles = {}     # lowercased title -> set of objects
+        self.dynamic_titles = set()
+        for obj in objects:
+            self.add(obj)
+
+    def add(self, obj):
+        self.names.setdefault(obj.name, set()).add(obj)
+        for alias in obj.aliases:
+            self.aliases.setdefault(alias, set()).add(obj)
+        if isinstance(getattr(type(obj), "title", None), property):
+            self.dynamic_titles.add(obj)
+        else:
+            self.titles.setdefault(obj.title.lower(), set()).add(obj)
+
+    def discard(self, obj):
+        self._discard(self.names, obj.name, obj)
+        for alias in obj.aliases:
+            self._discard(self.aliases, alias, obj)
+        if obj in self.dynamic_titles:
+            self.dynamic_titles.remove(obj)
+        else:
+            self._discard(self.titles, obj.title.lower(), obj)
+
+    @staticmethod
+    def _discard(mapping, key, obj):
+        objects = mapping.get(key)
+        if objects:
+            objects.discard(obj)
+            if not objects:
+                del mapping[key]
+
+    def find(self, name, titles=True):
+        """the objects with the (lowercase) name, or if there are none, those with the name as alias (or title)"""
+        found = self.names.get(name)
+        if found:
+            return found
+        # aliases that were changed in place aren't known to the index, at least skip the ones that are gone
+        found = [obj for obj in self.aliases.get(name, ()) if name in obj.aliases]
+        if titles:
+            found.extend(self.titles.get(name, ()))
+            found.extend(obj for obj in self.dynamic_titles if obj.title.lower() == name)
+        return found
+
+
+class IndexedSet(set):
+    """
+    The set of objects in a container, with a name index of them that is built when it's first
+    needed and then kept up to date by add and remove. Other changes of the set discard the index,
+    and so does a change of the name, title or aliases of one of the objects (when they're assigned;
+    changing the set of aliases in place isn't noticed). The index isn't pickled or copied.
+    """
+    __slots__ = ["_index", "_generation"]
+
+    def __init__(self, objects=()):
+        super(IndexedSet, self).__init__(objects)
+        self._index = None
+        self._generation = None   # [snapshot, number of iterations] while it's being iterated over by iterate()
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def name_index(self):
+        if self._index is None:
+            self._index = NameIndex(self)
+        return self._index
+
+    def invalidate(self):
+        self._index = None
+
+    def iterate(self):
+        """iterate over the objects; if the set is changed meanwhile, the iteration continues over a snapshot of it"""
+        generation = self._generation
+        if generation is None:
+            generation = self._generation = [None, 0]
+        generation[1] += 1
+        try:
+            count = 0
+            for obj in set.__iter__(self):
+                count += 1
+                yield obj
+                if generation[0] is not None:
+                    break
+            else:
+                return
+            # the set was changed, it was unchanged up until then so the snapshot is in the same order
+            for obj in generation[0][count:]:
+                yield obj
+        finally:
+            generation[1] -= 1
+
+    def _changing(self):
+        generation = self._generation
+        if generation is not None and generation[1]:
+            generation[0] = tuple(self)   # for the iterations that are in progress
+            self._generation = None
+
+    def add(self, obj):
+        if obj not in self:
+            self._changing()
+            set.add(self, obj)
+            if self._index is not None:
+                self._index.add(obj)
+
+    def remove(self, obj):
+        self._changing()
+        set.remove(self, obj)
+        if self._index is not None:
+            self._index.discard(obj)
+
+    def discard(self, obj):
+        if obj in self:
+            self.remove(obj)
+
+
+def _invalidating(method):
+    def invalidating_method(self, *args):
+        self._changing()
+        self._index = None
+        return method(self, *args)
+    invalidating_method.__name__ = method.__name__
+    return invalidating_method
+
+
+for _name in ["clear", "pop", "update", "difference_update", "intersection_update", "symmetric_difference_update",
+              "__ior__", "__iand__", "__isub__", "__ixor__"]:
+    setattr(IndexedSet, _name, _invalidating(getattr(set, _name)))
+
+
+class InventoryView(Set):
+    """
+    Live read-only view on the inventory of a living or container: in, len and iteration without copying it.
+    If the inventory is changed while the view is being iterated over, the iteration continues over a
+    snapshot of the inventory as it was. Set operations such as & and - return a frozenset.
+    """
+    __slots__ = ["_objects"]
+
+    def __init__(self, objects):
+        self._objects = objects
+
+    def __contains__(self, obj):
+        return obj in self._objects
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __iter__(self):
+        if isinstance(self._objects, IndexedSet):
+            return self._objects.iterate()
+        return iter(tuple(self._objects))
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return frozenset(iterable)
+
+    def __reduce__(self):
+        return frozenset, (list(self._objects),)
+
+    def __repr__(self):
+        return "<InventoryView %s>" % ", ".join(sorted(repr(obj) for obj in self._objects))
+
+    def name_index(self):
+        if isinstance(self._objects, IndexedSet):
+            return self._objects.name_index()
+        return NameIndex(self._objects)
+
+
+def search_by_name(objects, name, titles=True):
+    """
+    The first of the objects with the (lowercase) name, or if there's none, with the name as alias (or title).
+    The name index of an IndexedSet (or inventory view) makes this cost the same for any number of objects.
+    """
+    if isinstance(objects, (IndexedSet, InventoryView)):
+        found = objects.name_index().find(name, titles)
+    else:
+        found = [obj for obj in objects if obj.name == name]
+        if not found:
+            found = [obj for obj in objects if name in obj.aliases or titles and obj.title.lower() == name]
+    for obj in found:
+        return obj
+    return None
+
+
+class _NameAttribute(object):
+    """
+    An attribute that the name indexes use. It only has a setter: reading it is the usual
+    lookup in the instance dict, only assigning it goes through here, to tell the container.
+    """
+    __slots__ = ["attribute"]
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.attribute] = value
+        obj._renamed()
+
+
+class MudObject(DirtyTracking):
     """
     Root class of all objects in the mud world
     All objects have an identifying short name (will be lowercased),
@@ -60,6 +356,14 @@ class MudObject(object):
     possessive = "its"
     objective = "it"
     gender = "n"
+    heartbeat_interval = 1   # set by the @heartbeat decorator
+    heartbeat_phase = None
+    text_attributes = ["title", "description", "short_description", "_title", "_description", "_short_description"]
+    spawnable = True   # can serve as a prototype for new objects (util.clone falls back to a deep copy otherwise)
+    name = _NameAttribute("name")
+    title = _NameAttribute("title")
+    aliases = _NameAttribute("aliases")
+    __slots__ = ["_wiretap"]   # the pubsub topic handle, see get_wiretap
 
     def __init__(self, name, title=None, description=None, short_description=None):
         self.init_names(name, title, description, short_description)
@@ -80,28 +384,98 @@ class MudObject(object):
     def init_names(self, name, title, description, short_description):
         """(re)set the name and description attributes"""
         self.name = name.lower()
+        if hasattr(self, "_wiretap"):
+            object.__delattr__(self, "_wiretap")   # the wiretap topic is named after the object
         if title:
             assert not title.startswith("the ") and not title.startswith("The "), "title must not start with 'the'"
+        title = static_texts.share(title or name)
         try:
-            self.title = title or name
+            self.title = title
         except AttributeError:
             # this can occur if a subclass made title into a property
-            self._title = title or name
-        descr = dedent(description).strip() if description else ""
+            self._title = title
+        descr = static_texts.share(dedent(description).strip() if description else "")
         try:
             self.description = descr
         except AttributeError:
             # this can occur if a subclass made description into a property
             self._description = descr
+        short_description = static_texts.share(short_description)
         try:
             self.short_description = short_description
         except AttributeError:
             # this can occur if a subclass made short_description into a property
             self._short_description = short_description
 
+    def __getstate__(self):
+        return dict(self.__dict__)
+
+    def __setstate__(self, state):
+        """the texts share the string in the static text table again, rather than being a copy of it"""
+        for name in self.text_attributes:
+            if name in state:
+                state[name] = static_texts.share(state[name])
+        self.__dict__ = state
+
+    def _renamed(self):
+        """the name, title or aliases have been assigned, so the name index of the container that holds this no longer matches"""
+        container = self.__dict__.get("contained_in") or self.__dict__.get("location")
+        if isinstance(container, MudObject):
+            container._contents_renamed(self)
+
+    def _contents_renamed(self, obj):
+        """the name, title or aliases of an object in this one have been changed"""
+        pass
+
+    def _wiretap_topic(self, kind):
+        """
+        Looks up the pubsub topic for wiretaps on this object, and keeps the handle for the next time.
+        It's kept in a slot, so it isn't part of the state of the object (pickling, spawning, dirty tracking).
+        init_names forgets it, because the topic is named after the object.
+        """
+        tap = pubsub.topic((kind, self.name))
+        object.__setattr__(self, "_wiretap", tap)
+        return tap
+
     def __repr__(self):
         return "<%s '%s' @ 0x%x>" % (self.__class__.__name__, self.name, id(self))
 
+    def register_prototype(self, name=None):
+        """register this object as the prototype to spawn new objects from, by name (default: its own name)"""
+        prototypes[name or self.name] = self
+        return self
+
+    def spawn(self):
+        """
+        Create a new object with this one as its prototype. It shares the immutable attributes
+        (and references to other mud objects) with the prototype, and gets a shallow copy of
+        the mutable ones. Then the new object's spawned_from hooks take care of the rest.
+        Note that neither __init__ nor init is called for the new object, init_spawned is instead.
+        """
+        if not self.spawnable:
+            raise TypeError("can't spawn from " + repr(self))
+        obj = object.__new__(type(self))
+        obj.__dict__.update((name, _spawn_value(value)) for name, value in self.__dict__.items())
+        obj.spawned_from(self)
+        obj.init_spawned()
+        return obj
+
+    def spawned_from(self, prototype):
+        """
+        Called on a new object that was just spawned from the prototype. Override this (and call super)
+        to copy mutable state that is nested deeper, or to reset things that shouldn't be copied.
+        """
+        if getattr(self, "_register_heartbeat", False):
+            self.register_heartbeat()
+
+    def init_spawned(self):
+        """
+        Secondary initialization of a spawned object, the counterpart of init (which isn't run again).
+        Override this to start what init started that isn't part of the object's state, such as
+        its deferreds. (The heartbeat of a @heartbeat class is registered already by spawned_from.)
+        """
+        pass
+
     def destroy(self, ctx):
         """Common cleanup code that needs to be called when the object is destroyed"""
         assert isinstance(ctx, util.Context)
@@ -132,6 +506,14 @@ class MudObject(object):
         # not automatically called, only if your object registered with the driver
         pass
 
+    def heartbeat_fastforward(self, ctx, ticks):
+        """
+        Called instead of the separate heartbeats when the driver skips over a number of ticks
+        at once (for instance while the player waits). By default they're compressed into a
+        single heartbeat. Override this if your object needs to simulate every tick.
+        """
+        self.heartbeat(ctx)
+
     def activate(self, actor):
         # called from the activate command, override if your object needs to act on this.
         raise ActionRefused("You can't activate that.")
@@ -181,6 +563,10 @@ class Item(MudObject):
     def __contains__(self, item):
         raise ActionRefused("You can't look inside of that.")
 
+    def spawned_from(self, prototype):
+        super(Item, self).spawned_from(prototype)
+        self.contained_in = None
+
     @property
     def location(self):
         if not self.contained_in:
@@ -301,19 +687,20 @@ class Location(MudObject):
     def __init__(self, name, description=None):
         super(Location, self).__init__(name, description=description)
         self.name = name      # make sure we preserve the case; base object stores it lowercase
-        self.livings = set()  # set of livings in this location
-        self.items = set()    # set of all items in the room
+        self.livings = IndexedSet()  # set of livings in this location
+        self.items = IndexedSet()    # set of all items in the room
         self.exits = {}       # dictionary of all exits: exit_direction -> Exit object with target & descr
 
     def __contains__(self, obj):
         return obj in self.livings or obj in self.items
 
-    def __getstate__(self):
-        state = dict(self.__dict__)
-        return state
-
-    def __setstate__(self, state):
-        self.__dict__ = state
+    def spawned_from(self, prototype):
+        # a spawned location starts out empty, without exits
+        super(Location, self).spawned_from(prototype)
+        self.livings = IndexedSet()
+        self.items = IndexedSet()
+        self.exits = {}
+        self.verbs = {}
 
     def init_inventory(self, objects):
         """Set the location's initial item and livings 'inventory'"""
@@ -337,10 +724,14 @@ class Location(MudObject):
             exit.bind(self)
             # note: we're not simply adding it to the .exits dict here, because
             # the exit may have aliases defined that it wants to be known as also.
+        self.mark_dirty()
 
     def get_wiretap(self):
         """get a wiretap for this location"""
-        return pubsub.topic(("wiretap-location", self.name))
+        try:
+            return self._wiretap
+        except AttributeError:
+            return self._wiretap_topic("wiretap-location")
 
     def tell(self, room_msg, exclude_living=None, specific_targets=None, specific_target_msg=""):
         """
@@ -362,7 +753,8 @@ class Location(MudObject):
                 living.tell(room_msg)
         if room_msg:
             tap = self.get_wiretap()
-            tap.send((self.name, room_msg))
+            if tap.subscribers:
+                tap.send((self.name, room_msg))
 
     def look(self, exclude_living=None, short=False):
         """returns a list of paragraph strings describing the surroundings, possibly excluding one living from the description list"""
@@ -422,12 +814,12 @@ class Location(MudObject):
         Search for a living in this location by its name (and title, if no names match).
         Is alias-aware. If there's more than one match, returns the first.
         """
-        name = name.lower()
-        result = [living for living in self.livings if living.name == name]
-        if not result:
-            # try titles and aliases
-            result = [living for living in self.livings if name in living.aliases or living.title.lower() == name]
-        return result[0] if result else None
+        return search_by_name(self.livings, name.lower())
+
+    def _contents_renamed(self, obj):
+        for objects in (self.livings, self.items):
+            if isinstance(objects, IndexedSet) and obj in objects:
+                objects.invalidate()
 
     def insert(self, obj, actor):
         """Add obj to the contents of the location (either a Living or an Item)"""
@@ -439,6 +831,7 @@ class Location(MudObject):
             raise TypeError("can only add Living or Item")
         obj.location = self
         self.verbs.update(obj.verbs)    # register custom verbs
+        self.mark_dirty()
 
     def remove(self, obj, actor):
         """Remove obj from this location (either a Living or an Item)"""
@@ -451,6 +844,7 @@ class Location(MudObject):
         obj.location = None
         for verb in obj.verbs:
             self.verbs.pop(verb, None)     # unregister custom verbs
+        self.mark_dirty()
 
     def handle_verb(self, parsed, actor):
         """Handle a custom verb. Return True if handled, False if not handled."""
@@ -602,7 +996,7 @@ class Living(MudObject):
         self.stats = {}
         for stat_name, (stat_avg, stat_class) in races[race]["stats"].items():
             self.stats[stat_name] = stat_avg
-        self.__inventory = set()
+        self.__inventory = IndexedSet()
         super(Living, self).__init__(name, title, description, short_description)
 
     def init_race(self, race, gender):
@@ -619,23 +1013,31 @@ class Living(MudObject):
         for item in items:
             self.insert(item, self)
 
-    def __getstate__(self):
-        state = dict(self.__dict__)
-        return state
-
-    def __setstate__(self, state):
-        self.__dict__ = state
+    def spawned_from(self, prototype):
+        # a spawned living isn't anywhere yet, and carries new items spawned from the prototype's
+        super(Living, self).spawned_from(prototype)
+        self.location = None
+        self.__inventory = IndexedSet()
+        for item in prototype.__inventory:
+            item = item.spawn()
+            self.__inventory.add(item)
+            item.contained_in = self
+        _Limbo.insert(self, None)
 
     def __contains__(self, item):
         return item in self.__inventory
 
+    def _contents_renamed(self, obj):
+        if isinstance(self.__inventory, IndexedSet):
+            self.__inventory.invalidate()
+
     @property
     def inventory_size(self):
         return len(self.__inventory)
 
     @property
     def inventory(self):
-        return frozenset(self.__inventory)
+        return InventoryView(self.__inventory)
 
     def insert(self, item, actor):
         """Add an item to the inventory."""
@@ -644,6 +1046,8 @@ class Living(MudObject):
             self.__inventory.add(item)
             item.contained_in = self
             self.location.verbs.update(item.verbs)   # register custom verbs
+            self.mark_dirty()
+            self.location.mark_dirty()
         else:
             raise ActionRefused("You can't do that.")
 
@@ -654,6 +1058,8 @@ class Living(MudObject):
             item.contained_in = None
             for verb in item.verbs:
                 self.location.verbs.pop(verb, None)     # unregister custom verbs
+            self.mark_dirty()
+            self.location.mark_dirty()
         else:
             raise ActionRefused("You can't take %s from %s." % (item.title, self.title))
 
@@ -673,6 +1079,8 @@ class Living(MudObject):
         clone = util.clone(self)
         actor.tell("Cloned into: " + repr(clone))
         actor.tell_others("{Title} summons %s." % lang.a(clone.title))
+        if clone.location:
+            clone.location.remove(clone, actor)   # a spawned living starts out in Limbo
         actor.location.insert(clone, actor)
         return clone
 
@@ -698,7 +1106,10 @@ class Living(MudObject):
 
     def get_wiretap(self):
         """get a wiretap for this living"""
-        return pubsub.topic(("wiretap-living", self.name))
+        try:
+            return self._wiretap
+        except AttributeError:
+            return self._wiretap_topic("wiretap-living")
 
     def tell(self, *messages, **kwargs):
         """
@@ -710,8 +1121,9 @@ class Living(MudObject):
         kwargs is ignored for Livings.
         """
         tap = self.get_wiretap()
-        for msg in messages:
-            tap.send((self.name, msg))
+        if tap.subscribers:
+            for msg in messages:
+                tap.send((self.name, msg))
 
     def tell_others(self, *messages):
         """
@@ -785,20 +1197,14 @@ class Living(MudObject):
         if not name:
             raise ValueError("name must be given")
         name = name.lower()
-        matches = containing_object = None
+        match = containing_object = None
         if include_inventory:
             containing_object = self
-            matches = [item for item in self.__inventory if item.name == name]
-            if not matches:
-                # try the aliases or titles
-                matches = [item for item in self.__inventory if name in item.aliases or item.title.lower() == name]
-        if not matches and include_location:
+            match = search_by_name(self.__inventory, name)
+        if not match and include_location:
             containing_object = self.location
-            matches = [item for item in self.location.items if item.name == name]
-            if not matches:
-                # try the aliases or titles
-                matches = [item for item in self.location.items if name in item.aliases or item.title.lower() == name]
-        if not matches and include_containers_in_inventory:
+            match = search_by_name(self.location.items, name)
+        if not match and include_containers_in_inventory:
             # check if an item in the inventory might contain it
             for container in self.__inventory:
                 containing_object = container
@@ -807,13 +1213,10 @@ class Living(MudObject):
                 except ActionRefused:
                     continue    # no access to inventory, just skip this item silently
                 else:
-                    matches = [item for item in inventory if item.name == name]
-                    if not matches:
-                        # try the aliases or titles
-                        matches = [item for item in inventory if name in item.aliases or item.title.lower() == name]
-                    if matches:
+                    match = search_by_name(inventory, name)
+                    if match:
                         break
-        return (matches[0], containing_object) if matches else (None, None)
+        return (match, containing_object) if match else (None, None)
 
     def start_attack(self, living):
         """Starts attacking the given living until death ensues on either side."""
@@ -861,18 +1264,24 @@ class Container(Item):
     """
     def init(self):
         super(Container, self).init()
-        self.__inventory = set()
+        self.__inventory = IndexedSet()
 
     def init_inventory(self, items):
         """Set the container's initial inventory"""
         assert len(self.__inventory) == 0
-        self.__inventory = set(items)
+        self.__inventory = IndexedSet(items)
         for item in items:
             item.contained_in = self
 
+    def spawned_from(self, prototype):
+        # a spawned container contains new items spawned from the prototype's
+        super(Container, self).spawned_from(prototype)
+        self.__inventory = IndexedSet()
+        self.init_inventory([item.spawn() for item in prototype.__inventory])
+
     @property
     def inventory(self):
-        return frozenset(self.__inventory)
+        return InventoryView(self.__inventory)
 
     @property
     def inventory_size(self):
@@ -881,6 +1290,10 @@ class Container(Item):
     def __contains__(self, item):
         return item in self.__inventory
 
+    def _contents_renamed(self, obj):
+        if isinstance(self.__inventory, IndexedSet):
+            self.__inventory.invalidate()
+
     def destroy(self, ctx):
         super(Container, self).destroy(ctx)
         for item in self.__inventory:
@@ -891,11 +1304,13 @@ class Container(Item):
         assert isinstance(item, MudObject)
         self.__inventory.add(item)
         item.contained_in = self
+        self.mark_dirty()
         return self
 
     def remove(self, item, actor):
         self.__inventory.remove(item)
         item.contained_in = None
+        self.mark_dirty()
         return self
 
 
@@ -1005,12 +1420,21 @@ class Door(Exit):
         return None
 
 
-def heartbeat(klass):
+def heartbeat(klass=None, interval=1, phase=None):
     """
     Decorator to use on a class to make it have a heartbeat.
     Use sparingly as it is less efficient than using a deferred, because the driver
-    has to call all heartbeats every tick even though they do nothing yet.
+    has to call the heartbeats even though they do nothing yet.
     With deferreds, the driver only calls a deferred at the time it is needed.
+    Use @heartbeat(interval=n) to only get a heartbeat once every n ticks.
+    The driver spreads those objects evenly over the ticks, unless you choose a
+    phase (0..n-1) yourself.
     """
-    klass._register_heartbeat = True
-    return klass
+    def make_heartbeat(klass):
+        klass._register_heartbeat = True
+        klass.heartbeat_interval = interval
+        klass.heartbeat_phase = phase
+        return klass
+    if klass is None:
+        return make_heartbeat
+    return make_heartbeat(klass)
@@ -9,6 +9,11 @@ from __future__ import absolute_import, print_function, division, unicode_litera
 from . import races
 from . import lang
 from . import util
+from . import errors
+from . import mud_context
+
+
+MAX_PASSWORD_TRIES = 3
 
 
 class PlayerNaming(object):
@@ -16,6 +21,8 @@ class PlayerNaming(object):
         self.wizard = False
         self.name = self.title = self.gender = self.race = self.description = None
         self.money = 0.0
+        self.account = None    # the existing account that the player logged in to
+        self.password = None   # the password for the new account
 
     def apply_to(self, player):
         player.init_race(self.race, self.gender)
@@ -28,10 +35,13 @@ class PlayerNaming(object):
 
 
 class CharacterBuilder(object):
-    def __init__(self, player):
+    def __init__(self, player, accounts=None):
         self.player = player
+        self.accounts = accounts   # the player account store (in mud mode)
 
     def build(self):
+        if self.accounts:
+            return self.login_or_create()
         choice = util.input_choice("Create default (<bright>w</>)izard, default (<bright>p</>)layer, (<bright>c</>)ustom player?", ["w", "p", "c"], self.player)
         if choice == "w":
             return self.create_default_wizard()
@@ -40,16 +50,58 @@ class CharacterBuilder(object):
         elif choice == "c":
             return self.create_player_from_info()
 
-    def create_player_from_info(self):
-        naming = PlayerNaming()
+    def login_or_create(self):
+        """log in to an existing account, or create a new one"""
         while True:
-            naming.name = self.player.input("Name? ")
-            if naming.name:
+            name = self.player.input("Name? ").lower()
+            if not name:
+                continue
+            if not name.isalpha() or len(name) > 20:
+                self.player.tell("A name can only consist of letters, and can't be longer than 20 letters.", end=True)
+                continue
+            if mud_context.driver.search_player(name):
+                self.player.tell("Someone with that name is already playing.", end=True)
+                continue
+            account = self.accounts.find(name)
+            if account:
+                for _ in range(MAX_PASSWORD_TRIES):
+                    if account.check_password(self.input_password("Password? ")):
+                        naming = PlayerNaming()
+                        naming.account = account
+                        return naming
+                    self.player.tell("That's not the right password.", end=True)
+                raise errors.SessionExit()
+            if util.input_confirm("There's nobody called %s yet. Create a new character y/n? " % lang.capital(name), self.player):
                 break
+        # the very first player becomes the wizard
+        naming = self.create_player_from_info(name, wizard=self.accounts.count() == 0)
+        while True:
+            password = self.input_password("Choose a password? ")
+            if len(password) < 4:
+                self.player.tell("That password is too short.", end=True)
+            elif self.input_password("Type the password again? ") != password:
+                self.player.tell("The passwords are not the same.", end=True)
+            else:
+                naming.password = password
+                return naming
+
+    def input_password(self, prompt):
+        password = self.player.input(prompt)
+        if self.player.input_log:
+            self.player.input_log[-1] = "*"   # don't put the password in the command journal
+        return password
+
+    def create_player_from_info(self, name=None, wizard=None):
+        naming = PlayerNaming()
+        naming.name = name
+        while not naming.name:
+            naming.name = self.player.input("Name? ")
         naming.gender = util.input_choice("Gender {choices}? ", ["m", "f", "n"], self.player)
         self.player.tell("Player races: " + ", ".join(races.player_races))
         naming.race = util.input_choice("Race? ", races.player_races, self.player)
-        naming.wizard = util.input_confirm("Wizard y/n? ", self.player)
+        if wizard is None:
+            wizard = util.input_confirm("Wizard y/n? ", self.player)
+        naming.wizard = wizard
         naming.description = "A regular person."
         if naming.wizard:
             naming.title = "arch wizard " + lang.capital(naming.name)
@@ -108,9 +108,11 @@ def do_locate(player, parsed, ctx):
                 p("<dim>(By %s you probably mean %s.)</>" % (name, item.name))
             util.print_object_location(player, item, container, False)
         else:
-            otherplayer = ctx.driver.search_player(name)  # global player search
-            if otherplayer:
+            otherplayer = ctx.driver.search_player(name, offline=True)  # global player search
+            if isinstance(otherplayer, base.Living):
                 player.tell("<player>%s</> is playing, %s is currently in '<location>%s</>'." % (lang.capital(otherplayer.title), otherplayer.subjective, otherplayer.location.name))
+            elif otherplayer:
+                player.tell("<player>%s</> isn't playing right now." % lang.capital(otherplayer.title))
             else:
                 p("You can't find that.")
 
@@ -545,7 +547,7 @@ def do_help(player, parsed, ctx):
     if parsed.args:
         do_what(player, parsed, ctx)
     else:
-        all_verbs = ctx.driver.get_current_verbs()
+        all_verbs = ctx.driver.get_current_verbs(player)
         verb_help = {}   # verb -> [list of abbrs]
         aliases = frozenset(itertools.chain(*cmds_aliases.values()))
         for verb in all_verbs:
@@ -710,11 +712,13 @@ def do_tell(player, parsed, ctx):
     name = parsed.args[0]
     living = player.location.search_living(name)
     if not living:
-        living = ctx.driver.search_player(name)   # is there a player around with this name?
+        living = ctx.driver.search_player(name, offline=True)   # is there a player around with this name?
         if not living:
             if name == "all":
                 raise ActionRefused("You can't tell something to everyone, only to individuals.")
             raise ActionRefused("%s isn't here." % name)
+        if not isinstance(living, base.Living):
+            raise ActionRefused("%s isn't playing right now." % lang.capital(living.title))
     if living is player:
         player.tell("You're talking to yourself...")
     else:
@@ -867,10 +871,16 @@ def do_who(player, parsed, ctx):
         remove_is_are_args(parsed.args)
         name = parsed.args[0].rstrip("?")
         found = False
-        otherplayer = ctx.driver.search_player(name)  # global player search
-        if otherplayer:
+        otherplayer = ctx.driver.search_player(name, offline=True)  # global player search
+        if isinstance(otherplayer, base.Living):
             found = True
             player.tell("<player>%s</> is playing, %s is currently in '<location>%s</>'." % (lang.capital(otherplayer.title), otherplayer.subjective, otherplayer.location.name))
+        elif otherplayer:
+            found = True
+            if otherplayer.last_login:
+                player.tell("<player>%s</> isn't playing right now, %s was last seen on %s." % (lang.capital(otherplayer.title), lang.SUBJECTIVE[otherplayer.gender], otherplayer.last_login))
+            else:
+                player.tell("<player>%s</> isn't playing right now." % lang.capital(otherplayer.title))
         try:
             do_examine(player, parsed, ctx)
         except ActionRefused:
@@ -880,8 +890,8 @@ def do_who(player, parsed, ctx):
     else:
         # print all players
         player.tell("All players currently in the game:", end=True)
-        for player in ctx.driver.all_players():  # list of all players
-            player.tell("<player>%s</> (%s): currently in '<location>%s</>'." % (lang.capital(player.name), player.title, player.location.name), end=True)
+        for other in ctx.driver.all_players():  # list of all players
+            player.tell("<player>%s</> (%s): currently in '<location>%s</>'." % (lang.capital(other.name), other.title, other.location.name), end=True)
 
 
 @cmd("open", "close", "lock", "unlock")
@@ -932,7 +942,7 @@ def do_what(player, parsed, ctx):
         name = abbreviations[name]
         p("It's an abbreviation for %s." % name)
     # is it a command?
-    all_verbs = ctx.driver.get_current_verbs()
+    all_verbs = ctx.driver.get_current_verbs(player)
     if name in all_verbs:
         found = True
         doc = all_verbs[name].strip()
@@ -16,7 +16,7 @@ import platform
 import threading
 from .decorators import disabled_in_gamemode
 from ..errors import SecurityViolation, ParseError, ActionRefused
-from .. import base, lang, util
+from .. import base, lang, util, pubsub
 from ..player import Player
 from .. import __version__
 
@@ -435,11 +435,32 @@ def do_server(player, parsed, ctx):
         gc_objects = str(len(gc.get_objects()))
     txt.append("Number of GC objects: %s   Number of threads: %s" % (gc_objects, threading.active_count()))
     txt.append("Mode: %s   Players: %d   Heartbeats: %d   Deferreds: %d" % (config.server_mode, len(ctx.driver.all_players()), len(driver.heartbeat_objects), len(driver.deferreds)))
+    txt.append("Pubsub topics: %d   Subscribers: %d" % (len(pubsub.all_topics), len(pubsub.subscriptions)))
+    if pubsub.dispatcher:
+        dispatcher = pubsub.dispatcher
+        txt.append("Pubsub events waiting: %d   Delivered: %d   Dropped: %d   Coalesced: %d   (%s, buffer %d, batch %d)"
+                   % (dispatcher.waiting(), dispatcher.delivered, dispatcher.dropped, dispatcher.coalesced,
+                      dispatcher.policy, dispatcher.buffer_size, dispatcher.batch_size))
     if config.server_tick_method == "timer":
         avg_loop_duration = sum(driver.server_loop_durations) / len(driver.server_loop_durations)
         txt.append("Server loop tick: %.1f sec   Loop duration: %.2f sec." % (config.server_tick_time, avg_loop_duration))
     elif config.server_tick_method == "command":
         txt.append("Server loop tick: %.1f sec   (command driven)." % config.server_tick_time)
+    if driver.core:
+        scheduler = driver.core.scheduler
+        sessions, lines = scheduler.queue_depth()
+        txt.append("Command queue: %d sessions, %d lines   Dispatched: %d" % (sessions, lines, scheduler.dispatched))
+        txt.append("Throttled: %d (rate %.1f/sec, burst %d)   Tick budget exceeded: %d" % (scheduler.throttled, scheduler.rate, scheduler.burst, scheduler.over_budget))
+    if driver.autosave:
+        autosave = driver.autosave
+        txt.append("Autosave: every %d sec   Rounds: %d   Players saved: %d   Pending: %d" % (autosave.interval, autosave.rounds, autosave.saved, len(autosave.queue)))
+    if driver.player_store:
+        txt.append("Player accounts: %d   Commits: %d" % (driver.player_store.count(), driver.player_store.commits))
+    if driver.zone_resets:
+        zone_resets = driver.zone_resets
+        txt.append("Zones: %d   Resets: %d   Reset interval: %d sec" % (len(zone_resets.zones), zone_resets.resets, config.zone_reset_interval))
+        if zone_resets.last_reset:
+            txt.append("Last reset: zone %s, %d objects restored in %.2f ms" % (zone_resets.last_reset[0], zone_resets.last_reset[1], zone_resets.last_reset[2] * 1000))
     player.tell(*txt, format=False)
 
 
@@ -460,3 +481,68 @@ def do_events(player, parsed, ctx):
         txt.append(("%-7s <dim>|</> %-20s<dim>|</> %s") % (d.when_due(ctx.clock, realtime=True), d.callable, d.owner))
     txt.append("</monospaced>")
     player.tell(*txt, format=False)
+
+
+@wizcmd("profile")
+def do_profile(player, parsed, ctx):
+    """Profile the server tick: which heartbeats and deferreds take the most time.
+    Usage: !profile on [cprofile] | off | top [count] | reset | dump"""
+    profiler = ctx.driver.profiler
+    if not parsed.args:
+        raise ParseError("Profile what? (usage: profile on [cprofile] | off | top [count] | reset | dump)")
+    action = parsed.args[0]
+    if action == "on":
+        profiler.start(cprofile="cprofile" in parsed.args[1:])
+        player.tell("Server tick profiling enabled%s." % (" (with cProfile)" if profiler.cprofile else ""))
+    elif action == "off":
+        profiler.stop()
+        player.tell("Server tick profiling disabled.")
+    elif action == "reset":
+        profiler.reset()
+        player.tell("Profiling statistics cleared.")
+    elif action == "top":
+        try:
+            count = int(parsed.args[1]) if len(parsed.args) > 1 else 10
+        except ValueError:
+            raise ParseError("The count must be a number.")
+        if not profiler.ticks:
+            player.tell("No ticks have been profiled yet.")
+            return
+        txt = ["<bright>Server tick profile</> (%s)" % ("running" if profiler.enabled else "stopped"),
+               "Ticks: %d   Average: %.2f ms   Worst: %.2f ms" % (profiler.ticks, profiler.tick_time / profiler.ticks * 1000, profiler.tick_worst * 1000)]
+        txt.append("<monospaced>")
+        txt.append("<ul>  calls <dim>|</><ul>  total ms <dim>|</><ul>  worst ms <dim>|</><ul> callable                         </>")
+        for name, calls, total, worst in profiler.top(count):
+            txt.append("%7d <dim>|</> %9.2f <dim>|</> %9.2f <dim>|</> %s" % (calls, total * 1000, worst * 1000, name))
+        txt.append("</monospaced>")
+        player.tell(*txt, format=False)
+    elif action == "dump":
+        if not profiler.cprofile:
+            raise ActionRefused("cProfile is not active, use 'profile on cprofile' first.")
+        path = "profile/%s.pstats" % ctx.config.name.lower()
+        with ctx.driver.vfs.open_write(path, mode="wb") as stream:
+            profiler.dump(stream)
+        player.tell("Profile statistics written to %s" % ctx.driver.vfs.get_userdata_dir(path))
+    else:
+        raise ParseError("Unknown profile action. (usage: profile on [cprofile] | off | top [count] | reset | dump)")
+
+
+@wizcmd("reset")
+def do_reset(player, parsed, ctx):
+    """Reset a zone to its starting configuration: bring back the items and npcs that are gone, and restore its doors.
+    Without a name, the zone you're in is reset. Usage: !reset zone [name]"""
+    zone_resets = ctx.driver.zone_resets
+    if not parsed.args or parsed.args[0] != "zone" or len(parsed.args) > 2:
+        raise ParseError("Reset what? (usage: reset zone [name])")
+    if not zone_resets:
+        raise ActionRefused("Zone resets are not enabled (zone_reset_interval, or reset_interval in a zone module).")
+    if len(parsed.args) == 2:
+        zone = zone_resets.zones.get(parsed.args[1])
+        if not zone:
+            raise ActionRefused("There's no zone '%s'. The zones are: %s" % (parsed.args[1], ", ".join(sorted(zone_resets.zones))))
+    else:
+        zone = zone_resets.zone_of(player.location)
+        if not zone:
+            raise ActionRefused("You're not in a zone.")
+    restored = zone_resets.reset(zone)
+    player.tell("Zone %s has been reset (%d objects restored in %.2f ms)." % (zone.name, restored, zone_resets.last_reset[2] * 1000))
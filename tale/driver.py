@@ -9,20 +9,24 @@ from __future__ import absolute_import, print_function, division, unicode_litera
 import collections
 from functools import total_ordering
 import datetime
+import math
 import sys
 import time
 import os
-import heapq
 import inspect
 import argparse
 import pickle
+import gzip
+import random
 import threading
 from . import mud_context
 from . import errors
 from . import util
+from . import base
 from . import soul
 from . import cmds
 from . import player
+from . import pubsub
 from . import __version__ as tale_version_str
 from .io import vfs
 from .io.iobase import TabCompleter
@@ -31,7 +35,11 @@ from .io import DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_DELAY
 
 @total_ordering
 class Deferred(object):
-    __slots__ = ("due", "owner", "callable", "vargs", "kwargs")
+    """
+    A callable that is to be invoked at a certain (game) time.
+    Driver.defer returns it as a handle that can be used to cancel the deferred.
+    """
+    __slots__ = ("due", "owner", "callable", "vargs", "kwargs", "cancelled", "wheel")
 
     def __init__(self, due, owner, callable, vargs, kwargs):
         assert due is None or isinstance(due, datetime.datetime)
@@ -40,6 +48,19 @@ class Deferred(object):
         self.callable = callable
         self.vargs = vargs
         self.kwargs = kwargs
+        self.cancelled = False
+        self.wheel = None   # the timer wheel this deferred is scheduled on
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != "wheel"}
+
+    def __setstate__(self, state):
+        self.cancelled = False
+        self.wheel = None
+        if isinstance(state, tuple):
+            state = state[1]   # default slots state of deferreds pickled by older versions
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def __eq__(self, other):
         return self.due == other.due
@@ -58,7 +79,15 @@ class Deferred(object):
             secs = int(secs / game_clock.times_realtime)
         return datetime.timedelta(seconds=secs)
 
+    def cancel(self):
+        """Cancel the deferred, it will not be called anymore."""
+        if self.wheel:
+            self.wheel.cancel(self)
+        self.cancelled = True
+
     def __call__(self, *args, **kwargs):
+        if self.cancelled:
+            return
         self.kwargs = self.kwargs or {}
         if "driver" in kwargs:
             self.kwargs["driver"] = kwargs["driver"]  # always add a 'driver' keyword argument for convenience
@@ -72,10 +101,416 @@ class Deferred(object):
                 callable(*self.vargs, **self.kwargs)
 
 
+class TimerWheel(object):
+    """
+    Hierarchical timer wheel that holds the pending deferreds, keyed on whole seconds of game time.
+    Scheduling a deferred is O(1), and a deferred is moved down at most once per wheel level,
+    so popping all deferreds that are due costs O(1) amortized per deferred.
+    Iterating over the wheel yields the pending deferreds sorted on their due time.
+    Cancelled deferreds are only marked (tombstoned) and are skipped when they come up,
+    the wheel is compacted once the tombstones outnumber the live deferreds.
+    An index of the deferreds per owner makes cancelling all of an owner's deferreds O(k).
+    """
+    slot_bits = 6
+    num_levels = 4
+    min_compaction = 64
+
+    def __init__(self):
+        self.origin = None   # the game time that corresponds to tick 0 (set on first use)
+        self.current = 0     # every deferred with a due tick up to and including this one has been popped
+        self.levels = [[[] for _ in range(1 << self.slot_bits)] for _ in range(self.num_levels)]
+        self.level_sizes = [0] * self.num_levels
+        self.overflow = []   # deferreds that are too far in the future to fit on the wheel
+        self.cancelled = 0   # number of tombstones still on the wheel
+        self.owners = {}     # id(owner) -> {id(deferred): deferred} of that owner's deferreds
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["owners"]   # keyed on object ids, so it must be rebuilt
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self.owners = {}
+        for key, deferred in self._entries():
+            if not deferred.cancelled:
+                self.owners.setdefault(id(deferred.owner), {})[id(deferred)] = deferred
+
+    def __len__(self):
+        return sum(self.level_sizes) + len(self.overflow) - self.cancelled
+
+    def __iter__(self):
+        return iter(sorted(deferred for key, deferred in self._entries() if not deferred.cancelled))
+
+    def _entries(self):
+        for level in self.levels:
+            for slot in level:
+                for entry in slot:
+                    yield entry
+        for entry in self.overflow:
+            yield entry
+
+    def _ticks(self, moment, round_up):
+        delta = moment - self.origin
+        ticks = delta.days * 86400 + delta.seconds
+        if round_up and delta.microseconds:
+            ticks += 1
+        return ticks
+
+    def _place(self, key, deferred):
+        delta = key - self.current
+        for level in range(self.num_levels):
+            shift = self.slot_bits * level
+            if delta < 1 << (shift + self.slot_bits):
+                slot = (key >> shift) & ((1 << self.slot_bits) - 1)
+                self.levels[level][slot].append((key, deferred))
+                self.level_sizes[level] += 1
+                return
+        self.overflow.append((key, deferred))
+
+    def _cascade(self, level, slot):
+        # move the deferreds in the given slot down to the lower levels of the wheel
+        if level == self.num_levels:
+            entries, self.overflow = self.overflow, []
+        else:
+            entries = self.levels[level][slot]
+            if not entries:
+                return
+            self.levels[level][slot] = []
+            self.level_sizes[level] -= len(entries)
+        for key, deferred in entries:
+            if deferred.cancelled:
+                self.cancelled -= 1
+            else:
+                self._place(key, deferred)
+
+    def _unindex(self, deferred):
+        owned = self.owners.get(id(deferred.owner))
+        if owned:
+            owned.pop(id(deferred), None)
+            if not owned:
+                del self.owners[id(deferred.owner)]
+
+    def schedule(self, deferred, now):
+        """Put a deferred on the wheel. Now is the current game time."""
+        if self.origin is None:
+            self.origin = now
+        # a deferred that is already due will fire at the next tick
+        key = max(self._ticks(deferred.due, True), self.current + 1)
+        deferred.cancelled = False
+        deferred.wheel = self
+        self._place(key, deferred)
+        self.owners.setdefault(id(deferred.owner), {})[id(deferred)] = deferred
+
+    def pop_due(self, now):
+        """Remove and return the list of all deferreds that are due at the given game time, in order of their due time."""
+        if self.origin is None:
+            self.origin = now
+            return []
+        target = self._ticks(now, False)
+        bits = self.slot_bits
+        due = []
+        while self.current < target:
+            # nothing can become due before the next cascade of the lowest occupied level, so skip ahead to it
+            for level, size in enumerate(self.level_sizes):
+                if size:
+                    break
+            else:
+                if not self.overflow:
+                    self.current = target
+                    break
+                level = self.num_levels
+            if level:
+                span = 1 << (bits * level)
+                self.current = min(target, (self.current // span + 1) * span - 1)
+                if self.current == target:
+                    break
+            self.current += 1
+            tick = self.current
+            for level in range(self.num_levels, 0, -1):
+                if tick & ((1 << (bits * level)) - 1) == 0:
+                    self._cascade(level, (tick >> (bits * level)) & ((1 << bits) - 1))
+            slot = tick & ((1 << bits) - 1)
+            entries = self.levels[0][slot]
+            if entries:
+                self.levels[0][slot] = []
+                self.level_sizes[0] -= len(entries)
+                # the slot holds a single second, but in the order of scheduling and cascading
+                entries.sort(key=lambda entry: entry[1].due)
+                for key, deferred in entries:
+                    if deferred.cancelled:
+                        self.cancelled -= 1
+                    else:
+                        deferred.wheel = None
+                        self._unindex(deferred)
+                        due.append(deferred)
+        return due
+
+    def next_due(self):
+        """Return the game time of the first tick at which a deferred is due, or None if nothing is pending."""
+        bits = self.slot_bits
+        mask = (1 << bits) - 1
+        first = None
+        for level in range(self.num_levels):
+            if not self.level_sizes[level]:
+                continue
+            # the first occupied slot after the current position holds the lowest due ticks of this level
+            start = (self.current >> (bits * level)) + 1
+            for offset in range(1 << bits):
+                keys = [key for key, deferred in self.levels[level][(start + offset) & mask] if not deferred.cancelled]
+                if keys:
+                    key = min(keys)
+                    if first is None or key < first:
+                        first = key
+                    break
+        keys = [key for key, deferred in self.overflow if not deferred.cancelled]
+        if keys and (first is None or min(keys) < first):
+            first = min(keys)
+        if first is None:
+            return None
+        return self.origin + datetime.timedelta(seconds=first)
+
+    def cancel(self, deferred):
+        """Cancel a single deferred that is scheduled on this wheel."""
+        if deferred.wheel is not self or deferred.cancelled:
+            return
+        deferred.cancelled = True
+        deferred.wheel = None
+        self._unindex(deferred)
+        self.cancelled += 1
+        self._maybe_compact()
+
+    def remove_owner(self, owner):
+        """Cancel all deferreds of the given owner object."""
+        owned = self.owners.pop(id(owner), None)
+        if owned:
+            for deferred in owned.values():
+                deferred.cancelled = True
+                deferred.wheel = None
+            self.cancelled += len(owned)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.cancelled > self.min_compaction and self.cancelled * 2 > sum(self.level_sizes) + len(self.overflow):
+            self.compact()
+
+    def compact(self):
+        """Physically remove all cancelled deferreds (tombstones) from the wheel."""
+        for level_index, level in enumerate(self.levels):
+            if not self.level_sizes[level_index]:
+                continue
+            for slot_index, slot in enumerate(level):
+                if slot:
+                    remaining = [entry for entry in slot if not entry[1].cancelled]
+                    if len(remaining) != len(slot):
+                        self.level_sizes[level_index] -= len(slot) - len(remaining)
+                        level[slot_index] = remaining
+        self.overflow = [entry for entry in self.overflow if not entry[1].cancelled]
+        self.cancelled = 0
+
+
+class HeartbeatScheduler(object):
+    """
+    Keeps track of the objects that receive heartbeats.
+    An object with a heartbeat interval of n ticks sits in one of n buckets (its phase),
+    and a tick only visits the buckets that are due. The cost of a tick depends on the
+    number of heartbeats in that tick, not on the total number of heartbeat objects.
+    """
+    def __init__(self):
+        self.tick = 0
+        self.buckets = {}     # interval -> list of sets of objects, one set per phase
+        self.schedule = {}    # object -> (interval, phase)
+
+    def __len__(self):
+        return len(self.schedule)
+
+    def __iter__(self):
+        return iter(self.schedule)
+
+    def __contains__(self, obj):
+        return obj in self.schedule
+
+    def register(self, obj):
+        if obj in self.schedule:
+            return
+        interval = max(1, int(getattr(obj, "heartbeat_interval", 1)))
+        buckets = self.buckets.get(interval)
+        if buckets is None:
+            buckets = self.buckets[interval] = [set() for _ in range(interval)]
+        phase = getattr(obj, "heartbeat_phase", None)
+        if phase is None:
+            # put it in the least crowded bucket to spread the load
+            phase = min(range(interval), key=lambda p: len(buckets[p]))
+        else:
+            phase %= interval
+        buckets[phase].add(obj)
+        self.schedule[obj] = (interval, phase)
+
+    def unregister(self, obj):
+        interval, phase = self.schedule.pop(obj, (None, None))
+        if interval:
+            self.buckets[interval][phase].discard(obj)
+
+    def pop_due(self, ticks=1):
+        """
+        Advance the given number of ticks. Returns a list of (object, beats) pairs
+        for the objects that get one or more heartbeats in those ticks.
+        """
+        start = self.tick
+        self.tick += ticks
+        if ticks == 1:
+            return [(obj, 1) for interval, buckets in self.buckets.items() for obj in buckets[self.tick % interval]]
+        result = []
+        for obj, (interval, phase) in self.schedule.items():
+            beats = (self.tick - phase) // interval - (start - phase) // interval
+            if beats:
+                result.append((obj, beats))
+        return result
+
+
+class TickProfiler(object):
+    """
+    Accumulates the cost of the heartbeats and deferreds that run in the server tick,
+    per heartbeat class and per deferred callable: number of calls, total and worst time.
+    When disabled, server_tick uses NO_PROFILER instead, which only calls the functions.
+    Optionally a cProfile profiler runs during the ticks as well, its stats can be dumped in pstats format.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}   # name -> [calls, total time, worst time]
+        self.ticks = 0
+        self.tick_time = 0.0
+        self.tick_worst = 0.0
+        self.cprofile = None
+
+    def start(self, cprofile=False):
+        self.enabled = True
+        if cprofile and not self.cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+
+    def stop(self):
+        self.enabled = False
+
+    def reset(self):
+        self.stats.clear()
+        self.ticks = 0
+        self.tick_time = self.tick_worst = 0.0
+        if self.cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+
+    def begin_tick(self):
+        if self.cprofile:
+            self.cprofile.enable()
+        return time.time()
+
+    def end_tick(self, started):
+        duration = time.time() - started
+        if self.cprofile:
+            self.cprofile.disable()
+        self.ticks += 1
+        self.tick_time += duration
+        self.tick_worst = max(self.tick_worst, duration)
+
+    def call(self, what, func, *vargs, **kwargs):
+        """call the function and add the time it took to the stats of what it is for (a name, heartbeat object or deferred)"""
+        started = time.time()
+        try:
+            return func(*vargs, **kwargs)
+        finally:
+            duration = time.time() - started
+            name = self.name(what)
+            stats = self.stats.get(name)
+            if stats:
+                stats[0] += 1
+                stats[1] += duration
+                if duration > stats[2]:
+                    stats[2] = duration
+            else:
+                self.stats[name] = [1, duration, duration]
+
+    @classmethod
+    def name(cls, what):
+        if isinstance(what, util.basestring_type):
+            return what
+        if isinstance(what, Deferred):
+            return cls.deferred_name(what)
+        return cls.heartbeat_name(what)
+
+    @staticmethod
+    def heartbeat_name(obj):
+        return "heartbeat " + obj.__class__.__module__ + "." + obj.__class__.__name__
+
+    @staticmethod
+    def deferred_name(deferred):
+        if deferred.owner is None:
+            func = deferred.callable
+            owner = getattr(func, "__self__", None)
+            if owner is not None:
+                klass = owner if inspect.isclass(owner) else owner.__class__
+                return "deferred %s.%s.%s" % (klass.__module__, klass.__name__, func.__name__)
+            return "deferred %s.%s" % (getattr(func, "__module__", "?"), getattr(func, "__name__", repr(func)))
+        klass = deferred.owner.__class__
+        return "deferred %s.%s.%s" % (klass.__module__, klass.__name__, deferred.callable)
+
+    def top(self, count=10):
+        """return the (name, calls, total, worst) of the most expensive callables, by total time"""
+        result = [(name, calls, total, worst) for name, (calls, total, worst) in self.stats.items()]
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result[:count]
+
+    def dump(self, stream):
+        """write the cProfile stats to the (binary) stream, in the format that pstats can load"""
+        if not self.cprofile:
+            raise ValueError("cProfile is not active")
+        import marshal
+        self.cprofile.create_stats()
+        stream.write(marshal.dumps(self.cprofile.stats))   # marshal.dump only takes real files on Python 2
+
+
+class NoProfiler(object):
+    """Stands in for the TickProfiler while it's disabled: the functions are called without timing them"""
+    def begin_tick(self):
+        return None
+
+    def end_tick(self, started):
+        pass
+
+    def call(self, what, func, *vargs, **kwargs):
+        return func(*vargs, **kwargs)
+
+
+NO_PROFILER = NoProfiler()
+
+
+class CommandTable(dict):
+    """
+    The read-only verb -> command function mapping for a set of privileges.
+    'verbs' is the frozenset of the verbs, and 'lookup' maps every verb and abbreviation
+    to a (verb, function, no_soul_parse) tuple so a single dict lookup resolves what was typed.
+    (abbreviations of verbs that aren't commands, such as directions, have None as function)
+    """
+    def __init__(self, commands, abbreviations, no_soul_parsing):
+        super(CommandTable, self).__init__(commands)
+        self.verbs = frozenset(commands)
+        self.lookup = {}
+        for abbr, verb in abbreviations.items():
+            self.lookup[abbr] = (verb, commands.get(verb), verb in no_soul_parsing)
+        for verb, func in commands.items():
+            self.lookup[verb] = (verb, func, verb in no_soul_parsing)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("command table is read-only")
+
+    __setitem__ = __delitem__ = update = clear = pop = popitem = setdefault = _readonly
+
+
 class Commands(object):
     def __init__(self):
         self.commands_per_priv = {None: {}}
         self.no_soul_parsing = set()
+        self.tables = {}   # frozenset of privileges -> CommandTable
 
     def add(self, verb, func, privilege=None):
         self.validateFunc(func)
@@ -83,12 +518,14 @@ class Commands(object):
             if verb in commands:
                 raise ValueError("command defined more than once: " + verb)
         self.commands_per_priv.setdefault(privilege, {})[verb] = func
+        self.tables.clear()
 
     def override(self, verb, func, privilege=None):
         self.validateFunc(func)
         if verb in self.commands_per_priv[privilege]:
             existing = self.commands_per_priv[privilege][verb]
             self.commands_per_priv[privilege][verb] = func
+            self.tables.clear()
             return existing
         raise KeyError("command not defined: " + verb)
 
@@ -97,11 +534,15 @@ class Commands(object):
             raise ValueError("the function '%s' is not a proper command function (did you forget the decorator?)" % func.__name__)
 
     def get(self, privileges):
-        result = self.commands_per_priv[None]  # always include the cmds for None
-        for priv in privileges:
-            if priv in self.commands_per_priv:
-                result.update(self.commands_per_priv[priv])
-        return result
+        """return the (read-only) CommandTable with the commands available for the given privileges"""
+        key = frozenset(priv for priv in privileges if priv in self.commands_per_priv)
+        table = self.tables.get(key)
+        if table is None:
+            commands = dict(self.commands_per_priv[None])  # always include the cmds for None
+            for priv in key:
+                commands.update(self.commands_per_priv[priv])
+            table = self.tables[key] = CommandTable(commands, cmds.abbreviations, self.no_soul_parsing)
+        return table
 
     def adjust_available_commands(self, story_config):
         # disable commands flagged with the given game_mode
@@ -116,12 +557,37 @@ class Commands(object):
                     del soul.VERBS[cmd]
                 if getattr(func, "no_soul_parse", False):
                     self.no_soul_parsing.add(cmd)
+        # build the command tables for the privileges up front
+        self.tables.clear()
+        for priv in self.commands_per_priv:
+            self.get([priv] if priv else [])
 
 
 def version_tuple(v_str):
     return tuple(int(n) for n in v_str.split('.'))
 
 
+# driver settings that a story's config doesn't have to specify
+DEFAULT_CONFIG = dict(
+    command_rate = 4.0,              # mud mode: sustained number of commands per second a player may enter
+    command_burst = 10,              # mud mode: number of commands a player may enter in a quick burst
+    max_commands_per_tick = 100,     # mud mode: max. number of commands of all players together per server tick
+    startup_cache = False,           # cache the world built by the zones in the user storage, for faster startup
+    background_saves = False,        # save games in a forked child process, so the game keeps running (requires os.fork)
+    delta_savegames = False,         # savegames only store what has changed in the world since startup (keeps a copy of the world made at startup)
+    journal = False,                 # mud mode: journal all commands, to recover the world after a crash or a restart
+    checkpoint_interval = 300,       # mud mode: seconds between the checkpoints of the world that truncate the journal
+    autosave_interval = 0,           # mud mode: seconds between the autosaves of the players that changed, 0 = no autosave (requires player_accounts)
+    autosave_batch = 10,             # mud mode: max. number of players the autosave saves per server tick
+    zone_reset_interval = 0,         # mud mode: seconds between the resets of every zone to its starting configuration, 0 = no resets
+    pubsub_delivery = "direct",      # "deferred" = pubsub events (such as wiretaps) are delivered in batches every server tick
+    pubsub_buffer_size = 100,        # deferred pubsub delivery: max. number of events waiting per topic
+    pubsub_policy = "drop-oldest",   # deferred pubsub delivery: when a topic's buffer is full, "drop-oldest", "drop-newest" or "coalesce"
+    pubsub_batch = 1000,             # deferred pubsub delivery: max. number of events delivered per server tick
+    player_accounts = False          # mud mode: keep player accounts in a database in the user storage (requires sqlite3)
+)
+
+
 class Driver(object):
     """
     The Mud 'driver'.
@@ -131,21 +597,34 @@ class Driver(object):
     directions = {"north", "east", "south", "west", "northeast", "northwest", "southeast", "southwest", "up", "down"}
 
     def __init__(self):
-        self.heartbeat_objects = set()
+        self.heartbeat_objects = HeartbeatScheduler()
         self.unbound_exits = []
-        self.deferreds = []  # heapq
+        self.deferreds = TimerWheel()
         self.deferreds_lock = threading.Lock()
         self.notification_queue = util.queue.Queue()
         server_started = datetime.datetime.now()
         self.server_started = server_started.replace(microsecond=0)
-        self.player = None
+        self.player = None   # the player in IF mode
+        self.players = []    # registry of all connected players
+        self.player_names = {}   # name -> logged in player, the index of the registry
+        self.player_store = None   # the player accounts database in mud mode
+        self.core = None     # the asyncio driver core that runs the sessions in mud mode
+        self.io_server = None   # the telnet server, if any
         self.config = None
         self.commands = Commands()
         self.server_loop_durations = collections.deque(maxlen=10)
+        self.profiler = TickProfiler()
+        self.background_save_pid = None   # child process that is writing a savegame
+        self.pristine_world = None   # the world as it was at startup, for delta savegames
+        self.journal = None   # the command journal in mud mode
+        self.autosave = None  # the autosave of the players in mud mode
+        self.zone_resets = None   # the starting configuration of the zones, to reset them to
+        self.next_checkpoint = None
         cmds.register_all(self.commands)
 
     def bind_exits(self):
         # convert textual exit strings to actual exit object bindings
+        # (exits of a world that was restored from the startup cache are already bound)
         for exit in self.unbound_exits:
             exit._bind_target(self.zones)
         del self.unbound_exits
@@ -161,6 +640,7 @@ class Driver(object):
         parser.add_argument('-d', '--delay', type=int, help='screen output delay for IF mode (milliseconds, 0=no delay)', default=DEFAULT_SCREEN_DELAY)
         parser.add_argument('-m', '--mode', type=str, help='game mode, default=if', default="if", choices=["if", "mud"])
         parser.add_argument('-i', '--gui', help='gui interface', action='store_true')
+        parser.add_argument('-t', '--telnet', type=int, metavar="PORT", help='run a telnet server on this port (mud mode)')
         args = parser.parse_args(args)
         try:
             self._start(args)
@@ -191,7 +671,11 @@ class Driver(object):
         self.story = story.Story()
         if args.mode not in self.story.config["supported_modes"]:
             raise ValueError("driver mode '%s' not supported by this story" % args.mode)
-        self.config = util.ReadonlyAttributes(self.story.config)
+        if args.telnet and args.mode != "mud":
+            raise ValueError("the telnet server is only available in mud mode")
+        config = dict(DEFAULT_CONFIG)
+        config.update(self.story.config)
+        self.config = util.ReadonlyAttributes(config)
         self.config.server_mode = args.mode   # if/mud driver mode ('if' = single player interactive fiction, 'mud'=multiplayer)
         # Register the driver and some other stuff in the global context.
         mud_context.driver = self
@@ -211,7 +695,17 @@ class Driver(object):
         self.moneyfmt = util.MoneyFormatter(self.config.money_type) if self.config.money_type else None
         self.vfs = vfs.VirtualFileSystem(story)
         self.story.init(self)
-        import zones
+        world_cache_key = None
+        zones = None
+        if self.config.startup_cache:
+            from . import snapshot
+            story_timers = snapshot.registered_timers(self)
+            world_cache_key = snapshot.source_key(self.story.config, self.config.server_mode)
+            zones = snapshot.load(self, self.config.name.lower() + ".worldcache", world_cache_key)
+        if zones is None:
+            import zones
+        else:
+            world_cache_key = None   # restored from the cache, no need to save it again
         self.zones = zones
         self.config.startlocation_player = self.lookup_location(self.config.startlocation_player)
         self.config.startlocation_wizard = self.lookup_location(self.config.startlocation_wizard)
@@ -224,6 +718,46 @@ class Driver(object):
         self.config.lock()   # make the config read-only
         self.game_clock = util.GameDateTime(self.config.epoch or self.server_started, self.config.gametime_to_realtime)
         self.bind_exits()
+        base.static_texts.seal()   # the world has been built, its texts will be the same after a restart
+        if world_cache_key:
+            snapshot.save(self, self.config.name.lower() + ".worldcache", world_cache_key, story_timers)
+        if self.config.server_mode == "mud":
+            self.record_zones()
+        if self.config.pubsub_delivery == "deferred":
+            pubsub.set_dispatcher(pubsub.Dispatcher(self.config.pubsub_buffer_size, self.config.pubsub_policy, self.config.pubsub_batch))
+        elif self.config.pubsub_delivery == "direct":
+            pubsub.set_dispatcher(None)
+        else:
+            raise ValueError("invalid pubsub_delivery config: " + self.config.pubsub_delivery)
+        if self.config.savegames_enabled and self.config.delta_savegames:
+            self.record_pristine_world()
+        if self.config.server_mode == "mud":
+            self.core = self.create_core()
+        if self.config.server_mode == "mud" and self.config.player_accounts:
+            self.open_player_store()
+        if self.config.journal:
+            if self.config.server_mode != "mud":
+                raise ValueError("the command journal is only available in mud mode")
+            if not self.core:
+                raise ValueError("the command journal requires Python 3.4 or newer (asyncio)")
+            self.open_journal()
+        if self.config.server_mode == "mud" and self.config.autosave_interval:
+            if self.player_store:
+                from .autosave import Autosave
+                self.autosave = Autosave(self, self.config.autosave_interval, self.config.autosave_batch)
+            else:
+                print("The autosave is disabled because it requires the player accounts.")
+        if args.telnet:
+            if not self.core:
+                raise RuntimeError("the telnet server requires Python 3.4 or newer (asyncio)")
+            # every telnet connection gets its own player, the server's mainloop runs in the main thread
+            from .io.telnet_io import TelnetServer
+            self.io_server = TelnetServer(self, self.config, "", args.telnet)
+            driver_thread = threading.Thread(name="driver", target=self.core.run)
+            driver_thread.daemon = True
+            driver_thread.start()
+            self.io_server.mainloop()
+            return
         # story has been initialised, create and connect a player
         self.player = player.Player("<connecting>", "n", "elemental", "This player is still connecting.")
         mud_context.player = self.player
@@ -239,11 +773,28 @@ class Driver(object):
         self.player.io = io
         io.switch_player(self.player)
         # the driver mainloop is running in a background thread, the io-loop/gui-event-loop runs in the main thread
-        driver_thread = threading.Thread(name="driver", target=self.startup_main_loop)
+        if self.core:
+            self.core.add_session(self.player)
+            driver_thread = threading.Thread(name="driver", target=self.core.run)
+        else:
+            self.register_player(self.player)
+            driver_thread = threading.Thread(name="driver", target=self.startup_main_loop)
         driver_thread.daemon = True
         driver_thread.start()
         io.mainloop()
 
+    def create_core(self):
+        """
+        The asyncio driver core that runs the sessions of all players in mud mode.
+        Without asyncio (Python older than 3.4) this returns None, and the single console
+        player is served by the threaded main loop instead, like in if mode.
+        """
+        try:
+            from .async_driver import AsyncDriverCore
+        except ImportError:
+            return None
+        return AsyncDriverCore(self)
+
     def startup_main_loop(self):
         # continues the startup process and kick off the driver's main loop
         self._stop_mainloop = False
@@ -290,6 +841,39 @@ class Driver(object):
             io.output("</></monospaced>")
             io.output("")
 
+    def record_pristine_world(self):
+        """remember the world as the zones built it, so that savegames only have to store the changes"""
+        from . import pristine, snapshot
+        namespaces = [(name, vars(sys.modules[name])) for name in snapshot.zone_module_names()]
+        try:
+            # objects are tracked when they change, so only those have to be compared by a delta save or a checkpoint
+            track_dirty = (self.config.savegames_enabled and self.config.delta_savegames) or bool(self.config.journal)
+            self.pristine_world = pristine.PristineWorld(namespaces, track_dirty)
+        except Exception:
+            self.pristine_world = None   # the world can't be copied, fall back to saving all of it
+
+    def record_zones(self):
+        """remember the starting configuration of the zones that have a reset interval, to reset them to"""
+        from . import snapshot, zonereset
+        namespaces = [(name, vars(sys.modules[name])) for name in snapshot.zone_module_names()]
+        zone_resets = zonereset.ZoneResets(namespaces, self.config.zone_reset_interval)
+        if zone_resets.zones:
+            zone_resets.schedule(self.game_clock)
+            self.zone_resets = zone_resets
+
+    def open_player_store(self):
+        try:
+            from .accounts import PlayerStore
+        except ImportError:
+            print("Player accounts are disabled because sqlite3 is not available.")
+            return
+        if not self.pristine_world:
+            # the saved players refer to the objects of the world by their id in the pristine world
+            self.record_pristine_world()
+        path = self.vfs.get_userdata_dir(self.config.name.lower() + ".accounts.sqlite")
+        self.vfs.makedirs(path)
+        self.player_store = PlayerStore(path)
+
     def create_player(self, player):
         # lets the user create a new player, load a saved game, or initialize it directly from the story's configuration
         if self.config.server_mode == "mud" or not self.config.savegames_enabled:
@@ -317,8 +901,13 @@ class Driver(object):
             elif self.config.server_mode == "mud" or not self.config.player_name:
                 # mud mode, or if mode without player config: create a character with the builder
                 from .charbuilder import CharacterBuilder
-                name_info = CharacterBuilder(player).build()
+                name_info = CharacterBuilder(player, self.player_store).build()
+                if name_info.account:
+                    self.login_account(player, name_info.account)
+                    return
                 name_info.apply_to(player)
+                if name_info.password:
+                    self.player_store.create(player, name_info.password)
 
             player.io.do_styles = player.screen_styles_enabled
             player.io.do_smartquotes = player.smartquotes_enabled
@@ -335,6 +924,29 @@ class Driver(object):
                 player.tell("Welcome to %s, %s." % (self.config.name, player.title), end=True)
             player.tell("\n")
         self.story.init_player(player)
+        self.register_player(player)   # index the player's name
+
+    def login_account(self, player, account):
+        """log in to an existing player account, the player continues where they left off"""
+        location = self.player_store.load(player, account, self.pristine_world)
+        player.io.do_styles = player.screen_styles_enabled
+        player.io.do_smartquotes = player.smartquotes_enabled
+        player.tell("\n")
+        if location is None:
+            location = self.config.startlocation_wizard if "wizard" in player.privileges else self.config.startlocation_player
+        player.move(location)
+        player.tell("\n")
+        player.tell("Welcome back to %s, %s." % (self.config.name, player.title), end=True)
+        player.tell("\n")
+        self.story.init_player(player)
+        self.register_player(player)
+
+    def save_player(self, player):
+        """save a player that is leaving, in the player accounts (at their next commit), via the autosave if there is one"""
+        if self.autosave:
+            self.autosave.save_player(player)
+        elif self.player_store and player.location is not None and player.location is not base._Limbo:
+            self.player_store.save(player, self.pristine_world)
 
     def show_motd(self, player):
         """Prints the Message-Of-The-Day file, if present. Does nothing in IF mode."""
@@ -350,10 +962,27 @@ class Driver(object):
     def stop_driver(self):
         """stop the driver mainloop"""
         self._stop_mainloop = True
-        self.player.write_output()  # flush pending output at server shutdown.
+        if self.core:
+            self.core.stop()
+        if self.io_server:
+            self.io_server.stop_main_loop = True
         ctx = util.Context(driver=self)
         ctx.lock()
-        self.player.destroy(ctx)
+        for player in self.all_players():
+            player.write_output()  # flush pending output at server shutdown.
+            self.save_player(player)
+            player.destroy(ctx)
+        if self.autosave:
+            self.autosave.stop()
+            self.autosave = None
+        if self.player_store:
+            self.player_store.close()
+            self.player_store = None
+        if self.journal:
+            self.set_players([])
+            self.checkpoint()
+            self.journal.close()
+            self.journal = None
 
     def main_loop(self):
         """
@@ -396,23 +1025,8 @@ class Driver(object):
             last_loop_time = time.time()
             if has_input:
                 try:
-                    for cmd in self.player.get_pending_input():   # @todo hmm, all at once or limit player to 1 cmd/tick?
-                        if not cmd:
-                            continue
-                        try:
-                            self.player.tell("\n")
-                            self.process_player_input(cmd)
-                            self.player.remember_parsed()
-                        except soul.UnknownVerbException as x:
-                            if x.verb in self.directions:
-                                self.player.tell("You can't go in that direction.")
-                            else:
-                                self.player.tell("The verb '%s' is unrecognized." % x.verb)
-                        except errors.ActionRefused as x:
-                            self.player.remember_parsed()
-                            self.player.tell(str(x))
-                        except errors.ParseError as x:
-                            self.player.tell(str(x))
+                    for cmd in self.player.get_pending_input():   # single player: no need to limit the commands per tick
+                        self.handle_player_command(self.player, cmd)
                 except KeyboardInterrupt:
                     self.player.io.break_pressed()
                     continue
@@ -435,36 +1049,87 @@ class Driver(object):
                     import traceback
                     txt = "* internal error:\n" + traceback.format_exc()
                     self.player.tell(txt, format=False)
-            # call any queued event notification handlers
-            while True:
-                try:
-                    deferred = self.notification_queue.get_nowait()
-                    deferred()
-                except util.queue.Empty:
-                    break
+            self.process_notifications()
+            self.save_tick()
 
-    def server_tick(self):
+    def save_tick(self):
+        """(mud mode) let the autosave do its work, and commit the players saved since the last time"""
+        if self.autosave:
+            self.autosave.tick()
+        if self.player_store:
+            self.player_store.commit()   # all players saved during this tick, in one transaction
+
+    def handle_player_command(self, player, cmd):
+        """
+        Process a single command line of the player.
+        Unknown verbs, parse errors and refused actions are reported back to the player.
+        """
+        if not cmd:
+            return
+        mud_context.player = player
+        try:
+            player.tell("\n")
+            self.process_player_input(player, cmd)
+            player.remember_parsed()
+        except soul.UnknownVerbException as x:
+            if x.verb in self.directions:
+                player.tell("You can't go in that direction.")
+            else:
+                player.tell("The verb '%s' is unrecognized." % x.verb)
+        except errors.ActionRefused as x:
+            player.remember_parsed()
+            player.tell(str(x))
+        except errors.ParseError as x:
+            player.tell(str(x))
+
+    def process_notifications(self):
+        """call any queued event notification handlers"""
+        while True:
+            try:
+                deferred = self.notification_queue.get_nowait()
+                deferred()
+            except util.queue.Empty:
+                break
+
+    def server_tick(self, ticks=1):
         """
         Do everything that the server needs to do every tick.
         1) game clock
         2) heartbeats
         3) deferreds
-        4) write buffered output to the screen.
+        4) zone resets
+        5) deferred pubsub events
+        6) write buffered output to the screen.
+        Only the heartbeat objects whose interval and phase match the tick get a heartbeat.
+        With ticks > 1, the game clock skips ahead that many ticks at once and every
+        heartbeat object gets a single heartbeat_fastforward call for its beats in them.
+        Returns True if there was output for any of the players.
         """
-        self.game_clock.add_realtime(datetime.timedelta(seconds=self.config.server_tick_time))
-        ctx = {"driver": self, "clock": self.game_clock}
-        for object in self.heartbeat_objects:
-            object.heartbeat(ctx)
-        if self.deferreds:
+        self.game_clock.add_realtime(datetime.timedelta(seconds=self.config.server_tick_time * ticks))
+        profiler = self.profiler if self.profiler.enabled else NO_PROFILER
+        started = profiler.begin_tick()
+        try:
+            ctx = {"driver": self, "clock": self.game_clock}
+            if ticks == 1:
+                for object, beats in self.heartbeat_objects.pop_due():
+                    profiler.call(object, object.heartbeat, ctx)
+            else:
+                for object, beats in self.heartbeat_objects.pop_due(ticks):
+                    profiler.call(object, object.heartbeat_fastforward, ctx, beats)
             with self.deferreds_lock:
-                deferred = self.deferreds[0]
-                if deferred.due <= self.game_clock.clock:
-                    deferred = heapq.heappop(self.deferreds)
-                else:
-                    deferred = None
-            if deferred:
-                deferred(driver=self)
-        self.player.write_output()
+                due_deferreds = self.deferreds.pop_due(self.game_clock.clock)
+            for deferred in due_deferreds:
+                if not deferred.cancelled:
+                    if self.journal:
+                        self.journal_record("deferred", TickProfiler.deferred_name(deferred))
+                    profiler.call(deferred, deferred, driver=self)
+            if self.zone_resets:
+                profiler.call("zone resets", self.zone_resets.tick, self.game_clock)
+            if pubsub.dispatcher:
+                profiler.call("pubsub delivery", pubsub.dispatcher.drain)
+            return any([player.write_output() for player in self.all_players()])
+        finally:
+            profiler.end_tick(started)
 
     def story_complete_output(self):
         self.player.tell("\n")
@@ -473,41 +1138,42 @@ class Driver(object):
         self.player.input("\nPress enter to continue. ")
         self.player.tell("\n")
 
-    def process_player_input(self, cmd):
+    def process_player_input(self, player, cmd):
         if not cmd:
             return
         if cmd and cmd[0] in cmds.abbreviations and not cmd[0].isalpha():
             # insert a space to separate the first char such as ' or ?
             cmd = cmd[0] + " " + cmd[1:]
+        command_verbs = self.commands.get(player.privileges)
         # check for an abbreviation, replace it with the full verb if present
         _verb, _sep, _rest = cmd.partition(" ")
-        if _verb in cmds.abbreviations:
-            _verb = cmds.abbreviations[_verb]
+        verb_info = command_verbs.lookup.get(_verb)
+        if verb_info and verb_info[0] != _verb:
+            _verb = verb_info[0]
             cmd = "".join([_verb, _sep, _rest])
 
         # We pass in all 'external verbs' (non-soul verbs) so it will do the
         # parsing for us even if it's a verb the soul doesn't recognise by itself.
-        command_verbs = self.commands.get(self.player.privileges)
-        custom_verbs = set(self.player.location.verbs)
+        custom_verbs = player.location.verbs
         try:
-            if _verb in self.commands.no_soul_parsing:
+            if verb_info and verb_info[2]:
                 # don't use the soul to parse it further
-                self.player.turns += 1
+                player.turns += 1
                 raise soul.NonSoulVerb(soul.ParseResult(_verb, unparsed=_rest.strip()))
             else:
                 # Parse the command by using the soul.
-                all_verbs = set(command_verbs) | custom_verbs
-                parsed = self.player.parse(cmd, external_verbs=all_verbs)
+                all_verbs = command_verbs.verbs.union(custom_verbs) if custom_verbs else command_verbs.verbs
+                parsed = player.parse(cmd, external_verbs=all_verbs)
             # If parsing went without errors, it's a soul verb, handle it as a socialize action
-            self.player.turns += 1
-            self.do_socialize(parsed)
+            player.turns += 1
+            self.do_socialize(player, parsed)
         except soul.NonSoulVerb as x:
             parsed = x.parsed
             if parsed.qualifier:
                 # for now, qualifiers are only supported on soul-verbs (emotes).
                 raise errors.ParseError("That action doesn't support qualifiers.")
             # Execute non-soul verb. First try directions, then the rest.
-            self.player.turns += 1
+            player.turns += 1
             try:
                 # Check if the verb is a custom verb and try to handle that.
                 # If it remains unhandled, check if it is a normal verb, and handle that.
@@ -515,35 +1181,35 @@ class Driver(object):
                 parse_error = "That doesn't make much sense."
                 handled = False
                 if parsed.verb in custom_verbs:
-                    handled = self.player.location.handle_verb(parsed, self.player)
+                    handled = player.location.handle_verb(parsed, player)
                     if handled:
-                        self.after_player_action(self.player.location.notify_action, parsed, self.player)
+                        self.after_player_action(player.location.notify_action, parsed, player)
                     else:
                         parse_error = "Please be more specific."
                 if not handled:
-                    if parsed.verb in self.player.location.exits:
-                        self.go_through_exit(self.player, parsed.verb)
+                    if parsed.verb in player.location.exits:
+                        self.go_through_exit(player, parsed.verb)
                     elif parsed.verb in command_verbs:
                         func = command_verbs[parsed.verb]
                         ctx = util.Context(driver=self, config=self.config, clock=self.game_clock)
                         ctx.lock()
-                        func(self.player, parsed, ctx)
+                        func(player, parsed, ctx)
                         if func.enable_notify_action:
-                            self.after_player_action(self.player.location.notify_action, parsed, self.player)
+                            self.after_player_action(player.location.notify_action, parsed, player)
                     else:
                         raise errors.ParseError(parse_error)
             except errors.RetrySoulVerb as x:
                 # cmd decided it can't deal with the parsed stuff and that it needs to be retried as soul emote.
-                self.player.validate_socialize_targets(parsed)
-                self.do_socialize(parsed)
+                player.validate_socialize_targets(parsed)
+                self.do_socialize(player, parsed)
             except errors.RetryParse as x:
-                return self.process_player_input(x.command)   # try again but with new command string
+                return self.process_player_input(player, x.command)   # try again but with new command string
 
-    def get_current_verbs(self):
+    def get_current_verbs(self, player):
         """return a dict of all currently recognised verbs, and their help text"""
-        normal_verbs = self.commands.get(self.player.privileges)
+        normal_verbs = self.commands.get(player.privileges)
         verbs = {v: (f.__doc__ or "") for v, f in normal_verbs.items()}
-        verbs.update(self.player.location.verbs)  # add the custom verbs
+        verbs.update(player.location.verbs)  # add the custom verbs
         return verbs
 
     def go_through_exit(self, player, direction):
@@ -564,11 +1230,11 @@ class Driver(object):
                 location = getattr(location, name)
         return location
 
-    def do_socialize(self, parsed):
-        who, player_message, room_message, target_message = self.player.socialize_parsed(parsed)
-        self.player.tell(player_message)
-        self.player.location.tell(room_message, self.player, who, target_message)
-        self.after_player_action(self.player.location.notify_action, parsed, self.player)
+    def do_socialize(self, player, parsed):
+        who, player_message, room_message, target_message = player.socialize_parsed(parsed)
+        player.tell(player_message)
+        player.location.tell(room_message, player, who, target_message)
+        self.after_player_action(player.location.notify_action, parsed, player)
         if parsed.verb in soul.AGGRESSIVE_VERBS:
             # usually monsters immediately attack,
             # other npcs may choose to attack or to ignore it
@@ -576,34 +1242,77 @@ class Driver(object):
             if parsed.qualifier not in soul.NEGATING_QUALIFIERS:
                 for living in who:
                     if getattr(living, "aggressive", False):
-                        living.start_attack(self.player)
+                        living.start_attack(player)
 
-    def search_player(self, name):
-        """Look through all the logged in players for one with the given name"""
-        if self.player.name == name:
-            return self.player
-        return None
+    def register_player(self, player):
+        """add a player to the registry of connected players (again, when its name has been changed)"""
+        if player not in self.players:
+            self.players.append(player)
+        if not player.name.startswith("<"):   # a player that is still connecting isn't searchable
+            self.player_names[player.name] = player
+
+    def unregister_player(self, player):
+        """remove a player from the registry of connected players"""
+        if player in self.players:
+            self.players.remove(player)
+        if self.player_names.get(player.name) is player:
+            del self.player_names[player.name]
+
+    def set_players(self, players):
+        """replace the registry of connected players"""
+        self.players = []
+        self.player_names = {}
+        for player in players:
+            self.register_player(player)
+
+    def search_player(self, name, offline=False):
+        """
+        Find the logged in player with the given name.
+        With offline=True, the account of a player that isn't logged in is returned if there is one.
+        """
+        player = self.player_names.get(name)
+        if player is None and offline and self.player_store:
+            return self.player_store.find(name)
+        return player
 
     def all_players(self):
         """return all players"""
-        return [self.player]
+        return list(self.players)
 
     def do_wait(self, duration):
-        # let time pass, duration is in game time (not real time).
-        # We do let the game tick for the correct number of times,
-        # however @todo: be able to detect if something happened during the wait
+        """
+        Let time pass, duration is in game time (not real time).
+        Rather than running every server tick, the game clock skips straight ahead to the
+        next tick at which a deferred is due (heartbeats get the skipped ticks in one go).
+        Returns (True, None) if the wait was uneventful, and (False, message) if it
+        was refused or if the player was told something while waiting.
+        """
+        self.player.write_output()
         if self.config.gametime_to_realtime == 0:
             # game is running with a 'frozen' clock
             # simply advance the clock, and perform a single server_tick
             self.game_clock.add_gametime(duration)
-            self.server_tick()
-            return True, None      # uneventful
-        num_ticks = int(duration.seconds / self.config.gametime_to_realtime / self.config.server_tick_time)
-        if num_ticks < 1:
-            return False, "It's no use waiting such a short while."
-        for _ in range(num_ticks):
-            self.server_tick()
-        return True, None     # wait was uneventful. (@todo return False if something happened)
+            eventful = self.server_tick()
+        else:
+            tick_duration = (self.game_clock.plus_realtime(datetime.timedelta(seconds=self.config.server_tick_time)) -
+                             self.game_clock.clock).total_seconds()
+            num_ticks = int(duration.total_seconds() / tick_duration)
+            if num_ticks < 1:
+                return False, "It's no use waiting such a short while."
+            eventful = False
+            while num_ticks > 0:
+                ticks = num_ticks
+                with self.deferreds_lock:
+                    next_due = self.deferreds.next_due()
+                if next_due:
+                    until_due = (next_due - self.game_clock.clock).total_seconds()
+                    ticks = min(num_ticks, max(1, int(math.ceil(until_due / tick_duration))))
+                if self.server_tick(ticks):
+                    eventful = True
+                num_ticks -= ticks
+        if eventful:
+            return False, "You've waited %s. Some things happened meanwhile." % util.duration_display(duration)
+        return True, None
 
     def do_save(self, player):
         if not self.config.savegames_enabled:
@@ -614,21 +1323,92 @@ class Driver(object):
             "deferreds": self.deferreds,
             "clock": self.game_clock,
             "heartbeats": self.heartbeat_objects,
+            "zones": self.zone_resets.state() if self.zone_resets else {},
             "config": self.config
         }
-        savedata = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
-        self.vfs.write_to_storage(self.config.name.lower() + ".savegame", savedata)
-        player.tell("Game saved.")
-        if self.config.display_gametime:
-            player.tell("Game time:", self.game_clock)
-        player.tell("\n")
+        path = self.config.name.lower() + ".savegame"
+
+        def saved(success):
+            player.tell("Game saved." if success else "* Saving the game failed!")
+            if success and self.config.display_gametime:
+                player.tell("Game time:", self.game_clock)
+            player.tell("\n")
+
+        if self.config.background_saves and self.save_in_background(state, path, saved):
+            player.tell("Saving the game in the background.")
+            return
+        self.write_savegame(path, state)
+        saved(True)
+
+    def write_savegame(self, path, state):
+        """
+        Pickle the state straight into a compressed stream on a temporary file in the storage,
+        which replaces the previous savegame only once it has been written completely.
+        If the pristine world was recorded, only the changes to the world objects are stored.
+        """
+        with self.vfs.open_storage_write(path) as f:
+            with gzip.GzipFile(filename="", mode="wb", compresslevel=6, fileobj=f) as stream:
+                if self.pristine_world:
+                    state = dict(state, world_changes=self.pristine_world.changes())
+                    self.pristine_world.pickler(stream).dump(state)
+                else:
+                    pickle.Pickler(stream, pickle.HIGHEST_PROTOCOL).dump(state)
+
+    def read_savegame(self, path):
+        """Unpickle a savegame from the storage, decompressing it while reading (older savegames are uncompressed)"""
+        with self.vfs.open_storage_read(path) as f:
+            magic = f.read(2)
+            f.seek(0)
+            if magic == b"\x1f\x8b":
+                with gzip.GzipFile(filename="", mode="rb", fileobj=f) as stream:
+                    return self._unpickle(stream)
+            return self._unpickle(f)
+
+    def _unpickle(self, stream):
+        if self.pristine_world:
+            return self.pristine_world.unpickler(stream).load()
+        return pickle.load(stream)
+
+    def save_in_background(self, state, path, callback):
+        """
+        Fork a child process that pickles the state from its copy-on-write image of the memory
+        and writes it to the storage path, while this process simply continues.
+        When the child is done, callback(success) is queued as a notification.
+        Returns False if this isn't possible on this platform.
+        """
+        if not hasattr(os, "fork"):
+            return False
+        if self.background_save_pid:
+            raise errors.ActionRefused("The game is still being saved, try again in a moment.")
+        pid = os.fork()
+        if pid == 0:
+            # child process: write the savegame and exit immediately, without any cleanup of the parent's state
+            status = 1
+            try:
+                self.write_savegame(path, state)
+                status = 0
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                sys.stderr.flush()   # os._exit doesn't flush it
+            finally:
+                os._exit(status)
+        self.background_save_pid = pid
+
+        def wait_for_child():
+            status = os.waitpid(pid, 0)[1]
+            self.background_save_pid = None
+            self.notification_queue.put(Deferred(None, None, callback, (status == 0,), None))
+
+        waiter = threading.Thread(name="savegame", target=wait_for_child)
+        waiter.daemon = True
+        waiter.start()
+        return True
 
     def load_saved_game(self):
         try:
-            savegame = self.vfs.load_from_storage(self.config.name.lower() + ".savegame")
-            state = pickle.loads(savegame)
-            del savegame
-        except (IOError, pickle.PickleError) as x:
+            state = self.read_savegame(self.config.name.lower() + ".savegame")
+        except (IOError, EOFError, pickle.PickleError) as x:
             print("There was a problem loading the saved game data:")
             print(type(x).__name__, x)
             raise SystemExit(10)
@@ -637,11 +1417,30 @@ class Driver(object):
                 print("This saved game data was from a different version of the game and cannot be used.")
                 print("(Current game version: %s  Saved game data version: %s)" % (self.config.version, state["version"]))
                 raise SystemExit(10)
+            if "world_changes" in state:
+                # delta savegame: put the world back in its initial state, then apply the changes
+                self.pristine_world.restore()
+                self.pristine_world.apply(state["world_changes"])
             self.player = state["player"]
+            self.set_players([self.player])
             mud_context.player = self.player
-            self.deferreds = state["deferreds"]
             self.game_clock = state["clock"]
+            self.deferreds = state["deferreds"]
+            if not isinstance(self.deferreds, TimerWheel):
+                # older savegames stored the deferreds in a heapq list
+                wheel = TimerWheel()
+                for deferred in self.deferreds:
+                    wheel.schedule(deferred, self.game_clock.clock)
+                self.deferreds = wheel
             self.heartbeat_objects = state["heartbeats"]
+            if not isinstance(self.heartbeat_objects, HeartbeatScheduler):
+                # older savegames stored the heartbeat objects in a set
+                scheduler = HeartbeatScheduler()
+                for obj in self.heartbeat_objects:
+                    scheduler.register(obj)
+                self.heartbeat_objects = scheduler
+            if self.zone_resets:
+                self.zone_resets.restore(state.get("zones", {}))
             self.config = state["config"]
             self.player.tell("Game loaded.")
             if self.config.display_gametime:
@@ -649,11 +1448,95 @@ class Driver(object):
             self.player.tell("\n")
             return self.player
 
+    def open_journal(self):
+        """
+        Recover the world from the last checkpoint and the command journal, if there is one,
+        and start a new checkpoint and journal.
+        """
+        from . import journal
+        if not self.pristine_world:
+            self.record_pristine_world()
+            if not self.pristine_world:
+                print("The command journal is disabled because the world can't be recorded.")
+                return
+        path = self.config.name.lower() + ".journal"
+        try:
+            with self.vfs.open_storage_read(path) as f:
+                records = journal.read_records(f)
+        except IOError:
+            records = []
+        checkpoint = self.load_checkpoint()
+        if checkpoint:
+            if records and records[0][0] == "checkpoint" and records[0][2] == checkpoint["journal"]:
+                random.seed(checkpoint["journal"])
+                diverged = journal.replay(self, records[1:])
+                if len(records) > 1:
+                    print("Recovered the world from the journal (%d records)." % (len(records) - 1))
+                if diverged:
+                    print("* the replay diverged from the journal %d times" % diverged)
+            # the players that were still connected have lost their connection
+            for player in self.all_players():
+                journal.remove_player(self, player)
+        self.journal = journal.Journal(self.vfs.open_storage_append(path))
+        self.checkpoint()
+
+    def journal_record(self, kind, *args):
+        """append a record to the command journal, stamped with the game clock"""
+        if self.journal:
+            self.journal.append(kind, self.game_clock.clock, *args)
+
+    def checkpoint(self):
+        """
+        Write a checkpoint of the world and truncate the journal.
+        The random generator is seeded with the checkpoint's id, so a replay of the journal is repeatable.
+        """
+        journal_id = random.SystemRandom().getrandbits(63)
+        self.journal.commit()
+        state = {
+            "version": self.config.version,
+            "journal": journal_id,
+            "players": self.all_players(),
+            "deferreds": self.deferreds,
+            "clock": self.game_clock,
+            "heartbeats": self.heartbeat_objects,
+            "zones": self.zone_resets.state() if self.zone_resets else {}
+        }
+        self.write_savegame(self.config.name.lower() + ".checkpoint", state)
+        # the journal of the previous checkpoint no longer matches, even if we crash right here
+        self.journal.reset("checkpoint", self.game_clock.clock, journal_id)
+        random.seed(journal_id)
+        self.next_checkpoint = time.time() + self.config.checkpoint_interval
+
+    def journal_tick(self):
+        """commit the journal records of this server tick, and make a checkpoint when it's time"""
+        if self.journal:
+            self.journal.commit()
+            if time.time() >= self.next_checkpoint:
+                self.checkpoint()
+
+    def load_checkpoint(self):
+        """restore the world from the checkpoint, returns its state or None if there is no usable checkpoint"""
+        try:
+            state = self.read_savegame(self.config.name.lower() + ".checkpoint")
+        except (IOError, EOFError, pickle.PickleError):
+            return None
+        if state["version"] != self.config.version:
+            return None
+        self.pristine_world.restore()
+        self.pristine_world.apply(state["world_changes"])
+        self.set_players(state["players"])
+        self.game_clock = state["clock"]
+        self.deferreds = state["deferreds"]
+        self.heartbeat_objects = state["heartbeats"]
+        if self.zone_resets:
+            self.zone_resets.restore(state.get("zones", {}))
+        return state
+
     def register_heartbeat(self, mudobj):
-        self.heartbeat_objects.add(mudobj)
+        self.heartbeat_objects.register(mudobj)
 
     def unregister_heartbeat(self, mudobj):
-        self.heartbeat_objects.discard(mudobj)
+        self.heartbeat_objects.unregister(mudobj)
 
     def register_exit(self, exit):
         if not exit.bound:
@@ -669,6 +1552,7 @@ class Driver(object):
         Also note that the deferred *always* gets a kwarg 'driver' set to the driver object
         (this makes it easy to register a new deferred on the driver without the need to
         access the global driver object)
+        Returns the Deferred, which you can use as a handle to cancel it again.
         """
         if isinstance(due, datetime.datetime):
             assert due >= self.game_clock.clock
@@ -688,8 +1572,8 @@ class Driver(object):
             # we skip the pickle check because it is extremely inefficient.....:
             # pickle.dumps(deferred, pickle.HIGHEST_PROTOCOL)  # make sure the data can be serialized
             with self.deferreds_lock:
-                heapq.heappush(self.deferreds, deferred)
-            return
+                self.deferreds.schedule(deferred, self.game_clock.clock)
+            return deferred
         raise ValueError("unknown callable on owner object")
 
     def after_player_action(self, callable, *vargs, **kwargs):
@@ -702,9 +1586,9 @@ class Driver(object):
         self.notification_queue.put(deferred)
 
     def remove_deferreds(self, owner):
+        """Cancel all deferreds of the given owner. Costs O(k) in the number of deferreds of that owner."""
         with self.deferreds_lock:
-            self.deferreds = [d for d in self.deferreds if d.owner is not owner]
-            heapq.heapify(self.deferreds)
+            self.deferreds.remove_owner(owner)
 
 
 if __name__ == "__main__":
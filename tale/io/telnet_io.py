@@ -0,0 +1,475 @@
+"""
+Telnet server input/output for mud mode.
+Requires Python 3.4 or newer (selectors).
+
+A single thread multiplexes all connections with the selectors module (epoll on Linux).
+Incoming data is scanned for telnet commands with bytes.find, so plain text is handled
+a whole chunk at a time. Output that the game writes (from any thread) is appended to the
+connection's send buffer; the server thread flushes it when the socket is writable.
+A client that stops reading gets its input suspended until its output has drained,
+and is disconnected if the backlog keeps growing.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import absolute_import, print_function, division, unicode_literals
+import errno
+import selectors
+import socket
+import threading
+import time
+from . import styleaware_wrapper, iobase
+from . import ansi_codes
+from .. import player as _player
+
+__all__ = ["TelnetServer", "TelnetIo"]
+
+
+# telnet protocol bytes
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+style_colors = {
+    "dim": ansi_codes.Style.DIM,
+    "normal": ansi_codes.Style.NORMAL,
+    "bright": ansi_codes.Style.BRIGHT,
+    "ul": ansi_codes.Style.UNDERLINED,
+    "rev": ansi_codes.Style.REVERSEVID,
+    "/": ansi_codes.Style.RESET_ALL,
+    "blink": ansi_codes.Style.BLINK,
+    "black": ansi_codes.Fore.BLACK,
+    "red": ansi_codes.Fore.RED,
+    "green": ansi_codes.Fore.GREEN,
+    "yellow": ansi_codes.Fore.YELLOW,
+    "blue": ansi_codes.Fore.BLUE,
+    "magenta": ansi_codes.Fore.MAGENTA,
+    "cyan": ansi_codes.Fore.CYAN,
+    "white": ansi_codes.Fore.WHITE,
+    "bg:black": ansi_codes.Back.BLACK,
+    "bg:red": ansi_codes.Back.RED,
+    "bg:green": ansi_codes.Back.GREEN,
+    "bg:yellow": ansi_codes.Back.YELLOW,
+    "bg:blue": ansi_codes.Back.BLUE,
+    "bg:magenta": ansi_codes.Back.MAGENTA,
+    "bg:cyan": ansi_codes.Back.CYAN,
+    "bg:white": ansi_codes.Back.WHITE,
+    "living": ansi_codes.Style.BRIGHT,
+    "player": ansi_codes.Style.BRIGHT,
+    "item": ansi_codes.Style.BRIGHT,
+    "exit": ansi_codes.Style.BRIGHT,
+    "location": ansi_codes.Style.BRIGHT,
+    "monospaced": "",
+    "/monospaced": ""
+}
+assert len(set(style_colors.keys()) ^ iobase.ALL_COLOR_TAGS) == 0, "mismatch in list of style tags"
+
+
+class SendBuffer(object):
+    """
+    Output buffer of a connection. Data is appended at the end of a bytearray and consumed
+    from a moving start offset; the consumed part is only cut off once it's big enough,
+    so a partial send doesn't copy the remaining data.
+    """
+    compact_size = 64 * 1024
+
+    def __init__(self):
+        self.data = bytearray()
+        self.start = 0
+
+    def __len__(self):
+        return len(self.data) - self.start
+
+    def append(self, data):
+        self.data.extend(data)
+
+    def send(self, sock):
+        """send as much as the socket accepts, returns the number of bytes sent"""
+        view = memoryview(self.data)[self.start:]
+        try:
+            sent = sock.send(view)
+        finally:
+            view.release()
+        self.consume(sent)
+        return sent
+
+    def consume(self, size):
+        self.start += size
+        if self.start >= len(self.data):
+            del self.data[:]
+            self.start = 0
+        elif self.start >= self.compact_size and self.start * 2 >= len(self.data):
+            del self.data[:self.start]
+            self.start = 0
+
+    def clear(self):
+        del self.data[:]
+        self.start = 0
+
+
+class TelnetConnection(object):
+    """
+    A single client connection. Input is processed in the server thread;
+    write() can be called from any thread.
+    """
+    recv_size = 16 * 1024
+    max_line_length = 4096
+    max_subnegotiation = 1024  # disconnect the client when a subnegotiation gets longer than this without its end
+    high_water = 64 * 1024     # stop reading input from the client above this much pending output
+    low_water = 16 * 1024      # resume reading once the output has drained to this
+    max_output = 1024 * 1024   # disconnect the client when its pending output gets this large
+
+    def __init__(self, server, sock, address):
+        self.server = server
+        self.sock = sock
+        self.address = address
+        self.player = None
+        self.outbuffer = SendBuffer()
+        self.lock = threading.Lock()
+        self.partial_command = b""   # incomplete telnet command at the end of the previous chunk
+        self.partial_line = bytearray()
+        self.reading = True     # False when input is suspended because of backpressure
+        self.closing = False    # close the connection as soon as the pending output has been sent
+        self.closed = False
+        self.connected = time.time()
+
+    def __repr__(self):
+        return "<TelnetConnection %s:%d>" % self.address[:2]
+
+    def write(self, data):
+        """queue data for sending to the client (any thread)"""
+        with self.lock:
+            if self.closing or self.closed:
+                return
+            was_empty = not self.outbuffer
+            self.outbuffer.append(data)
+            if len(self.outbuffer) > self.max_output:
+                # the client isn't reading its output; it's no use to keep buffering it
+                self.outbuffer.clear()
+                self.closing = True
+                was_empty = True
+        if was_empty:
+            self.server.wakeup(self)
+
+    def close(self):
+        """close the connection after the pending output has been sent (any thread)"""
+        with self.lock:
+            if self.closing or self.closed:
+                return
+            self.closing = True
+        self.server.wakeup(self)
+
+    def flush(self):
+        """(server thread) send pending output, returns True if all of it has been sent"""
+        with self.lock:
+            while self.outbuffer:
+                try:
+                    if not self.outbuffer.send(self.sock):
+                        return False
+                except socket.error as x:
+                    if x.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return False
+                    raise
+            return True
+
+    def wants_read(self):
+        """(server thread) update the backpressure state and return if input should be read"""
+        pending = len(self.outbuffer)
+        if self.reading and pending > self.high_water:
+            self.reading = False
+        elif not self.reading and pending <= self.low_water:
+            self.reading = True
+        return self.reading and not self.closing
+
+    def received(self, data):
+        """
+        (server thread) process a chunk of incoming bytes.
+        Telnet commands are handled, complete lines are returned as a list of strings.
+        """
+        if self.partial_command:
+            data = self.partial_command + data
+            self.partial_command = b""
+        text = data
+        if data.find(b"\xff") >= 0:
+            text = self.process_telnet_commands(data)
+        lines = self.split_lines(text)
+        if len(self.partial_command) > self.max_subnegotiation:
+            # it isn't going to end, don't keep buffering it
+            self.partial_command = b""
+            self.close()
+        return lines
+
+    def process_telnet_commands(self, data):
+        text = bytearray()
+        pos = 0
+        size = len(data)
+        while pos < size:
+            iac = data.find(b"\xff", pos)
+            if iac < 0:
+                text += data[pos:]
+                break
+            text += data[pos:iac]
+            if iac + 1 >= size:
+                self.partial_command = data[iac:]
+                break
+            command = data[iac + 1]
+            if command == IAC:
+                text.append(IAC)    # escaped 255 data byte
+                pos = iac + 2
+            elif command in (DO, DONT, WILL, WONT):
+                if iac + 2 >= size:
+                    self.partial_command = data[iac:]
+                    break
+                option = data[iac + 2]
+                # we don't support any options: refuse everything the client offers or asks
+                if command == DO:
+                    self.write(bytes(bytearray([IAC, WONT, option])))
+                elif command == WILL:
+                    self.write(bytes(bytearray([IAC, DONT, option])))
+                pos = iac + 3
+            elif command == SB:
+                end = data.find(b"\xff\xf0", iac + 2)
+                if end < 0:
+                    self.partial_command = data[iac:]
+                    break
+                pos = end + 2    # subnegotiation is ignored
+            else:
+                pos = iac + 2    # NOP, GA, AYT, IP etc. are ignored
+        return bytes(text)
+
+    def split_lines(self, text):
+        lines = []
+        if text.find(b"\n") < 0 and text.find(b"\r") < 0:
+            self.partial_line += text
+        else:
+            text = bytes(self.partial_line) + text
+            text = text.replace(b"\r\n", b"\n").replace(b"\r\x00", b"\n").replace(b"\r", b"\n")
+            parts = text.split(b"\n")
+            self.partial_line = bytearray(parts.pop())
+            lines = [part.decode("utf-8", "replace").strip() for part in parts]
+        if len(self.partial_line) > self.max_line_length:
+            del self.partial_line[:]   # refuse absurdly long lines
+        return lines
+
+
+class TelnetServer(object):
+    """
+    The telnet server. Its mainloop runs in the main thread (like the other I/O adapters);
+    every connection gets its own Player and TelnetIo, and a session in the driver's async core.
+    """
+    select_timeout = 1.0
+
+    def __init__(self, driver, config, host, port):
+        self.driver = driver
+        self.config = config
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        # self-pipe to wake up the select when another thread queued output or closed a connection
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+        self.wakeup_lock = threading.Lock()
+        self.pending = set()    # connections whose selector registration needs updating
+        self.connections = set()
+        self.stop_main_loop = False
+
+    def wakeup(self, connection):
+        """(any thread) make the server thread look at the connection's state"""
+        with self.wakeup_lock:
+            notify = not self.pending
+            self.pending.add(connection)
+        if notify:
+            try:
+                self.wakeup_writer.send(b"!")
+            except socket.error:
+                pass    # pipe is full, the server thread will wake up anyway
+
+    def mainloop(self):
+        """Main event loop of the telnet server"""
+        try:
+            while not self.stop_main_loop:
+                for key, events in self.selector.select(self.select_timeout):
+                    if key.fileobj is self.listener:
+                        self.accept()
+                    elif key.fileobj is self.wakeup_reader:
+                        self.handle_wakeup()
+                    else:
+                        connection = key.data
+                        if events & selectors.EVENT_WRITE and not connection.closed:
+                            self.handle_write(connection)
+                        if events & selectors.EVENT_READ and not connection.closed:
+                            self.handle_read(connection)
+        except KeyboardInterrupt:
+            self.driver.stop_driver()
+        finally:
+            for connection in list(self.connections):
+                self.drop(connection)
+            self.selector.close()
+            self.listener.close()
+
+    def accept(self):
+        while True:
+            try:
+                sock, address = self.listener.accept()
+            except socket.error as x:
+                if x.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = TelnetConnection(self, sock, address)
+            self.connections.add(connection)
+            self.selector.register(sock, selectors.EVENT_READ, connection)
+            self.connect_player(connection)
+
+    def connect_player(self, connection):
+        player = _player.Player("<connecting>", "n", "elemental", "This player is still connecting.")
+        io = TelnetIo(self.config, connection)
+        io.output_line_delay = 0
+        player.io = io
+        io.switch_player(player)
+        connection.player = player
+        self.driver.core.add_session(player)
+
+    def handle_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+        with self.wakeup_lock:
+            pending = self.pending
+            self.pending = set()
+        for connection in pending:
+            if not connection.closed:
+                self.handle_write(connection)
+
+    def handle_read(self, connection):
+        try:
+            data = connection.sock.recv(connection.recv_size)
+        except socket.error as x:
+            if x.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b""
+        if not data:
+            self.drop(connection)   # client disconnected
+            return
+        for line in connection.received(data):
+            connection.player.store_input_line(line)
+        self.update_interest(connection)
+
+    def handle_write(self, connection):
+        try:
+            done = connection.flush()
+        except socket.error:
+            self.drop(connection)
+            return
+        if done and connection.closing:
+            self.drop(connection)
+        else:
+            self.update_interest(connection)
+
+    def update_interest(self, connection):
+        events = 0
+        if connection.wants_read():
+            events |= selectors.EVENT_READ
+        if connection.outbuffer:
+            events |= selectors.EVENT_WRITE
+        if not events:
+            events = selectors.EVENT_READ   # keep watching for the client hanging up
+        if self.selector.get_key(connection.sock).events != events:
+            self.selector.modify(connection.sock, events, connection)
+
+    def drop(self, connection):
+        """close the connection and take the player out of the game"""
+        if connection.closed:
+            return
+        with connection.lock:
+            connection.closed = True
+            connection.outbuffer.clear()
+        self.connections.discard(connection)
+        self.selector.unregister(connection.sock)
+        connection.sock.close()
+        if connection.player:
+            self.driver.core.disconnect(connection.player)
+
+
+class TelnetIo(iobase.IoAdapterBase):
+    """
+    I/O adapter for a single telnet connection.
+    """
+    def __init__(self, config, connection):
+        super(TelnetIo, self).__init__(config)
+        self.connection = connection
+        self.stop_main_loop = False
+
+    def mainloop(self):
+        """the telnet server runs the event loop for all connections, this just hands off to it"""
+        self.connection.server.mainloop()
+
+    def destroy(self):
+        self.connection.close()
+
+    def critical_error(self, message="Critical Error. Shutting down."):
+        super(TelnetIo, self).critical_error(message)
+        self._write(message + "\n")
+        self.connection.close()
+
+    def clear_screen(self):
+        self._write("\033[1;1H\033[2J")
+
+    def render_output(self, paragraphs, **params):
+        """
+        Render (format) the given paragraphs to a text representation.
+        It doesn't output anything to the screen yet; it just returns the text string.
+        Any style-tags are still embedded in the text.
+        This telnet-implementation expects 2 extra parameters: "indent" and "width".
+        """
+        if not paragraphs:
+            return None
+        indent = " " * params["indent"]
+        wrapper = styleaware_wrapper.StyleTagsAwareTextWrapper(width=params["width"], fix_sentence_endings=True, initial_indent=indent, subsequent_indent=indent)
+        output = []
+        for txt, formatted in paragraphs:
+            if formatted:
+                txt = wrapper.fill(txt) + "\n"
+            else:
+                txt = indent + ("\n" + indent).join(txt.splitlines()) + "\n"
+            output.append(txt)
+        return self.smartquotes("".join(output))
+
+    def output(self, *lines):
+        """Write some text to the client. Takes care of style tags that are embedded."""
+        self._write("".join(self._apply_style(line) + "\n" for line in lines))
+
+    def output_no_newline(self, text):
+        """Like output, but just writes a single line, without end-of-line."""
+        self._write(self._apply_style(text))
+
+    def write_input_prompt(self):
+        """write the input prompt '>>'"""
+        self._write(self._apply_style("\n<dim>>></> "))
+
+    def _write(self, text):
+        self.connection.write(text.replace("\n", "\r\n").encode("utf-8"))
+
+    def _apply_style(self, line):
+        """Convert style tags to ansi escape sequences"""
+        if "<" not in line:
+            return line
+        elif self.do_styles:
+            for tag in style_colors:
+                line = line.replace("<%s>" % tag, style_colors[tag])
+            return line
+        else:
+            return iobase.strip_text_styles(line)
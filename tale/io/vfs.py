@@ -21,6 +21,58 @@ class VfsError(IOError):
     pass
 
 
+class AtomicFileWriter(object):
+    """
+    Context manager that writes a file atomically: the data goes to a temporary file next to it,
+    which is synced to disk and then renamed over the original file. If anything goes wrong,
+    the temporary file is removed and the original file stays as it was.
+    """
+    def __init__(self, path, mode="wb"):
+        self.path = path
+        self.temp_path = "%s.%d.tmp" % (path, os.getpid())
+        self.file = open(self.temp_path, mode)
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self._replace()
+                return
+            except Exception:
+                self._discard()
+                raise
+        self._discard()
+
+    def _discard(self):
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def _replace(self):
+        if hasattr(os, "replace"):
+            os.replace(self.temp_path, self.path)
+        else:
+            if os.name == "nt" and os.path.exists(self.path):
+                os.remove(self.path)    # rename doesn't overwrite on windows
+            os.rename(self.temp_path, self.path)
+        try:
+            # make sure the rename itself is on disk as well
+            fd = os.open(os.path.dirname(self.path) or ".", os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass   # not possible on all platforms
+
+
 class VirtualFileSystem(object):
     """
     Simple filesystem abstraction.
@@ -82,6 +134,31 @@ class VirtualFileSystem(object):
         with open(path, "rb") as f:
             return f.read()
 
+    def open_storage_read(self, path):
+        """open a file from the user data storage for (binary) reading"""
+        self.validate_path(path)
+        path = os.path.join(*path.split("/"))   # convert to platform path separator
+        return open(self.get_userdata_dir(path), "rb")
+
+    def open_storage_write(self, path):
+        """
+        Open a file in the user data storage for (binary) writing, to be used in a with statement.
+        The file is replaced atomically when the with block ends without errors.
+        """
+        self.validate_path(path)
+        path = os.path.join(*path.split("/"))   # convert to platform path separator
+        path = self.get_userdata_dir(path)
+        self.makedirs(path)
+        return AtomicFileWriter(path)
+
+    def open_storage_append(self, path):
+        """open a file in the user data storage for (binary) appending"""
+        self.validate_path(path)
+        path = os.path.join(*path.split("/"))   # convert to platform path separator
+        path = self.get_userdata_dir(path)
+        self.makedirs(path)
+        return open(path, "ab")
+
     def write_to_storage(self, path, data):
         with self.open_write(path, mode="wb") as f:
             f.write(data)
@@ -0,0 +1,206 @@
+"""
+Write-ahead journal of the things that happen in the world in mud mode,
+so that the world can be recovered after a crash.
+
+Every accepted player command (with the answers to any prompts it asked), every login
+and logout, every server tick and every deferred that fired is appended to the journal,
+stamped with the game clock. The records are collected in memory and written to disk
+together once per server tick, with a single fsync (group commit).
+Once in a while the driver writes a checkpoint of the world, which truncates the journal.
+The random generator is seeded at every checkpoint, so that replaying the journal on top
+of the checkpoint after a restart does the same things all over again.
+(A command that waits for an answer to a prompt lets other commands run meanwhile;
+the replay runs it in one go, with the answers that were journaled with it.)
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import os
+import pickle
+import struct
+import threading
+import zlib
+from . import errors
+from . import player as _player
+from . import util
+from .io.iobase import IoAdapterBase
+
+try:
+    from threading import _Event as Event   # on Python 2, threading.Event is a factory function
+except ImportError:
+    from threading import Event
+
+
+RECORD_HEADER = struct.Struct(">II")   # length and crc32 of the pickled record
+PICKLE_PROTOCOL = 2
+
+
+class Journal(object):
+    """Append-only file of records. Appended records are only written when they're committed."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = []
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def append(self, *record):
+        data = pickle.dumps(record, PICKLE_PROTOCOL)
+        data = RECORD_HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff) + data
+        with self.lock:
+            self.pending.append(data)
+
+    def commit(self):
+        """write the pending records to disk, all in one go"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if pending:
+                self.stream.write(b"".join(pending))
+                self.stream.flush()
+                os.fsync(self.stream.fileno())
+                self.commits += 1
+
+    def reset(self, *header):
+        """truncate the journal and start it with the given header record"""
+        with self.lock:
+            self.pending = []
+            self.stream.seek(0)
+            self.stream.truncate()
+        self.append(*header)
+        self.commit()
+
+    def close(self):
+        self.commit()
+        self.stream.close()
+
+
+def read_records(stream):
+    """read all records from the journal stream, up to a record that was only partially written"""
+    records = []
+    while True:
+        header = stream.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return records
+        length, crc = RECORD_HEADER.unpack(header)
+        data = stream.read(length)
+        if len(data) < length or zlib.crc32(data) & 0xffffffff != crc:
+            return records
+        records.append(pickle.loads(data))
+
+
+class ReplayIo(IoAdapterBase):
+    """I/O adapter of the players while their commands are being replayed: all output is discarded"""
+    def render_output(self, paragraphs, **params):
+        return None
+
+    def output(self, *lines):
+        pass
+
+    def output_no_newline(self, text):
+        pass
+
+
+class ReplayInput(Event):
+    """Input event of a replaying player. A prompt that has no journaled answer ends the session."""
+    def wait(self, timeout=None):
+        if not self.is_set():
+            raise errors.SessionExit()
+        return True
+
+
+class Recorder(object):
+    """Stands in for the journal during a replay, to see which deferreds fire."""
+    def __init__(self):
+        self.deferreds = []
+
+    def append(self, kind, clock, *args):
+        if kind == "deferred":
+            self.deferreds.append(args[0])
+
+
+def attach_replay_io(driver, player):
+    player.io = ReplayIo(driver.config)
+    player.io.switch_player(player)
+    player.input_is_available = ReplayInput()
+
+
+def feed(player, lines):
+    for line in lines:
+        player.store_input_line(line)
+
+
+def remove_player(driver, player):
+    driver.unregister_player(player)
+    ctx = util.Context(driver=driver)
+    ctx.lock()
+    player.destroy(ctx)
+
+
+def replay(driver, records):
+    """
+    Do everything in the journal records again, on the world as restored from the checkpoint.
+    Returns the number of times the replay did something else than the journal says.
+    """
+    recorder = Recorder()
+    expected_deferreds = []
+    diverged = 0
+    journal, driver.journal = driver.journal, recorder
+    try:
+        for player in driver.all_players():
+            attach_replay_io(driver, player)
+        for record in records:
+            kind, clock = record[0], record[1]
+            if kind == "tick":
+                if driver.game_clock.clock != clock:
+                    diverged += 1
+                    driver.game_clock.clock = clock
+                driver.server_tick()
+            elif kind == "deferred":
+                expected_deferreds.append(record[2])
+            elif kind == "login":
+                name, lines = record[2], record[3]
+                player = _player.Player("<connecting>", "n", "elemental", "This player is still connecting.")
+                attach_replay_io(driver, player)
+                driver.register_player(player)
+                # the passwords aren't journaled, but the player accounts were already created anyway
+                account = driver.player_store.find(name) if driver.player_store else None
+                try:
+                    if account:
+                        driver.login_account(player, account)
+                    else:
+                        feed(player, lines)
+                        driver.print_game_intro(player)
+                        driver.create_player(player)
+                    driver.show_motd(player)
+                    player.look(short=False)
+                except Exception:
+                    remove_player(driver, player)
+                    diverged += 1
+                    continue
+                if player.name != name:
+                    diverged += 1
+            elif kind == "command":
+                player = driver.search_player(record[2])
+                if not player:
+                    diverged += 1
+                    continue
+                feed(player, record[3])
+                try:
+                    driver.handle_player_command(player, player.get_next_input())
+                except errors.SessionExit:
+                    remove_player(driver, player)
+                except errors.StoryCompleted:
+                    pass
+                except Exception:
+                    diverged += 1
+                driver.process_notifications()
+            elif kind == "logout":
+                player = driver.search_player(record[2])
+                if player:
+                    remove_player(driver, player)
+    finally:
+        driver.journal = journal
+    diverged += sum(1 for fired, expected in zip(recorder.deferreds, expected_deferreds) if fired != expected)
+    diverged += abs(len(recorder.deferreds) - len(expected_deferreds))
+    return diverged
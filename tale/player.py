@@ -25,6 +25,7 @@ class Player(base.Living, pubsub.Listener):
     Player controlled entity.
     Has a Soul for social interaction.
     """
+    spawnable = False
     def __init__(self, name, gender, race="human", description=None, short_description=None):
         title = lang.capital(name)
         super(Player, self).__init__(name, gender, race, title, description, short_description)
@@ -49,6 +50,7 @@ class Player(base.Living, pubsub.Listener):
         self._output = TextBuffer()
         self.io = None  # will be set to appropriate I/O adapter by the driver
         self._previous_parsed = None
+        self.input_log = None   # when set to a list, the input lines that are taken are recorded in it (for the command journal)
 
     def __repr__(self):
         return "<%s '%s' @ 0x%x, privs:%s>" % (self.__class__.__name__,
@@ -57,7 +59,7 @@ class Player(base.Living, pubsub.Listener):
     def __getstate__(self):
         state = super(Player, self).__getstate__()
         # skip all non-serializable things (or things that need to be reinitialized)
-        for name in ["_input", "_output", "input_is_available", "transcript", "io"]:
+        for name in ["_input", "_output", "input_is_available", "transcript", "io", "input_log"]:
             del state[name]
         return state
 
@@ -154,7 +156,7 @@ class Player(base.Living, pubsub.Listener):
         return formatted or None
 
     def write_output(self):
-        """print any buffered output to the player's screen"""
+        """print any buffered output to the player's screen, returns True if there was any"""
         output = self.get_output()
         if output:
             # (re)set a few io parameters because they can be changed dynamically
@@ -166,6 +168,8 @@ class Player(base.Living, pubsub.Listener):
                     self.io.output_delay()
             else:
                 self.io.output(output.rstrip())
+            return True
+        return False
 
     def input(self, prompt=None):
         """
@@ -245,7 +249,10 @@ class Player(base.Living, pubsub.Listener):
             result = self._input.get_nowait()
             if self._input.qsize()==0:
                 self.input_is_available.clear()
-            return result.strip()
+            result = result.strip()
+            if self.input_log is not None:
+                self.input_log.append(result)
+            return result
         except queue.Empty:
             return None
 
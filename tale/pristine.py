@@ -0,0 +1,180 @@
+"""
+Delta savegames: the state of the world as it was built by the zones, right after startup.
+
+Every object that is reachable from the zone modules gets a stable id that is derived
+from the path by which it was found (module attribute, then the attributes and containers
+of the objects found before it), so the same sources always produce the same ids.
+A savegame then only has to store the attributes of those objects that differ from
+the recorded pristine state; references to world objects are pickled as their id.
+Loading resets the world objects back to their pristine state and applies the changes.
+With dirty tracking, only the world objects that have been marked dirty since startup
+are compared with their pristine state, instead of all of them (so changes made in place
+have to be marked with mark_dirty, see base.DirtyTracking).
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import copy
+import pickle
+from . import base
+from . import player
+
+
+def _set_order(obj):
+    """sort key for the members of a set, which have no stable iteration order of their own"""
+    if isinstance(obj, base.MudObject):
+        return (1, type(obj).__name__, obj.name, getattr(obj, "title", "") or "",
+                getattr(obj, "description", "") or "", getattr(obj, "short_description", "") or "")
+    return (0, type(obj).__name__, repr(obj))
+
+
+def _walk(value, path, seen):
+    """yields (path, mudobject) for the mud objects in the value, looking inside containers"""
+    if isinstance(value, base.MudObject):
+        yield path, value
+    elif isinstance(value, (dict, list, tuple, set, frozenset)):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        if isinstance(value, dict):
+            for key in sorted(value, key=lambda k: (type(k).__name__, repr(k))):
+                for found in _walk(value[key], "%s[%s]" % (path, key), seen):
+                    yield found
+        elif isinstance(value, (list, tuple)):
+            for index, member in enumerate(value):
+                for found in _walk(member, "%s[%d]" % (path, index), seen):
+                    yield found
+        else:
+            for index, member in enumerate(sorted(value, key=_set_order)):
+                for found in _walk(member, "%s{%d}" % (path, index), seen):
+                    yield found
+
+
+class _TouchedPaths(object):
+    """takes the ids of the world objects that are marked dirty; other objects aren't kept"""
+    __slots__ = ["world"]
+
+    def __init__(self, world):
+        self.world = world
+
+    def add(self, obj):
+        path = self.world.ids.get(id(obj))
+        if path:
+            self.world.touched.add(path)
+
+
+class PristineWorld(object):
+    """
+    The recorded initial state of the world objects found in the given namespaces,
+    a list of (name, dict) such as the zone modules and their variables.
+    """
+    def __init__(self, namespaces, track_dirty=False):
+        self.objects = {}   # id -> object
+        self.ids = {}       # id(object) -> id
+        self.dirty = None
+        self.touched = set()   # ids of the objects that have been dirty since startup (when tracking)
+        order = []
+        for name, namespace in sorted(namespaces, key=lambda item: item[0]):
+            for attr in sorted(namespace):
+                if not attr.startswith("__"):
+                    for path, obj in _walk(namespace[attr], "%s:%s" % (name, attr), set()):
+                        self._add(path, obj, order)
+        for obj in order:   # grows while we go: breadth-first through the attributes of the objects
+            for attr in sorted(vars(obj)):
+                for path, found in _walk(vars(obj)[attr], "%s.%s" % (self.ids[id(obj)], attr), set()):
+                    self._add(path, found, order)
+        self.memo = {id(obj): obj for obj in order}   # deep copies share the world objects rather than copying them
+        self.state = self._copy({path: vars(obj) for path, obj in self.objects.items()})
+        if track_dirty:
+            self.dirty = _TouchedPaths(self)
+            base.DirtyTracking.track(self.dirty)
+
+    def stop_tracking(self):
+        if self.dirty is not None:
+            base.DirtyTracking.untrack(self.dirty)
+            self.dirty = None
+
+    def _candidates(self):
+        """ids of the objects that may have changed"""
+        if self.dirty is None:
+            return self.objects
+        return self.touched
+
+    def _add(self, path, obj, order):
+        if id(obj) not in self.ids and not isinstance(obj, player.Player):
+            self.objects[path] = obj
+            self.ids[id(obj)] = path
+            order.append(obj)
+
+    def _copy(self, value):
+        return copy.deepcopy(value, dict(self.memo))
+
+    @staticmethod
+    def _same(current, pristine):
+        if current is pristine:
+            return True
+        try:
+            return type(current) is type(pristine) and bool(current == pristine)
+        except Exception:
+            return False
+
+    def changes(self):
+        """the changed objects since startup: {id: (changed attributes dict, list of deleted attributes)}"""
+        result = {}
+        for path in self._candidates():
+            obj = self.objects[path]
+            current = vars(obj)
+            pristine = self.state[path]
+            changed = {attr: value for attr, value in current.items() if attr not in pristine or not self._same(value, pristine[attr])}
+            deleted = [attr for attr in pristine if attr not in current]
+            if changed or deleted:
+                result[path] = (changed, deleted)
+        return result
+
+    def restore(self):
+        """reset the world objects that have changed back to their pristine state"""
+        for path in self.changes():
+            state = vars(self.objects[path])
+            state.clear()
+            state.update(self._copy(self.state[path]))
+        self.touched.clear()
+
+    def apply(self, changes):
+        """apply the changes from a savegame (on a restored world)"""
+        self.touched.update(changes)
+        for path, (changed, deleted) in changes.items():
+            state = vars(self.objects[path])
+            for attr in deleted:
+                state.pop(attr, None)
+            state.update(changed)
+
+    def pickler(self, stream, protocol=pickle.HIGHEST_PROTOCOL):
+        """a pickler that writes references to the world objects as their id"""
+        return WorldPickler(stream, protocol, self)
+
+    def unpickler(self, stream):
+        """an unpickler that resolves the references to world objects"""
+        return WorldUnpickler(stream, self)
+
+
+class WorldPickler(pickle.Pickler):
+    def __init__(self, stream, protocol, world):
+        pickle.Pickler.__init__(self, stream, protocol)
+        self.world = world
+
+    def persistent_id(self, obj):
+        return self.world.ids.get(id(obj))
+
+
+class WorldUnpickler(pickle.Unpickler):
+    def __init__(self, stream, world):
+        pickle.Unpickler.__init__(self, stream)
+        self.world = world
+
+    def persistent_load(self, pid):
+        try:
+            return self.world.objects[pid]
+        except KeyError:
+            raise pickle.UnpicklingError("savegame refers to unknown world object " + pid)
@@ -1,31 +1,129 @@
 """
 Simple synchronous Pubsub signaling.
 Uses weakrefs to not needlessly lock subscribers/topics in memory.
+Sending something to a topic without subscribers costs next to nothing, so objects
+can keep the handle of their topic (see get_wiretap) and send to it all the time.
+A topic only lives as long as someone holds on to it: the owner that keeps its
+handle, or a subscriber. The topics that a subscriber is subscribed to are
+remembered per subscriber, so it can be unsubscribed from all of them at once.
+
+Events are delivered to the subscribers right away, inside whoever sends them.
+Optionally, with a Dispatcher (see set_dispatcher), sending only puts the event in
+the buffer of the topic and the events are delivered later, in batches.
 
 'Tale' mud driver, mudlib and interactive fiction framework
 Copyright by Irmen de Jong (irmen@razorvine.net)
 """
 
+import collections
 import weakref
 import threading
 
 
-__all__=["topic", "unsubscribe_all", "Listener"]
+__all__=["topic", "unsubscribe_all", "Listener", "Dispatcher", "set_dispatcher"]
 
-all_topics = {}
+all_topics = weakref.WeakValueDictionary()    # name -> topic
+subscriptions = weakref.WeakKeyDictionary()   # subscriber -> set of topics (this keeps them alive)
+dispatcher = None   # the Dispatcher for deferred delivery of the events, None = deliver them right away
+_topics_lock = threading.Lock()
+_no_results = ()    # shared, sending to a topic without subscribers must not allocate anything
 
 def topic(name):
     """Create a topic object (singleton). Name can be a string or a sequence type."""
-    with threading.Lock():
-        if name in all_topics:
-            return all_topics[name]
-        instance = all_topics[name] = __Topic(name)
-        return instance
+    instance = all_topics.get(name)
+    if instance is None:
+        with _topics_lock:
+            # check again, another thread may have created it in the meantime
+            instance = all_topics.get(name)
+            if instance is None:
+                instance = all_topics[name] = __Topic(name)
+    return instance
 
 def unsubscribe_all(subscriber):
     """unsubscribe the given subscriber object from all topics that it may have been subscribed to."""
-    for topic in all_topics.values():
-        topic.unsubscribe(subscriber)
+    with _topics_lock:
+        topics = subscriptions.pop(subscriber, ())
+    subber_ref = weakref.ref(subscriber)
+    for topic in topics:
+        topic.subscribers.discard(subber_ref)
+
+
+def set_dispatcher(new_dispatcher):
+    """
+    Switch to deferred delivery with the given Dispatcher, or back to delivery
+    right away with None. The events that are still waiting are delivered first.
+    """
+    global dispatcher
+    old_dispatcher, dispatcher = dispatcher, new_dispatcher
+    if old_dispatcher:
+        while old_dispatcher.drain():
+            pass
+
+
+class Dispatcher(object):
+    """
+    Deferred delivery of the events. Sending an event only puts it in the ring buffer of its topic,
+    and drain delivers the waiting events in batches, topic by topic (the driver does this every server tick).
+    When a buffer is full, the policy decides what is lost: the oldest waiting event ("drop-oldest"),
+    or the new one ("drop-newest"). With "coalesce", an event that is the same as the last one
+    that's waiting in the buffer isn't added again, and a full buffer drops the oldest event.
+    At most batch_size events are delivered per drain, the others wait for the next one,
+    so a slow subscriber (or subscribers that keep sending each other events) can't hold up the game.
+    """
+    policies = ("drop-oldest", "drop-newest", "coalesce")
+
+    def __init__(self, buffer_size=100, policy="drop-oldest", batch_size=1000):
+        if policy not in self.policies:
+            raise ValueError("invalid pubsub policy: " + policy)
+        assert buffer_size > 0 and batch_size > 0
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.buffers = {}   # topic -> ring buffer of the events waiting for delivery
+        self.pending = collections.deque()   # the topics that have events waiting, in turn
+        self.lock = threading.Lock()
+        self.delivered = self.dropped = self.coalesced = 0
+
+    def queue(self, topic, event):
+        with self.lock:
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                buffer = self.buffers[topic] = collections.deque(maxlen=self.buffer_size)
+                self.pending.append(topic)
+            elif self.policy == "coalesce" and buffer and buffer[-1] == event:
+                self.coalesced += 1
+                return
+            if len(buffer) == self.buffer_size:
+                self.dropped += 1
+                if self.policy == "drop-newest":
+                    return
+            buffer.append(event)   # the deque drops the oldest event if it's full
+
+    def waiting(self):
+        """the number of events that are waiting to be delivered"""
+        with self.lock:
+            return sum(len(buffer) for buffer in self.buffers.values())
+
+    def drain(self):
+        """deliver a batch of the waiting events, returns the number of events delivered"""
+        delivered = 0
+        while delivered < self.batch_size:
+            with self.lock:
+                if not self.pending:
+                    break
+                topic = self.pending.popleft()
+                buffer = self.buffers[topic]
+                count = min(len(buffer), self.batch_size - delivered)
+                events = [buffer.popleft() for _ in range(count)]
+                if buffer:
+                    self.pending.append(topic)   # the rest of them waits for its next turn
+                else:
+                    del self.buffers[topic]
+            delivered += count
+            self.delivered += count
+            for event in events:
+                topic.deliver(event)
+        return delivered
 
 
 class Listener(object):
@@ -36,6 +134,8 @@ class Listener(object):
 
 
 class __Topic(object):
+    __slots__ = ["name", "subscribers", "__weakref__"]
+
     def __init__(self, name):
         self.name = name
         self.subscribers = set()
@@ -43,15 +143,44 @@ class __Topic(object):
     def subscribe(self, subscriber):
         if not isinstance(subscriber, Listener):
             raise TypeError("subscriber needs to be a Listener")
-        self.subscribers.add(weakref.ref(subscriber))
+        with _topics_lock:
+            self.subscribers.add(weakref.ref(subscriber))
+            subscriptions.setdefault(subscriber, set()).add(self)
 
     def unsubscribe(self, subscriber):
-        self.subscribers.discard(weakref.ref(subscriber))
+        with _topics_lock:
+            self.subscribers.discard(weakref.ref(subscriber))
+            topics = subscriptions.get(subscriber)
+            if topics:
+                topics.discard(self)
+                if not topics:
+                    del subscriptions[subscriber]
 
     def send(self, event):
+        """
+        Sends the event to the subscribers, returns their results.
+        With deferred delivery, the event is only queued and there are no results.
+        No results is an empty tuple rather than a list.
+        """
+        if not self.subscribers:
+            return _no_results
+        if dispatcher:
+            dispatcher.queue(self, event)
+            return _no_results
+        return self.deliver(event)
+
+    def deliver(self, event):
         results = []
-        for subber_ref in self.subscribers:
+        dead = None
+        # iterate over a copy, a subscriber may (un)subscribe while it handles the event
+        for subber_ref in tuple(self.subscribers):
             subber=subber_ref()
-            if subber is not None:
+            if subber is None:
+                dead = dead or []
+                dead.append(subber_ref)   # it's gone, and with it its subscriptions
+            else:
                 results.append(subber.pubsub_event(self.name, event))
+        if dead:
+            with _topics_lock:
+                self.subscribers.difference_update(dead)
         return results
@@ -0,0 +1,208 @@
+"""
+Startup cache of the story's world.
+
+After the zones have been imported and the exits are bound, the zone modules' contents
+(the whole graph of locations, exits, items and livings) are pickled into the user data
+storage together with the heartbeats and deferreds that were registered while building them.
+On the next start, when none of the story's source files have changed, the zone modules are
+restored from that snapshot instead of executing them again.
+The restored objects share their texts through the static text table (see base.TextTable)
+just like the ones that are built from the sources.
+
+Classes and functions that are defined in the zone modules themselves are restored by running
+only the imports and the class and function definitions of those modules, and not the rest of
+the code that builds the world. A world that refers to zone code that is made in another way
+(for instance a class created by calling type()) can't be cached.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import ast
+import hashlib
+import io
+import os
+import pickle
+import pickletools
+import sys
+import types
+from . import __version__ as tale_version_str
+from . import base
+
+
+PICKLE_PROTOCOL = 2     # this protocol refers to classes by a plain GLOBAL opcode, which makes them easy to check
+TALE_PATH = os.path.dirname(os.path.abspath(__file__))    # the library's own sources, the world is built with them too
+DEFINITIONS = tuple(getattr(ast, name) for name in ("Import", "ImportFrom", "ClassDef", "FunctionDef", "AsyncFunctionDef") if hasattr(ast, name))
+
+
+class ModuleReference(object):
+    """stands in for a module object in a pickled zone module namespace"""
+    def __init__(self, name):
+        self.name = name
+
+    def resolve(self):
+        if self.name not in sys.modules:
+            __import__(self.name)
+        return sys.modules[self.name]
+
+
+def zone_module_names():
+    """the names of the zones package and its loaded submodules, package first"""
+    return sorted(name for name, module in sys.modules.items() if module and (name == "zones" or name.startswith("zones.")))
+
+
+def source_key(story_config, server_mode, game_path="."):
+    """
+    The key that identifies the world that the story's sources build:
+    library and python version, story config, and the modification times and sizes
+    of all source files of the story and of the library.
+    """
+    sources = source_files(game_path) + source_files(TALE_PATH)
+    config = sorted((key, repr(value)) for key, value in story_config.items())
+    text = repr((tale_version_str, sys.version_info[:2], server_mode, config, sources))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def source_files(path):
+    """path, modification time and size of all python source files in the directory tree"""
+    sources = []
+    for directory, dirnames, filenames in os.walk(path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "__pycache__")
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                stat = os.stat(os.path.join(directory, filename))
+                sources.append("%s:%d:%d" % (os.path.join(directory, filename), int(stat.st_mtime), stat.st_size))
+    return sources
+
+
+def module_source(module):
+    """the python source file of the module"""
+    path = module.__file__
+    if path.endswith((".pyc", ".pyo")):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+
+def zone_definitions(path):
+    """
+    Compile just the imports and the class and function definitions of a zone module's source,
+    leaving out the code that builds the world.
+    Returns the code, the names of the classes and functions, and the names that are imported.
+    """
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+    tree.body = [node for node in tree.body if isinstance(node, DEFINITIONS)]
+    names = set(node.name for node in tree.body if hasattr(node, "name"))
+    imported = set()
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imported.update(alias.asname or alias.name.split(".")[0] for alias in node.names if alias.name != "*")
+    return compile(tree, path, "exec", dont_inherit=True), names, imported
+
+
+def references_undefined_zone_code(data, defined):
+    """does the pickle refer to a class or function of the zones package that isn't defined by a plain class or def statement?"""
+    for opcode, arg, pos in pickletools.genops(data):
+        if opcode.name == "GLOBAL":
+            module, name = arg.split(" ")
+            if (module == "zones" or module.startswith("zones.")) and name not in defined.get(module, ()):
+                return True
+    return False
+
+
+def registered_timers(driver):
+    """the ids of the heartbeat objects and deferreds that are registered at this time (before the zones are built)"""
+    return set(id(obj) for obj in driver.heartbeat_objects) | set(id(deferred) for deferred in driver.deferreds)
+
+
+def save(driver, vfs_path, key, story_timers=frozenset()):
+    """
+    Pickle the zone modules and the heartbeats and deferreds that were registered while building them,
+    into the user storage. The story_timers are the ones that were registered before (see registered_timers),
+    the story registers those again on the next start. Returns False if the world can't be cached.
+    """
+    sources = []
+    defined = {}
+    modules = []
+    for name in zone_module_names():
+        path = module_source(sys.modules[name])
+        try:
+            code, defined[name], imported = zone_definitions(path)
+        except (IOError, OSError, SyntaxError):
+            return False
+        sources.append((name, path))
+        namespace = {}
+        for attr, value in vars(sys.modules[name]).items():
+            if attr in ("__builtins__", "__loader__", "__spec__", "__cached__"):
+                continue
+            if attr in imported and not isinstance(value, base.MudObject):
+                continue   # imported again by the definitions (mud objects are part of the world and are kept)
+            if isinstance(value, types.ModuleType):
+                value = ModuleReference(value.__name__)
+            namespace[attr] = value
+        modules.append((name, namespace))
+    world = {
+        "modules": modules,
+        "heartbeats": [obj for obj in driver.heartbeat_objects if id(obj) not in story_timers],
+        "deferreds": [deferred for deferred in driver.deferreds if id(deferred) not in story_timers],
+        "clock": driver.game_clock.clock,
+        "prototypes": base.prototypes
+    }
+    try:
+        data = pickle.dumps(world, protocol=PICKLE_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return False
+    if references_undefined_zone_code(data, defined):
+        return False
+    with driver.vfs.open_storage_write(vfs_path) as stream:
+        pickle.dump(key, stream, protocol=PICKLE_PROTOCOL)
+        pickle.dump(sources, stream, protocol=PICKLE_PROTOCOL)
+        stream.write(data)
+    return True
+
+
+def load(driver, vfs_path, key):
+    """
+    Restore the zone modules, heartbeats and deferreds from the snapshot in the user storage.
+    The heartbeats and deferreds are added to the ones that the story registered already.
+    Returns the restored zones package, or None if there's no usable snapshot.
+    """
+    shells = {}
+    try:
+        stream = io.BytesIO(driver.vfs.load_from_storage(vfs_path))
+        if pickle.load(stream) != key:
+            return None
+        sources = pickle.load(stream)
+        for name, path in sources:
+            module = shells[name] = types.ModuleType(str(name))
+            module.__file__ = path
+            parent, _, attr = name.rpartition(".")
+            module.__package__ = str(parent)
+            if os.path.basename(path) == "__init__.py":
+                module.__path__ = [os.path.dirname(path)]
+                module.__package__ = str(name)
+            if parent:
+                setattr(shells[parent], attr, module)
+            sys.modules[name] = module
+        for name, path in sources:
+            exec(zone_definitions(path)[0], vars(shells[name]))
+        world = pickle.load(stream)
+    except Exception:
+        for name in shells:
+            del sys.modules[name]
+        return None   # missing, stale or otherwise unusable: just build the world from the sources
+    for name, namespace in world["modules"]:
+        for attr, value in namespace.items():
+            if isinstance(value, ModuleReference):
+                value = value.resolve()
+            setattr(shells[name], attr, value)
+    # deferreds were scheduled relative to the game clock at the time the snapshot was made
+    offset = driver.game_clock.clock - world["clock"]
+    for deferred in world["deferreds"]:
+        deferred.due += offset
+        driver.deferreds.schedule(deferred, driver.game_clock.clock)
+    for obj in world["heartbeats"]:
+        driver.heartbeat_objects.register(obj)
+    base.prototypes.update(world["prototypes"])
+    return shells["zones"]
@@ -14,6 +14,7 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 from __future__ import absolute_import, print_function, division, unicode_literals
 import re
 from collections import defaultdict
+from . import base
 from . import lang
 from .errors import ParseError
 from .util import next_iter
@@ -557,6 +558,47 @@ class ParseResult(object):
         return "\n".join(s)
 
 
+class NameLookup(object):
+    """
+    Read-only mapping of names and aliases to the objects in one or more collections of objects
+    (the first collection that has an object by that name wins), using their name index if they have one.
+    """
+    def __init__(self, *collections):
+        self.collections = collections
+        self.indexes = [objects.name_index() if isinstance(objects, (base.IndexedSet, base.InventoryView)) else base.NameIndex(objects)
+                        for objects in collections]
+
+    def get(self, name, default=None):
+        for index in self.indexes:
+            for obj in index.find(name, titles=False):
+                return obj
+        return default
+
+    def __getitem__(self, name):
+        obj = self.get(name)
+        if obj is None:
+            raise KeyError(name)
+        return obj
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        for objects in self.collections:
+            for obj in objects:
+                yield obj.name
+                for alias in obj.aliases:
+                    yield alias
+
+    def __len__(self):
+        return sum(len(objects) for objects in self.collections)
+
+    def __bool__(self):
+        return any(self.collections)
+
+    __nonzero__ = __bool__
+
+
 def check_name_with_spaces(words, index, all_livings, all_items):
     wordcount = 1
     name = words[index]
@@ -832,20 +874,8 @@ class Soul(object):
             unparsed = unparsed[len(verb):].lstrip()
         include_flag = True
         collect_message = False
-        all_livings = {}  # livings in the room (including player) by name + aliases
-        all_items = {}  # all items in the room or player's inventory, by name + aliases
-        for living in player.location.livings:
-            all_livings[living.name] = living
-            for alias in living.aliases:
-                all_livings[alias] = living
-        for item in player.location.items:
-            all_items[item.name] = item
-            for alias in item.aliases:
-                all_items[alias] = item
-        for item in player.inventory:
-            all_items[item.name] = item
-            for alias in item.aliases:
-                all_items[alias] = item
+        all_livings = NameLookup(player.location.livings)  # livings in the room (including player) by name + aliases
+        all_items = NameLookup(player.inventory, player.location.items)  # all items in the player's inventory or the room, by name + aliases
         previous_word = None
         words_enumerator = enumerate(words)
         for index, word in words_enumerator:
@@ -0,0 +1,6 @@
+"""
+Tools for the developers of stories and of the framework itself (python -m tale.tools.<name>)
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
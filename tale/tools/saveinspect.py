@@ -0,0 +1,300 @@
+"""
+Savegame inspector: shows what takes up the space in a savegame (or checkpoint, or player file)
+and how long it takes to load and save.
+
+The pickle stream is read with stand-ins for the classes of the game, so no game code is run
+and the story doesn't even have to be importable. References to the objects of the pristine
+world, in delta savegames, are read as world references.
+It reports the number of objects and the pickled size of their own state per class, the
+attributes that take up the most space, and the strings that are stored more than once.
+
+Usage: python -m tale.tools.saveinspect [--top N] savegame-file
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import argparse
+import codecs
+import collections
+import datetime
+import gzip
+import io
+import pickle
+import pickletools
+import sys
+import time
+from .. import util
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+try:
+    import copyreg
+except ImportError:
+    import copy_reg as copyreg
+
+
+class Stub(object):
+    """Stands in for an instance of a class of the game. Keeps whatever the pickle gives it."""
+    classname = "?"
+
+    def __new__(cls, *args, **kwargs):
+        obj = object.__new__(cls)
+        obj.args = args
+        obj.state = None
+        obj.items = []
+        obj.dictitems = []
+        return obj
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        self.state = state
+
+    def append(self, item):
+        self.items.append(item)
+
+    def extend(self, items):
+        self.items.extend(items)
+
+    def __setitem__(self, key, value):
+        self.dictitems.append((key, value))
+
+    def __reduce__(self):
+        return (_stub, (self.classname, self.args), self.state,
+                iter(self.items) if self.items else None, iter(self.dictitems) if self.dictitems else None)
+
+    def attributes(self):
+        """the instance attributes in the state (which can also be a tuple of the dict and the slots)"""
+        if isinstance(self.state, dict):
+            return self.state
+        if isinstance(self.state, tuple) and len(self.state) == 2:
+            attributes = dict(self.state[0] or {})
+            attributes.update(self.state[1] or {})
+            return attributes
+        return {}
+
+    def __repr__(self):
+        name = self.attributes().get("name")
+        return "<%s %r>" % (self.classname, name) if name else "<%s>" % self.classname
+
+
+_stub_classes = {}
+
+
+def stub_class(classname):
+    if classname not in _stub_classes:
+        _stub_classes[classname] = type(str(classname.rpartition(".")[2]), (Stub,), {"classname": classname})
+    return _stub_classes[classname]
+
+
+def _stub(classname, args):
+    return stub_class(classname)(*args)
+
+
+def _reconstructor(cls, base, state):
+    if isinstance(cls, type) and issubclass(cls, Stub):
+        obj = cls.__new__(cls)
+        if base is not object:
+            obj.args = (state,)
+        return obj
+    return copyreg._reconstructor(cls, base, state)
+
+
+class WorldReference(object):
+    """a reference to an object of the pristine world, by its id"""
+    def __init__(self, pid):
+        self.pid = pid
+
+    def __repr__(self):
+        return "<world %s>" % self.pid
+
+
+# the only globals that a savegame can refer to for real, all the others get a stand-in
+SAFE_GLOBALS = {("copyreg", "_reconstructor"): _reconstructor, ("copy_reg", "_reconstructor"): _reconstructor,
+                ("_codecs", "encode"): codecs.encode,
+                ("collections", "deque"): collections.deque, ("collections", "OrderedDict"): collections.OrderedDict,
+                ("datetime", "datetime"): datetime.datetime, ("datetime", "date"): datetime.date,
+                ("datetime", "time"): datetime.time, ("datetime", "timedelta"): datetime.timedelta}
+for _name in ["object", "set", "frozenset", "list", "dict", "tuple", "bytearray", "bytes", "str", "unicode",
+              "int", "long", "float", "complex", "bool", "slice", "range", "xrange"]:
+    if hasattr(builtins, _name):
+        SAFE_GLOBALS["builtins", _name] = SAFE_GLOBALS["__builtin__", _name] = getattr(builtins, _name)
+
+
+class StubUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        try:
+            return SAFE_GLOBALS[module, name]
+        except KeyError:
+            return stub_class(module + "." + name)
+
+    def persistent_load(self, pid):
+        return WorldReference(pid)
+
+
+class SizePickler(pickle.Pickler):
+    """Pickles with references to world objects by id, and to stand-ins too if they're not measured themselves"""
+    def __init__(self, stream, shallow):
+        pickle.Pickler.__init__(self, stream, pickle.HIGHEST_PROTOCOL)
+        self.shallow = shallow
+
+    def persistent_id(self, obj):
+        if isinstance(obj, WorldReference):
+            return obj.pid
+        if self.shallow and isinstance(obj, Stub):
+            return 0
+        return None
+
+
+def pickled_size(obj, shallow=True):
+    stream = io.BytesIO()
+    SizePickler(stream, shallow).dump(obj)
+    return len(stream.getvalue())
+
+
+def read_savegame(path):
+    """returns the pickle stream of the savegame, the size of the file, and the time it took to decompress"""
+    with open(path, "rb") as f:
+        data = f.read()
+    file_size = len(data)
+    start = time.time()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb").read()
+    return data, file_size, time.time() - start
+
+
+class Inspection(object):
+    """The analysis of a pickle stream"""
+    def __init__(self, data):
+        self.stream_size = len(data)
+        self.protocol = 0
+        self.memo_gets = 0
+        for opcode, arg, pos in pickletools.genops(data):
+            if opcode.name == "PROTO":
+                self.protocol = arg
+            elif opcode.name.endswith("GET"):
+                self.memo_gets += 1    # a reference to an object that was already pickled before
+        start = time.time()
+        self.root = StubUnpickler(io.BytesIO(data)).load()
+        self.load_time = time.time() - start
+        start = time.time()
+        stream = io.BytesIO()
+        SizePickler(stream, False).dump(self.root)
+        self.save_time = time.time() - start
+        start = time.time()
+        with gzip.GzipFile(filename="", mode="wb", compresslevel=6, fileobj=io.BytesIO()) as compressor:
+            compressor.write(stream.getvalue())
+        self.compress_time = time.time() - start
+        self.classes = collections.defaultdict(lambda: [0, 0])      # class -> [count, bytes]
+        self.builtins = collections.Counter()                        # type name -> count
+        self.attributes = collections.defaultdict(lambda: [0, 0, 0, None])   # (class, attribute) -> [count, bytes, largest, largest object]
+        self.strings = collections.defaultdict(lambda: [0, set()])   # string -> [references, ids of the string objects]
+        self.world_references = set()
+        self.walk()
+
+    def walk(self):
+        seen = set()
+        todo = [self.root]
+        while todo:
+            obj = todo.pop()
+            if isinstance(obj, util.basestring_type):
+                occurrences = self.strings[obj]
+                occurrences[0] += 1
+                occurrences[1].add(id(obj))
+                continue
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, WorldReference):
+                self.world_references.add(obj.pid)
+            elif isinstance(obj, Stub):
+                stats = self.classes[obj.classname]
+                stats[0] += 1
+                stats[1] += pickled_size((obj.args, obj.state, obj.items, obj.dictitems))
+                attributes = obj.attributes()
+                for name, value in attributes.items():
+                    size = pickled_size(value)
+                    stats = self.attributes[obj.classname, name]
+                    stats[0] += 1
+                    stats[1] += size
+                    if size > stats[2]:
+                        stats[2], stats[3] = size, obj
+                todo.extend(attributes.values())
+                todo.extend(obj.args)
+                todo.extend(obj.items)
+                for key, value in obj.dictitems:
+                    todo.extend((key, value))
+            else:
+                self.builtins[type(obj).__name__] += 1
+                if isinstance(obj, dict):
+                    for key, value in obj.items():
+                        todo.extend((key, value))
+                elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+                    todo.extend(obj)
+
+    def duplicated_strings(self):
+        """(wasted bytes, copies, string) for the strings that are stored more than once, most wasteful first"""
+        result = []
+        for string, (references, objects) in self.strings.items():
+            if len(objects) > 1 and len(string) > 1:
+                result.append(((len(objects) - 1) * len(string.encode("utf-8")), len(objects), string))
+        return sorted(result, reverse=True)
+
+    def shared_strings(self):
+        """the number of references to strings that are stored once and shared (pickle memo)"""
+        return sum(references - len(objects) for references, objects in self.strings.values())
+
+    def contents(self):
+        """(key, size) of the parts of the savegame's state, biggest first (shared objects are counted in all of them)"""
+        if not isinstance(self.root, dict):
+            return []
+        return sorted(((key, pickled_size(value, False)) for key, value in self.root.items()), key=lambda item: -item[1])
+
+    def report(self, out=None, top=15):
+        out = out or sys.stdout
+
+        def p(*args):
+            print(*args, file=out)
+        p("Pickle stream: %s bytes, protocol %d, %d references to objects that were already pickled."
+          % (format(self.stream_size, ","), self.protocol, self.memo_gets))
+        p("Load: %.1f ms   Save: %.1f ms (+ %.1f ms compression)   (with stand-ins for the classes of the game)"
+          % (self.load_time * 1000, self.save_time * 1000, self.compress_time * 1000))
+        contents = self.contents()
+        if contents:
+            p("\nContents:")
+            for key, size in contents:
+                p("  %-30s %12s bytes" % (key, format(size, ",")))
+        p("\nObjects per class (and the pickled size of their own state):")
+        for classname, (count, size) in sorted(self.classes.items(), key=lambda item: -item[1][1])[:top]:
+            p("  %-50s %7d %12s bytes" % (classname, count, format(size, ",")))
+        p("  Other objects: " + ", ".join("%s %d" % item for item in self.builtins.most_common()))
+        p("  References to world objects: %d" % len(self.world_references))
+        p("\nBiggest attributes:")
+        for (classname, name), (count, size, largest, obj) in sorted(self.attributes.items(), key=lambda item: -item[1][1])[:top]:
+            p("  %-50s %7d %12s bytes  (largest: %s bytes in %r)" % (classname + "." + name, count, format(size, ","), format(largest, ","), obj))
+        duplicates = self.duplicated_strings()
+        p("\nStrings: %d different, %d references shared, %d stored more than once (%s bytes wasted)"
+          % (len(self.strings), self.shared_strings(), len(duplicates), format(sum(d[0] for d in duplicates), ",")))
+        for wasted, copies, string in duplicates[:top]:
+            if len(string) > 50:
+                string = string[:47] + "..."
+            p("  %5dx %10s bytes  %r" % (copies, format(wasted, ","), string))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Shows what takes up the space in a Tale savegame, without running any game code.")
+    parser.add_argument("savegame", help="the savegame file (or checkpoint, or player file)")
+    parser.add_argument("-t", "--top", type=int, default=15, help="the number of lines per table (default 15)")
+    args = parser.parse_args(args)
+    data, file_size, decompress_time = read_savegame(args.savegame)
+    print("Savegame: %s   %s bytes on disk (decompressing: %.1f ms)" % (args.savegame, format(file_size, ","), decompress_time * 1000))
+    Inspection(data).report(top=args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -355,7 +355,9 @@ def format_docstring(docstring):
 
 
 def clone(object):
-    """Create a copy of an existing MudObject"""
+    """Create a copy of an existing MudObject, spawned with the object as its prototype if possible"""
+    if getattr(object, "spawnable", False):
+        return object.spawn()
     return copy.deepcopy(object)
 
 
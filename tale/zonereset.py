@@ -0,0 +1,164 @@
+"""
+Zone resets: put the zones back in their starting configuration once in a while.
+
+At startup, the starting configuration of every zone module is recorded: which items and
+npcs are in each of its locations, and whether its doors are open or locked. For every item
+and npc a detached copy is spawned (see MudObject.spawn) to serve as its prototype.
+A reset only restores what differs: an npc that wandered off is brought back, an item
+or npc that is gone (taken away, or destroyed) is replaced by a new one spawned from its
+prototype, and doors are opened, closed, locked or unlocked again. Objects that were
+brought into a location later are left alone, and the zone module isn't imported again.
+A spawned object doesn't run init again, so the npcs that schedule deferreds in init have
+to do that in init_spawned as well to keep acting after they've been replaced.
+
+A zone is reset every reset interval (the zone_reset_interval config item, or the
+reset_interval variable of the zone module itself), measured in real-time seconds on
+the game clock, so a replay of the command journal resets the zones at the same moments.
+The zones are reset at staggered moments, and at most one of them per server tick.
+Zones without a reset interval are not recorded at all, they don't need the prototypes.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import datetime
+import time
+from . import base
+from . import mud_context
+
+
+def _prototype(obj):
+    """a detached copy of the object as it is now, to spawn its replacements from"""
+    prototype = obj.spawn()
+    _stop_timers(prototype)
+    if prototype.location:
+        prototype.location.remove(prototype, None)   # a prototype isn't anywhere, not even in Limbo
+    return prototype
+
+
+def _stop_timers(obj):
+    """the prototype mustn't act: stop the heartbeats and deferreds that spawning it started"""
+    obj.unregister_heartbeat()
+    mud_context.driver.remove_deferreds(obj)
+    if isinstance(obj, (base.Living, base.Container)):
+        for item in obj.inventory:
+            _stop_timers(item)
+
+
+def _locations(value):
+    """the locations in a variable of a zone module, which can also be a list or dict of locations"""
+    if isinstance(value, base.Location):
+        return [value]
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple, set, frozenset)):
+        return []
+    return [member for member in value if isinstance(member, base.Location)]
+
+
+class Zone(object):
+    """The starting configuration of the locations of a zone module, and its reset schedule"""
+    def __init__(self, name, locations, interval):
+        self.name = name
+        self.locations = locations
+        self.interval = interval
+        self.next_reset = None
+        self.placements = []   # [location, object, prototype]; the object is replaced when a new one is spawned
+        self.doors = []        # (door, opened, locked)
+        doors = set()
+        for location in locations:
+            for obj in list(location.items) + list(location.livings):
+                if obj.spawnable:
+                    self.placements.append([location, obj, _prototype(obj)])
+            for exit in location.exits.values():
+                if isinstance(exit, base.Door) and exit not in doors:
+                    doors.add(exit)
+                    self.doors.append((exit, exit.opened, exit.locked))
+
+    def reset(self):
+        """restore what differs from the starting configuration, returns the number of objects and doors restored"""
+        restored = 0
+        for placement in self.placements:
+            location, obj, prototype = placement
+            if obj in location:
+                continue
+            restored += 1
+            if isinstance(obj, base.Living) and isinstance(obj.location, base.Location) and obj.location is not base._Limbo:
+                obj.move(location, silent=True)   # an npc that wandered off
+                continue
+            obj = prototype.spawn()
+            if obj.location:
+                obj.location.remove(obj, None)   # a spawned living starts out in Limbo
+            location.insert(obj, None)
+            placement[1] = obj
+        for door, opened, locked in self.doors:
+            if door.opened != opened or door.locked != locked:
+                door.opened = opened
+                door.locked = locked
+                restored += 1
+        return restored
+
+
+class ZoneResets(object):
+    """
+    The zones of the world, found in the given namespaces: a list of (name, dict) such as
+    the zone modules and their variables. A location belongs to the first zone that has it.
+    """
+    def __init__(self, namespaces, interval):
+        self.zones = {}        # name -> Zone
+        self.location_zones = {}   # location -> Zone
+        self.resets = 0
+        self.last_reset = None   # (zone name, restored, duration)
+        for name, namespace in sorted(namespaces, key=lambda item: item[0]):
+            locations = []
+            for attr in sorted(namespace):
+                if not attr.startswith("__"):
+                    for location in _locations(namespace[attr]):
+                        if location not in self.location_zones and location not in locations:
+                            locations.append(location)
+            zone_interval = namespace.get("reset_interval", interval)
+            if locations and zone_interval:
+                zone_name = name.partition(".")[2] or name
+                zone = Zone(zone_name, locations, zone_interval)
+                self.zones[zone_name] = zone
+                for location in locations:
+                    self.location_zones[location] = zone
+
+    def schedule(self, game_clock):
+        """plan the first resets of the zones, at staggered moments"""
+        zones = [zone for zone in self.zones.values() if zone.interval]
+        for index, zone in enumerate(sorted(zones, key=lambda z: z.name)):
+            offset = zone.interval * (index + 1) / len(zones)
+            zone.next_reset = game_clock.plus_realtime(datetime.timedelta(seconds=offset))
+
+    def tick(self, game_clock):
+        """called every server tick: reset the zone that is due first, if any"""
+        due = [zone for zone in self.zones.values() if zone.next_reset and zone.next_reset <= game_clock.clock]
+        if due:
+            zone = min(due, key=lambda z: (z.next_reset, z.name))
+            zone.next_reset = game_clock.plus_realtime(datetime.timedelta(seconds=zone.interval))
+            self.reset(zone)
+
+    def reset(self, zone):
+        start = time.time()
+        restored = zone.reset()
+        self.resets += 1
+        self.last_reset = (zone.name, restored, time.time() - start)
+        return restored
+
+    def zone_of(self, location):
+        return self.location_zones.get(location)
+
+    def state(self):
+        """what the resets have changed in the world, for savegames and checkpoints: {zone: (next reset, objects)}"""
+        return {zone.name: (zone.next_reset, [placement[1] for placement in zone.placements]) for zone in self.zones.values()}
+
+    def restore(self, state):
+        """continue with the state from a savegame or checkpoint"""
+        for name, (next_reset, objects) in state.items():
+            zone = self.zones.get(name)
+            if zone and len(objects) == len(zone.placements):
+                zone.next_reset = next_reset
+                for placement, obj in zip(zone.placements, objects):
+                    placement[1] = obj
@@ -34,7 +34,7 @@ class DummyDriver(object):
         for callable, vargs, kwargs in self.after_player_queue:
             callable(*vargs, **kwargs)
         self.after_player_queue = []
-    def get_current_verbs(self):
+    def get_current_verbs(self, player):
         return {}
 
 
@@ -0,0 +1,175 @@
+"""
+Unit tests for the player accounts
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import os
+import shutil
+import tempfile
+import tale.driver as the_driver
+from tale import mud_context, accounts, base, errors, journal, player, pristine, soul, util
+from tale.cmds import normal
+from tale.charbuilder import CharacterBuilder
+from tale.io.console_io import ConsoleIo
+from tests.test_pristine import build_world
+
+
+class TestPlayerStore(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = the_driver.Driver()
+        self.directory = tempfile.mkdtemp()
+        self.store = accounts.PlayerStore(os.path.join(self.directory, "test.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_password(self):
+        hashed = accounts.hash_password("secret", iterations=10)
+        self.assertNotIn("secret", hashed)
+        self.assertNotEqual(hashed, accounts.hash_password("secret", iterations=10))   # salted
+        account = accounts.Account("julie", "Julie", "", "f", "human", set(), 0.0, None, None, hashed)
+        self.assertTrue(account.check_password("secret"))
+        self.assertFalse(account.check_password("Secret"))
+
+    def test_create_find(self):
+        self.assertEqual(0, self.store.count())
+        self.assertIsNone(self.store.find("julie"))
+        julie = player.Player("julie", "f", description="A tall woman.")
+        julie.privileges.add("wizard")
+        julie.money = 12.5
+        self.store.create(julie, "secret")
+        self.assertEqual(1, self.store.count())
+        account = self.store.find("julie")
+        self.assertEqual("julie", account.name)
+        self.assertEqual("A tall woman.", account.description)
+        self.assertEqual("f", account.gender)
+        self.assertEqual({"wizard"}, account.privileges)
+        self.assertEqual(12.5, account.money)
+        self.assertIsNotNone(account.last_login)
+        self.assertTrue(account.check_password("secret"))
+
+    def test_batched_saves(self):
+        julie = player.Player("julie", "f")
+        peter = player.Player("peter", "m")
+        self.store.create(julie, "secret")
+        self.store.create(peter, "secret")
+        julie.money = 1.0
+        self.store.save(julie, None)
+        julie.money = 2.0
+        self.store.save(julie, None)
+        self.store.save(peter, None)
+        self.assertEqual(0.0, self.store.find("julie").money)
+        self.store.commit()
+        self.store.commit()
+        self.assertEqual(1, self.store.commits)
+        self.assertEqual(2.0, self.store.find("julie").money)
+
+    def test_save_load(self):
+        namespaces = build_world()
+        world = pristine.PristineWorld(namespaces)
+        hall = namespaces[0][1]["hall"]
+        kitchen = namespaces[0][1]["kitchen"]
+        key = [i for i in hall.items if i.name == "key"][0]
+        julie = player.Player("julie", "f")
+        julie.move(kitchen)
+        hall.remove(key, None)
+        julie.insert(key, julie)
+        julie.insert(base.Item("note"), julie)
+        julie.money = 3.0
+        self.store.create(julie, "secret")
+        self.store.save(julie, world)
+        self.store.commit()
+        julie.destroy(util.Context(driver=mud_context.driver))
+        hall.insert(key, None)    # someone put the key back in the meantime
+        julie = player.Player("<connecting>", "n")
+        location = self.store.load(julie, self.store.find("julie"), world)
+        self.assertIs(kitchen, location)
+        self.assertEqual("julie", julie.name)
+        self.assertEqual(3.0, julie.money)
+        self.assertIs(base._Limbo, julie.location)
+        self.assertEqual({"key", "note"}, {i.name for i in julie.inventory})
+        self.assertIn(key, julie)
+        self.assertIs(julie, key.contained_in)
+        self.assertNotIn(key, hall.items)
+
+
+class TestAccountLogin(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = accounts.PlayerStore(os.path.join(self.directory, "test.sqlite"))
+        self.driver = the_driver.Driver()
+        self.driver.player_store = self.store
+        mud_context.driver = self.driver
+        mud_context.config = util.ReadonlyAttributes(server_mode="mud")
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def connect(self, *lines):
+        p = player.Player("<connecting>", "n")
+        p.io = ConsoleIo(None)
+        p.input_is_available = journal.ReplayInput()   # raises SessionExit when the input runs out
+        p.input_log = []
+        for line in lines:
+            p.store_input_line(line)
+        return p
+
+    def test_new_accounts(self):
+        p = self.connect("Julie", "y", "f", "elf", "secret", "secret")
+        naming = CharacterBuilder(p, self.store).build()
+        self.assertIsNone(naming.account)
+        self.assertEqual("julie", naming.name)
+        self.assertTrue(naming.wizard)   # the first player
+        self.assertEqual("secret", naming.password)
+        self.assertEqual(["Julie", "y", "f", "elf", "*", "*"], p.input_log)
+        naming.apply_to(p)
+        self.store.create(p, naming.password)
+        p = self.connect("peter", "y", "m", "human", "abc", "secret", "other", "secret", "secret")
+        naming = CharacterBuilder(p, self.store).build()
+        self.assertFalse(naming.wizard)
+        self.assertEqual("secret", naming.password)
+
+    def test_login(self):
+        self.store.create(player.Player("julie", "f"), "secret")
+        p = self.connect("julie", "wrong", "secret")
+        naming = CharacterBuilder(p, self.store).build()
+        self.assertEqual("julie", naming.account.name)
+        p = self.connect("julie", "wrong", "wrong", "wrong")
+        with self.assertRaises(errors.SessionExit):
+            CharacterBuilder(p, self.store).build()
+
+    def test_search_player(self):
+        self.store.create(player.Player("julie", "f"), "secret")
+        self.assertIsNone(self.driver.search_player("julie"))
+        self.assertEqual("julie", self.driver.search_player("julie", offline=True).name)
+        self.assertIsNone(self.driver.search_player("peter", offline=True))
+        julie = player.Player("<connecting>", "n")
+        self.driver.register_player(julie)
+        self.assertEqual({}, self.driver.player_names)
+        julie.init_names("julie", None, None, None)
+        self.driver.register_player(julie)
+        self.assertIs(julie, self.driver.search_player("julie", offline=True))
+        p = self.connect("julie", "peter", "n")
+        with self.assertRaises(errors.SessionExit):
+            CharacterBuilder(p, self.store).build()   # julie is already playing, and peter isn't created
+        self.assertEqual(["julie", "peter", "n"], p.input_log)
+        self.assertEqual(1, self.store.count())
+
+    def test_who_offline(self):
+        self.store.create(player.Player("julie", "f"), "secret")
+        with self.store.connection:
+            self.store.connection.execute("UPDATE account SET last_login=NULL WHERE name='julie'")   # the column is nullable
+        peter = player.Player("peter", "m")
+        peter.io = ConsoleIo(None)
+        ctx = util.Context(driver=self.driver, config=mud_context.config)
+        normal.do_who(peter, soul.ParseResult("who", args=["julie"]), ctx)
+        self.assertEqual("  <player>Julie</> isn't playing right now.\n", peter.get_output())
+
+
+if __name__ == "__main__":
+    unittest.main()
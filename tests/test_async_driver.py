@@ -0,0 +1,176 @@
+"""
+Unittests for the asyncio driver core (mud mode)
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import unittest
+import io
+import sys
+import threading
+import tale.driver as the_driver
+import tale.player
+import tale.util
+from tale import mud_context
+try:
+    import asyncio
+    import concurrent.futures
+    from concurrent.futures import ThreadPoolExecutor
+    import tale.async_driver as async_driver
+except ImportError:
+    async_driver = None   # no asyncio available
+
+
+@unittest.skipIf(async_driver is None, "asyncio not available")
+class TestWorldLock(unittest.TestCase):
+    def test_held(self):
+        lock = async_driver.WorldLock()
+        self.assertFalse(lock.held())
+        with lock:
+            self.assertTrue(lock.held())
+            other = []
+            t = threading.Thread(target=lambda: other.append(lock.held()))
+            t.start()
+            t.join()
+            self.assertEqual([False], other)
+        self.assertFalse(lock.held())
+
+    def test_wait_releases_lock(self):
+        driver = the_driver.Driver()
+        driver.config = tale.util.ReadonlyAttributes(dict(the_driver.DEFAULT_CONFIG, server_tick_method="timer"))
+        core = async_driver.AsyncDriverCore(driver)
+        session = async_driver.Session(tale.player.Player("julie", "f"))
+        event = async_driver.InputEvent(core, session)
+        seen = []
+        def other_thread():
+            with core.world_lock:
+                seen.append("world")
+            event.set()
+        with core.world_lock:
+            t = threading.Thread(target=other_thread)
+            t.start()
+            self.assertTrue(event.wait(5))
+            self.assertTrue(core.world_lock.held())
+        t.join()
+        self.assertEqual(["world"], seen)
+
+
+@unittest.skipIf(async_driver is None, "asyncio not available")
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.driver = the_driver.Driver()
+        self.driver.config = tale.util.ReadonlyAttributes(dict(the_driver.DEFAULT_CONFIG, server_tick_method="timer"))
+        mud_context.driver = self.driver
+        self.core = async_driver.AsyncDriverCore(self.driver)
+        self.core._dispatch = lambda: None    # no event loop, just check the queueing
+
+    def test_add_remove(self):
+        julie = tale.player.Player("julie", "f")
+        session = self.core.add_session(julie)
+        self.assertIs(session, self.core.sessions[julie])
+        self.assertIsInstance(julie.input_is_available, async_driver.InputEvent)
+        self.assertEqual([julie], self.driver.all_players())
+        self.core.remove_session(julie)
+        self.assertTrue(session.closed)
+        self.assertEqual([], self.driver.all_players())
+
+    def test_round_robin(self):
+        s1 = self.core.add_session(tale.player.Player("julie", "f"))
+        s2 = self.core.add_session(tale.player.Player("peter", "m"))
+        s1.logged_in = s2.logged_in = True
+        self.core.input_arrived(s1)
+        self.core.input_arrived(s1)
+        self.core.input_arrived(s2)
+        self.assertEqual((s1, None), self.core.scheduler.next(0))
+        s1.busy = True
+        self.core.input_arrived(s1)   # busy, gets requeued by itself when its command is done
+        self.assertEqual((s2, None), self.core.scheduler.next(0))
+        self.assertEqual((None, None), self.core.scheduler.next(0))
+
+    def test_not_logged_in_or_closed(self):
+        s1 = self.core.add_session(tale.player.Player("julie", "f"))
+        s2 = self.core.add_session(tale.player.Player("peter", "m"))
+        self.core.input_arrived(s1)
+        self.assertEqual((None, None), self.core.scheduler.next(0))
+        s1.logged_in = s2.logged_in = True
+        self.core.input_arrived(s1)
+        self.core.input_arrived(s2)
+        s1.closed = True
+        self.assertEqual((s2, None), self.core.scheduler.next(0))
+
+    def test_tick_error(self):
+        julie = tale.player.Player("julie", "f")
+        julie.privileges.add("wizard")
+        peter = tale.player.Player("peter", "m")
+        self.core.add_session(julie)
+        self.core.add_session(peter)
+        self.core.loop = asyncio.new_event_loop()
+        self.addCleanup(self.core.loop.close)
+        self.core.executor = ThreadPoolExecutor(max_workers=1)
+        future = concurrent.futures.Future()
+        future.set_exception(ValueError("tick failed"))
+        self.core._ticking = True
+        saved_stderr, sys.stderr = sys.stderr, io.StringIO()
+        try:
+            self.core._tick_done(future)
+            errors = sys.stderr.getvalue()
+        finally:
+            sys.stderr = saved_stderr
+        self.core.executor.shutdown(wait=True)
+        self.assertFalse(self.core._ticking)
+        self.assertIn("ValueError: tick failed", errors)
+        self.assertIn("internal error in the server tick", julie.get_output_paragraphs_raw()[0])
+        self.assertEqual([], peter.get_output_paragraphs_raw())
+
+
+@unittest.skipIf(async_driver is None, "asyncio not available")
+class TestCommandScheduler(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = async_driver.TokenBucket(2.0, 3, 100.0)
+        self.assertTrue(bucket.take(100.0))
+        self.assertTrue(bucket.take(100.0))
+        self.assertTrue(bucket.take(100.0))
+        self.assertFalse(bucket.take(100.0))
+        self.assertAlmostEqual(0.5, bucket.wait_time(100.0))
+        self.assertAlmostEqual(0.25, bucket.wait_time(100.25))
+        self.assertTrue(bucket.take(100.5))
+        self.assertFalse(bucket.take(100.5))
+        self.assertTrue(bucket.take(110.0))
+        self.assertAlmostEqual(2.0, bucket.tokens)    # never more than the burst size
+
+    def test_rate_limit_keeps_others_going(self):
+        scheduler = async_driver.CommandScheduler(1.0, 2, None)
+        spammer = async_driver.Session(tale.player.Player("spammer", "m"))
+        other = async_driver.Session(tale.player.Player("julie", "f"))
+        for _ in range(2):
+            scheduler.enqueue(spammer)
+            self.assertEqual((spammer, None), scheduler.next(0.0))
+        scheduler.enqueue(spammer)
+        scheduler.enqueue(other)
+        self.assertEqual((other, None), scheduler.next(0.0))
+        self.assertEqual(1, spammer.throttled)
+        session, delay = scheduler.next(0.0)
+        self.assertIsNone(session)
+        self.assertAlmostEqual(1.0, delay)
+        self.assertEqual((spammer, None), scheduler.next(1.0))
+        self.assertEqual(2, scheduler.throttled)
+        self.assertEqual(4, scheduler.dispatched)
+
+    def test_tick_budget(self):
+        scheduler = async_driver.CommandScheduler(10.0, 10, 2)
+        sessions = [async_driver.Session(tale.player.Player("p%d" % i, "m")) for i in range(3)]
+        for session in sessions:
+            scheduler.enqueue(session)
+        self.assertEqual((sessions[0], None), scheduler.next(0.0))
+        self.assertEqual((sessions[1], None), scheduler.next(0.0))
+        self.assertEqual((None, None), scheduler.next(0.0))
+        self.assertEqual(1, scheduler.over_budget)
+        self.assertEqual((1, 0), scheduler.queue_depth())
+        scheduler.new_tick()
+        self.assertEqual((sessions[2], None), scheduler.next(0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+"""
+Unit tests for the dirty tracking and the autosave
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import os
+import shutil
+import tempfile
+import tale.driver as the_driver
+import tale.util
+from tale import mud_context, accounts, base, player, pristine, autosave
+from tests.supportstuff import DummyDriver
+from tests.test_pristine import build_world
+
+
+class TestDirtyTracking(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = DummyDriver()
+        self.dirty = set()
+        base.DirtyTracking.track(self.dirty)
+
+    def tearDown(self):
+        base.DirtyTracking.untrack(self.dirty)
+
+    def test_attributes(self):
+        thing = base.Item("thing")
+        self.assertEqual({thing}, self.dirty)
+        self.dirty.clear()
+        thing.description = "changed"
+        self.assertEqual({thing}, self.dirty)
+
+    def test_containment(self):
+        hall = base.Location("hall")
+        bag = base.Container("bag")
+        thing = base.Item("thing")
+        julie = player.Player("julie", "f")
+        julie.move(hall)
+        self.dirty.clear()
+        thing.move(hall)
+        self.assertEqual({thing, hall}, self.dirty)
+        self.dirty.clear()
+        hall.remove(thing, None)
+        bag.insert(thing, None)
+        self.assertEqual({thing, hall, bag}, self.dirty)
+        self.dirty.clear()
+        bag.remove(thing, None)
+        julie.insert(thing, julie)
+        self.assertEqual({thing, bag, julie, hall}, self.dirty)
+
+    def test_not_tracking(self):
+        base.DirtyTracking.untrack(self.dirty)
+        try:
+            self.assertNotIn("__setattr__", vars(base.DirtyTracking))   # setting attributes costs nothing extra
+            base.Item("thing").description = "changed"
+            self.assertEqual(set(), self.dirty)
+        finally:
+            base.DirtyTracking.track(self.dirty)
+
+    def test_pristine_world(self):
+        namespaces = build_world()
+        world = pristine.PristineWorld(namespaces, track_dirty=True)
+        try:
+            hall = namespaces[0][1]["hall"]
+            self.assertEqual({}, world.changes())
+            self.assertEqual(set(), world.touched)
+            hall.exits["kitchen"].opened = True
+            self.assertEqual(["zones.house:hall.exits[kitchen]"], list(world.changes()))
+            self.assertEqual({"zones.house:hall.exits[kitchen]"}, world.touched)
+            hall.exits["kitchen"].opened = False
+            self.assertEqual({}, world.changes())
+        finally:
+            world.stop_tracking()
+
+    def test_pristine_world_tracks_for_saves(self):
+        driver = the_driver.Driver()
+        driver.config = tale.util.ReadonlyAttributes(server_mode="mud", savegames_enabled=True, delta_savegames=False, journal=False)
+        driver.record_pristine_world()
+        self.assertIsNone(driver.pristine_world.dirty)    # only used to refer to world objects from the player accounts
+        for delta_savegames, journal in [(True, False), (False, True)]:
+            driver.config = tale.util.ReadonlyAttributes(server_mode="mud", savegames_enabled=True, delta_savegames=delta_savegames, journal=journal)
+            driver.record_pristine_world()
+            try:
+                self.assertIsNotNone(driver.pristine_world.dirty)
+            finally:
+                driver.pristine_world.stop_tracking()
+
+
+class TestAutosave(unittest.TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.driver = the_driver.Driver()
+        self.driver.player_store = accounts.PlayerStore(os.path.join(self.storage, "test.sqlite"))
+        mud_context.driver = self.driver
+        self.hall = base.Location("hall")
+        self.autosave = autosave.Autosave(self.driver, 0, 2)
+
+    def tearDown(self):
+        self.autosave.stop()
+        self.driver.player_store.close()
+        shutil.rmtree(self.storage)
+
+    def add_player(self, name):
+        p = player.Player(name, "f")
+        self.driver.player_store.create(p, "secret")
+        self.driver.register_player(p)
+        p.move(self.hall)
+        return p
+
+    def saved(self):
+        names = sorted(self.driver.player_store.pending)
+        self.driver.player_store.commit()
+        return names
+
+    def test_spread_over_ticks(self):
+        for name in ["julie", "peter", "harry"]:
+            self.add_player(name)
+        self.driver.register_player(player.Player("<connecting>", "n"))
+        self.autosave.tick()
+        self.assertEqual(2, len(self.driver.player_store.pending))
+        self.assertEqual(1, len(self.autosave.queue))
+        self.autosave.tick()
+        self.assertEqual(["harry", "julie", "peter"], self.saved())
+        self.assertEqual(1, self.autosave.rounds)
+        self.autosave.tick()
+        self.assertEqual(2, self.autosave.rounds)
+        self.assertEqual(3, self.autosave.saved)   # nobody changed since
+
+    def test_only_dirty_players(self):
+        julie = self.add_player("julie")
+        self.add_player("peter")
+        self.autosave.tick()
+        self.autosave.tick()
+        self.saved()
+        julie.money = 42.0
+        self.hall.description = "changed"
+        self.assertEqual({julie}, self.autosave.dirty)    # the world itself isn't autosaved
+        self.autosave.tick()
+        self.assertEqual(["julie"], self.saved())
+        self.assertEqual(42.0, self.driver.player_store.find("julie").money)
+
+    def test_player_that_left(self):
+        julie = self.add_player("julie")
+        self.driver.unregister_player(julie)
+        self.autosave.tick()
+        self.assertEqual([], self.saved())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,12 +8,26 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 from __future__ import absolute_import, print_function, division, unicode_literals
 import unittest
 import heapq
+import os
+import sys
+import shutil
+import tempfile
 import datetime
+import pickle
+import subprocess
+import threading
 import tale.driver as the_driver
+import tale.cmds
 import tale.cmds.normal
 import tale.cmds.wizard
 import tale.base
 import tale.util
+import tale.player
+import tale.pubsub
+import tale.errors
+import tale.io.vfs
+from tale import mud_context
+from tale.io.console_io import ConsoleIo
 
 
 class TestDeferreds(unittest.TestCase):
@@ -42,7 +56,7 @@ class TestDeferreds(unittest.TestCase):
         with self.assertRaises(ValueError):
             driver.defer("blerp", thing, "move")
         driver.defer(3601, thing, "move")
-        deferred = driver.deferreds[0]
+        deferred = list(driver.deferreds)[0]
         after = deferred.due - now
         self.assertEqual(3601, after.seconds)
 
@@ -53,7 +67,7 @@ class TestDeferreds(unittest.TestCase):
         driver.game_clock = tale.util.GameDateTime(now, 1)
         due = driver.game_clock.plus_realtime(datetime.timedelta(seconds=3601))
         driver.defer(due, thing, "move")
-        deferred = driver.deferreds[0]
+        deferred = list(driver.deferreds)[0]
         after = deferred.due - now
         self.assertEqual(3601, after.seconds)
 
@@ -124,6 +138,549 @@ class TestDeferreds(unittest.TestCase):
         self.assertEqual(datetime.timedelta(seconds=58), result)
 
 
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2013, 7, 18, 15, 29, 59)
+
+    def deferred(self, seconds, owner="owner"):
+        return the_driver.Deferred(self.now + datetime.timedelta(seconds=seconds), owner, "callable", None, None)
+
+    def test_pop_all_due(self):
+        wheel = the_driver.TimerWheel()
+        deferreds = [self.deferred(s) for s in (5, 1, 3, 3, 2)]
+        for d in deferreds:
+            wheel.schedule(d, self.now)
+        self.assertEqual(5, len(wheel))
+        self.assertEqual([], wheel.pop_due(self.now))
+        due = wheel.pop_due(self.now + datetime.timedelta(seconds=3))
+        self.assertEqual([1, 2, 3, 3], [(d.due - self.now).seconds for d in due])
+        self.assertEqual(1, len(wheel))
+        due = wheel.pop_due(self.now + datetime.timedelta(seconds=10))
+        self.assertEqual([deferreds[0]], due)
+        self.assertEqual(0, len(wheel))
+
+    def test_order_within_second(self):
+        wheel = the_driver.TimerWheel()
+        deferreds = [self.deferred(100.9), self.deferred(100.1), self.deferred(1.5), self.deferred(1.2)]
+        for d in deferreds:
+            wheel.schedule(d, self.now)
+        self.assertEqual([deferreds[3], deferreds[2]], wheel.pop_due(self.now + datetime.timedelta(seconds=70)))
+        late = [self.deferred(100.5), self.deferred(100.3)]
+        for d in late:
+            wheel.schedule(d, self.now + datetime.timedelta(seconds=70))
+        self.assertEqual([deferreds[1], late[1], late[0], deferreds[0]], wheel.pop_due(self.now + datetime.timedelta(seconds=102)))
+
+    def test_far_future(self):
+        wheel = the_driver.TimerWheel()
+        delays = [0, 63, 64, 65, 4095, 4096, 300000, 64**4 + 10, 3 * 64**4]
+        for seconds in reversed(delays):
+            wheel.schedule(self.deferred(seconds), self.now)
+        self.assertEqual(sorted(delays), [(d.due - self.now).days * 86400 + (d.due - self.now).seconds for d in wheel])
+        fired = []
+        clock = self.now
+        for step in (30, 50, 4000, 1000, 200000, 17000000, 40000000):
+            clock += datetime.timedelta(seconds=step)
+            for d in wheel.pop_due(clock):
+                self.assertLessEqual(d.due, clock)
+                fired.append(d)
+            for d in wheel:
+                self.assertGreater(d.due, clock)
+        self.assertEqual(len(delays), len(fired))
+        self.assertEqual(sorted(fired), fired)
+
+    def test_already_due(self):
+        wheel = the_driver.TimerWheel()
+        wheel.schedule(self.deferred(10), self.now)
+        later = self.now + datetime.timedelta(seconds=20)
+        wheel.pop_due(later)
+        wheel.schedule(self.deferred(0), later)
+        self.assertEqual(1, len(wheel.pop_due(later + datetime.timedelta(seconds=1))))
+
+    def test_remove_owner(self):
+        wheel = the_driver.TimerWheel()
+        for seconds in (1, 100, 10000, 10**8):
+            wheel.schedule(self.deferred(seconds, "owner1"), self.now)
+            wheel.schedule(self.deferred(seconds, "owner2"), self.now)
+        wheel.remove_owner("owner1")
+        self.assertEqual(4, len(wheel))
+        self.assertTrue(all(d.owner == "owner2" for d in wheel))
+
+    def test_cancel_handle(self):
+        wheel = the_driver.TimerWheel()
+        d1 = self.deferred(5)
+        d2 = self.deferred(5)
+        wheel.schedule(d1, self.now)
+        wheel.schedule(d2, self.now)
+        d1.cancel()
+        d1.cancel()
+        self.assertTrue(d1.cancelled)
+        self.assertEqual(1, len(wheel))
+        self.assertEqual([d2], list(wheel))
+        self.assertEqual([d2], wheel.pop_due(self.now + datetime.timedelta(seconds=5)))
+        self.assertEqual(0, len(wheel))
+        self.assertEqual(0, wheel.cancelled)
+        self.assertEqual({}, wheel.owners)
+        d2.cancel()    # already fired, should be harmless
+        self.assertEqual(0, len(wheel))
+
+    def test_owner_index(self):
+        wheel = the_driver.TimerWheel()
+        deferreds = [self.deferred(5, None) for _ in range(1000)]   # plain callables all share the None owner
+        for deferred in deferreds:
+            wheel.schedule(deferred, self.now)
+        self.assertEqual(1000, len(wheel.owners[id(None)]))
+        deferreds[500].cancel()
+        self.assertNotIn(id(deferreds[500]), wheel.owners[id(None)])
+        self.assertEqual(999, len(wheel.owners[id(None)]))
+        self.assertEqual(999, len(wheel.pop_due(self.now + datetime.timedelta(seconds=5))))
+        self.assertEqual({}, wheel.owners)
+
+    def test_compaction(self):
+        wheel = the_driver.TimerWheel()
+        owners = [object() for _ in range(200)]
+        for owner in owners:
+            wheel.schedule(self.deferred(10, owner), self.now)
+            wheel.schedule(self.deferred(100000, owner), self.now)
+        for owner in owners[:150]:
+            wheel.remove_owner(owner)
+        self.assertEqual(100, len(wheel))
+        self.assertLess(wheel.cancelled, 150 * 2)
+        self.assertEqual(50, len(wheel.owners))
+        wheel.compact()
+        self.assertEqual(0, wheel.cancelled)
+        self.assertEqual(100, sum(wheel.level_sizes) + len(wheel.overflow))
+        due = wheel.pop_due(self.now + datetime.timedelta(days=10))
+        self.assertEqual(100, len(due))
+        self.assertTrue(all(d.owner in owners[150:] for d in due))
+
+    def test_pickle(self):
+        wheel = the_driver.TimerWheel()
+        wheel.schedule(self.deferred(200, "owner2"), self.now)
+        wheel.schedule(self.deferred(100), self.now)
+        wheel.schedule(self.deferred(100), self.now)
+        list(wheel)[1].cancel()
+        wheel = pickle.loads(pickle.dumps(wheel, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(2, len(wheel))
+        wheel.remove_owner(list(wheel)[1].owner)
+        self.assertEqual(1, len(wheel))
+        self.assertEqual(1, len(wheel.pop_due(self.now + datetime.timedelta(seconds=100))))
+
+    def test_deferred_cancelled_in_same_batch(self):
+        class Thing(object):
+            def __init__(self):
+                self.calls = []
+            def first(self, driver):
+                self.calls.append("first")
+                self.second_handle.cancel()
+            def second(self, driver):
+                self.calls.append("second")
+        thing = Thing()
+        wheel = the_driver.TimerWheel()
+        d1 = the_driver.Deferred(self.now + datetime.timedelta(seconds=1), thing, "first", (), None)
+        thing.second_handle = the_driver.Deferred(self.now + datetime.timedelta(seconds=1), thing, "second", (), None)
+        wheel.schedule(d1, self.now)
+        wheel.schedule(thing.second_handle, self.now)
+        for deferred in wheel.pop_due(self.now + datetime.timedelta(seconds=1)):
+            deferred(driver=None)
+        self.assertEqual(["first"], thing.calls)
+        wheel.schedule(self.deferred(100), self.now)
+        wheel = pickle.loads(pickle.dumps(wheel, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(1, len(wheel))
+        self.assertEqual(1, len(wheel.pop_due(self.now + datetime.timedelta(seconds=100))))
+
+    def test_driver_fires_all_due(self):
+        class Thing(object):
+            def __init__(self):
+                self.calls = 0
+            def callback(self, driver):
+                self.calls += 1
+        thing = Thing()
+        driver = the_driver.Driver()
+        driver.game_clock = tale.util.GameDateTime(self.now, 1)
+        driver.config = tale.util.ReadonlyAttributes(server_tick_time=1.0, server_mode="if")
+        mud_context.config = driver.config
+        driver.player = tale.player.Player("julie", "f")
+        driver.player.io = ConsoleIo(None)
+        for _ in range(100):
+            handle = driver.defer(0.5, thing, thing.callback)
+        handle.cancel()
+        driver.server_tick()
+        self.assertEqual(99, thing.calls)
+        self.assertEqual(0, len(driver.deferreds))
+
+
+class TestHeartbeatScheduler(unittest.TestCase):
+    class Beater(object):
+        def __init__(self, interval=1, phase=None):
+            self.heartbeat_interval = interval
+            self.heartbeat_phase = phase
+
+    def test_intervals(self):
+        scheduler = the_driver.HeartbeatScheduler()
+        every = self.Beater()
+        slow = self.Beater(3, 1)
+        scheduler.register(every)
+        scheduler.register(slow)
+        scheduler.register(slow)
+        self.assertEqual(2, len(scheduler))
+        self.assertTrue(slow in scheduler)
+        beats = [sorted(obj.heartbeat_interval for obj, count in scheduler.pop_due()) for _ in range(6)]
+        self.assertEqual([[1, 3], [1], [1], [1, 3], [1], [1]], beats)
+        scheduler.unregister(slow)
+        scheduler.unregister(slow)
+        self.assertFalse(slow in scheduler)
+        self.assertEqual([(every, 1)], scheduler.pop_due())
+
+    def test_spread(self):
+        scheduler = the_driver.HeartbeatScheduler()
+        beaters = [self.Beater(10) for _ in range(1000)]
+        for beater in beaters:
+            scheduler.register(beater)
+        for _ in range(10):
+            self.assertEqual(100, len(scheduler.pop_due()))
+
+    def test_fastforward(self):
+        scheduler = the_driver.HeartbeatScheduler()
+        every = self.Beater()
+        slow = self.Beater(10, 0)
+        scheduler.register(every)
+        scheduler.register(slow)
+        scheduler.pop_due()
+        self.assertEqual({every: 25, slow: 2}, dict(scheduler.pop_due(25)))   # ticks 2..26
+        self.assertEqual({every: 3}, dict(scheduler.pop_due(3)))
+
+    def test_pickle(self):
+        scheduler = the_driver.HeartbeatScheduler()
+        scheduler.register(tale.base.Item("thing"))
+        scheduler.pop_due()
+        scheduler = pickle.loads(pickle.dumps(scheduler, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(1, scheduler.tick)
+        self.assertEqual(1, len(scheduler.pop_due()))
+
+
+class TestWait(unittest.TestCase):
+    class Beater(object):
+        def __init__(self):
+            self.beats = 0
+            self.fastforwards = []
+        def heartbeat(self, ctx):
+            self.beats += 1
+        def heartbeat_fastforward(self, ctx, ticks):
+            self.fastforwards.append(ticks)
+
+    class Timed(object):
+        def __init__(self, driver):
+            self.driver = driver
+            self.fired = []
+        def callback(self, driver):
+            self.fired.append(driver.game_clock.clock)
+        def yell(self, driver):
+            driver.player.tell("Someone yells.")
+
+    def setUp(self):
+        self.start = datetime.datetime(2013, 7, 18, 15, 0, 0)
+        self.driver = the_driver.Driver()
+        self.driver.game_clock = tale.util.GameDateTime(self.start, 5)
+        self.driver.config = tale.util.ReadonlyAttributes(server_tick_time=1.0, server_mode="if", gametime_to_realtime=5)
+        mud_context.config = self.driver.config
+        self.driver.player = tale.player.Player("julie", "f")
+        self.driver.player.io = ConsoleIo(None)
+        self.driver.register_player(self.driver.player)
+
+    def test_skip_ahead(self):
+        beater = self.Beater()
+        timed = self.Timed(self.driver)
+        self.driver.register_heartbeat(beater)
+        self.driver.defer(100, timed, timed.callback)    # 500 seconds game time
+        ok, message = self.driver.do_wait(datetime.timedelta(hours=2))
+        self.assertTrue(ok)
+        self.assertIsNone(message)
+        self.assertEqual(self.start + datetime.timedelta(hours=2), self.driver.game_clock.clock)
+        self.assertEqual([self.start + datetime.timedelta(seconds=500)], timed.fired)
+        self.assertEqual(0, beater.beats)
+        self.assertEqual([100, 1340], beater.fastforwards)
+
+    def test_too_short(self):
+        ok, message = self.driver.do_wait(datetime.timedelta(seconds=2))
+        self.assertFalse(ok)
+        self.assertEqual(self.start, self.driver.game_clock.clock)
+
+    def test_eventful(self):
+        timed = self.Timed(self.driver)
+        self.driver.defer(10, timed, timed.yell)
+        ok, message = self.driver.do_wait(datetime.timedelta(minutes=10))
+        self.assertFalse(ok)
+        self.assertIn("happened", message)
+
+
+class TestPlayerRegistry(unittest.TestCase):
+    def test_register(self):
+        driver = the_driver.Driver()
+        julie = tale.player.Player("julie", "f")
+        peter = tale.player.Player("peter", "m")
+        driver.register_player(julie)
+        driver.register_player(peter)
+        driver.register_player(julie)
+        self.assertEqual([julie, peter], driver.all_players())
+        self.assertIs(peter, driver.search_player("peter"))
+        self.assertIsNone(driver.search_player("harry"))
+        driver.unregister_player(julie)
+        driver.unregister_player(julie)
+        self.assertEqual([peter], driver.all_players())
+        self.assertIsNone(driver.search_player("julie"))
+
+    def test_tick_writes_output_of_all_players(self):
+        driver = the_driver.Driver()
+        driver.game_clock = tale.util.GameDateTime(datetime.datetime(2013, 7, 18, 15, 0, 0), 5)
+        driver.config = tale.util.ReadonlyAttributes(server_tick_time=1.0, server_mode="mud", gametime_to_realtime=5)
+        mud_context.config = driver.config
+        julie = tale.player.Player("julie", "f")
+        peter = tale.player.Player("peter", "m")
+        julie.io = ConsoleIo(None)
+        peter.io = ConsoleIo(None)
+        driver.register_player(julie)
+        driver.register_player(peter)
+        self.assertFalse(driver.server_tick())
+        peter.tell("hello")
+        self.assertTrue(driver.server_tick())
+        self.assertEqual([], peter.get_output_paragraphs_raw())
+
+    def test_tick_delivers_deferred_pubsub_events(self):
+        driver = the_driver.Driver()
+        driver.game_clock = tale.util.GameDateTime(datetime.datetime(2013, 7, 18, 15, 0, 0), 5)
+        driver.config = tale.util.ReadonlyAttributes(server_tick_time=1.0, server_mode="mud", gametime_to_realtime=5)
+        mud_context.config = driver.config
+        julie = tale.player.Player("julie", "f")
+        julie.privileges = {"wizard"}     # not registered, so the tick doesn't write her output
+        rat = tale.base.Living("rat", "n", race="rodent")
+        julie.create_wiretap(rat)
+        tale.pubsub.set_dispatcher(tale.pubsub.Dispatcher())
+        try:
+            rat.tell("squeak")
+            self.assertEqual([], julie.peek_output_paragraphs_raw())
+            driver.server_tick()
+            self.assertEqual(["[wiretapped from 'rat': squeak]\n"], julie.get_output_paragraphs_raw())
+        finally:
+            tale.pubsub.set_dispatcher(None)
+
+
+class TestTickProfiler(unittest.TestCase):
+    class Beater(object):
+        def heartbeat(self, ctx):
+            pass
+
+    class Owner(object):
+        def cb(self, driver):
+            pass
+
+    def setUp(self):
+        self.driver = the_driver.Driver()
+        self.driver.game_clock = tale.util.GameDateTime(datetime.datetime(2013, 7, 18, 15, 0, 0), 1)
+        self.driver.config = tale.util.ReadonlyAttributes(server_tick_time=1.0, server_mode="if", gametime_to_realtime=1)
+        mud_context.config = self.driver.config
+
+    def test_disabled(self):
+        self.driver.register_heartbeat(self.Beater())
+        self.driver.server_tick()
+        self.assertEqual({}, self.driver.profiler.stats)
+        self.assertEqual(0, self.driver.profiler.ticks)
+
+    def test_accounting(self):
+        profiler = self.driver.profiler
+        profiler.start()
+        owner = self.Owner()
+        self.driver.register_heartbeat(self.Beater())
+        self.driver.defer(1, owner, owner.cb)
+        self.driver.defer(1, owner, "cb")
+        cancelled = self.driver.defer(1, owner, owner.cb)
+        cancelled.cancel()
+        self.driver.server_tick()
+        self.driver.server_tick()
+        self.assertEqual(2, profiler.ticks)
+        names = {name: calls for name, calls, total, worst in profiler.top()}
+        self.assertEqual({"heartbeat %s.Beater" % __name__: 2, "deferred %s.Owner.cb" % __name__: 2}, names)
+        profiler.stop()
+        self.driver.server_tick()
+        self.assertEqual(2, profiler.ticks)
+        profiler.reset()
+        self.assertEqual([], profiler.top())
+
+    def test_cprofile_dump(self):
+        import io
+        import marshal
+        profiler = self.driver.profiler
+        self.assertRaises(ValueError, profiler.dump, io.BytesIO())
+        profiler.start(cprofile=True)
+        self.driver.register_heartbeat(self.Beater())
+        self.driver.server_tick()
+        stream = io.BytesIO()
+        profiler.dump(stream)
+        stats = marshal.loads(stream.getvalue())
+        self.assertTrue(any(func[2] == "heartbeat" for func in stats))
+
+
+class TestCommands(unittest.TestCase):
+    def setUp(self):
+        self.commands = the_driver.Commands()
+        tale.cmds.register_all(self.commands)
+        self.commands.no_soul_parsing.add("!set")
+
+    def test_privileges_dont_leak(self):
+        wizard_table = self.commands.get({"wizard"})
+        self.assertIn("!server", wizard_table)
+        self.assertIn("look", wizard_table)
+        table = self.commands.get(set())
+        self.assertNotIn("!server", table)
+        self.assertNotIn("!server", self.commands.commands_per_priv[None])
+        self.assertIs(table, self.commands.get({"unknown-privilege"}))
+        self.assertIs(wizard_table, self.commands.get({"wizard", "unknown-privilege"}))
+
+    def test_readonly(self):
+        table = self.commands.get(set())
+        with self.assertRaises(TypeError):
+            table["hack"] = None
+        with self.assertRaises(TypeError):
+            table.update({})
+        with self.assertRaises(TypeError):
+            del table["look"]
+
+    def test_lookup(self):
+        table = self.commands.get(set())
+        self.assertEqual(("look", table["look"], False), table.lookup["look"])
+        self.assertEqual(("look", table["look"], False), table.lookup["l"])
+        self.assertEqual(("north", None, False), table.lookup["n"])
+        self.assertTrue(self.commands.get({"wizard"}).lookup["!set"][2])
+        self.assertEqual(frozenset(table), table.verbs)
+
+    def test_invalidate(self):
+        table = self.commands.get(set())
+        self.assertIs(table, self.commands.get(set()))
+        func = tale.cmds.normal.all_commands["look"]
+        old = self.commands.override("look", func)
+        self.assertIs(func, old)
+        self.assertIsNot(table, self.commands.get(set()))
+        table = self.commands.get(set())
+        self.commands.add("peek", func)
+        self.assertIsNot(table, self.commands.get(set()))
+        self.assertIn("peek", self.commands.get(set()))
+
+
+class StorageMixin(object):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+        self.driver = the_driver.Driver()
+        self.driver.vfs = tale.io.vfs.VirtualFileSystem(self.storage)
+        self.driver.vfs.get_userdata_dir = lambda path: os.path.join(self.storage, path)
+
+    def tearDown(self):
+        shutil.rmtree(self.storage)
+
+
+class TestSavegameFiles(StorageMixin, unittest.TestCase):
+    def test_roundtrip(self):
+        state = {"world": ["thing"] * 1000}
+        self.driver.write_savegame("test.savegame", state)
+        self.assertEqual(state, self.driver.read_savegame("test.savegame"))
+        with open(os.path.join(self.storage, "test.savegame"), "rb") as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b"\x1f\x8b"))
+        self.assertLess(len(data), len(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)))
+        self.assertEqual(["test.savegame"], os.listdir(self.storage))
+
+    def test_uncompressed_savegame(self):
+        self.driver.vfs.write_to_storage("test.savegame", pickle.dumps({"old": "format"}))
+        self.assertEqual({"old": "format"}, self.driver.read_savegame("test.savegame"))
+
+    def test_failed_save_keeps_previous(self):
+        self.driver.write_savegame("test.savegame", {"previous": "save"})
+        self.assertRaises(Exception, self.driver.write_savegame, "test.savegame", {"unpicklable": lambda: 42})
+        self.assertEqual({"previous": "save"}, self.driver.read_savegame("test.savegame"))
+        self.assertEqual(["test.savegame"], os.listdir(self.storage))
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+class TestBackgroundSave(StorageMixin, unittest.TestCase):
+
+    def wait_for_notification(self):
+        notification = self.driver.notification_queue.get(timeout=10)
+        notification()
+
+    def test_background_save(self):
+        results = []
+        state = {"world": list(range(1000))}
+        self.assertTrue(self.driver.save_in_background(state, "test.savegame", results.append))
+        state["world"] = "changed after the fork"
+        self.wait_for_notification()
+        self.assertEqual([True], results)
+        self.assertIsNone(self.driver.background_save_pid)
+        self.assertEqual({"world": list(range(1000))}, self.driver.read_savegame("test.savegame"))
+
+    def test_background_failure(self):
+        results = []
+        # the child process prints the traceback on the stderr it inherits, capture that in a file it shares with us
+        with tempfile.TemporaryFile(mode="w+") as errors:
+            saved_stderr, sys.stderr = sys.stderr, errors
+            try:
+                self.assertTrue(self.driver.save_in_background({"unpicklable": lambda: 42}, "test.savegame", results.append))
+                self.wait_for_notification()
+            finally:
+                sys.stderr = saved_stderr
+            errors.seek(0)
+            self.assertIn("Traceback", errors.read())
+        self.assertEqual([False], results)
+        self.assertFalse(os.path.exists(os.path.join(self.storage, "test.savegame")))
+
+    def test_still_saving(self):
+        self.driver.background_save_pid = 12345    # a child that is still writing
+        self.assertRaises(tale.errors.ActionRefused, self.driver.save_in_background, {}, "test.savegame", None)
+
+
+class TestMudMode(unittest.TestCase):
+    def test_core_fallback(self):
+        driver = the_driver.Driver()
+        driver.config = tale.util.ReadonlyAttributes(dict(the_driver.DEFAULT_CONFIG, server_tick_method="timer"))
+        saved_module = sys.modules.get("tale.async_driver")
+        sys.modules["tale.async_driver"] = None    # makes importing it fail, like on Pythons without asyncio
+        try:
+            self.assertIsNone(driver.create_core())
+        finally:
+            if saved_module:
+                sys.modules["tale.async_driver"] = saved_module
+            else:
+                del sys.modules["tale.async_driver"]
+
+    def test_start(self):
+        # runs on every python version: without asyncio, the console player gets the threaded main loop
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home)
+        env = dict(os.environ, HOME=home, PYTHONPATH=os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]))
+        story = os.path.join(root, "stories", "zed_is_me")
+        game = subprocess.Popen([sys.executable, "-m", "tale.driver", "-g", story, "-m", "mud"], cwd=home, env=env,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        lines = []
+        welcomed = threading.Event()
+        def read_output():
+            for line in iter(game.stdout.readline, b""):
+                lines.append(line)
+                if b"Living room" in line:
+                    welcomed.set()
+        reader = threading.Thread(target=read_output)
+        reader.daemon = True
+        reader.start()
+        try:
+            game.stdin.write(b"w\n")   # the default wizard
+            game.stdin.flush()
+            welcomed.wait(30)
+        finally:
+            game.kill()
+            game.wait()
+            reader.join(5)
+        output = b"".join(lines)
+        self.assertTrue(welcomed.is_set(), output)
+        self.assertIn(b"Welcome to Zed is me", output)
+
+
 class TestVarious(unittest.TestCase):
     def testCommandsLoaded(self):
         self.assertGreater(len(tale.cmds.normal.all_commands), 1)
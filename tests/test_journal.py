@@ -0,0 +1,139 @@
+"""
+Unit tests for the command journal
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import tale.driver as the_driver
+import tale.io.vfs
+from tale import mud_context, journal, npc, player, pristine, util
+from tale.io.console_io import ConsoleIo
+from tests.test_pristine import build_world
+
+
+class TestJournalFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return journal.read_records(f)
+
+    def test_group_commit(self):
+        log = journal.Journal(open(self.path, "ab"))
+        log.reset("checkpoint", None, 42)
+        log.append("command", None, "julie", ["look"])
+        log.append("tick", None)
+        self.assertEqual([("checkpoint", None, 42)], self.read())
+        log.commit()
+        log.commit()
+        self.assertEqual(2, log.commits)
+        self.assertEqual([("checkpoint", None, 42), ("command", None, "julie", ["look"]), ("tick", None)], self.read())
+        log.reset("checkpoint", None, 43)
+        log.append("tick", None)
+        log.close()
+        self.assertEqual([("checkpoint", None, 43), ("tick", None)], self.read())
+
+    def test_torn_record(self):
+        log = journal.Journal(open(self.path, "ab"))
+        log.reset("checkpoint", None, 42)
+        log.append("tick", None)
+        log.close()
+        with open(self.path, "rb") as f:
+            data = f.read()
+        with open(self.path, "wb") as f:
+            f.write(data[:-3])
+        self.assertEqual([("checkpoint", None, 42)], self.read())
+        with open(self.path, "wb") as f:
+            f.write(data[:-1] + b"X")
+        self.assertEqual([("checkpoint", None, 42)], self.read())
+
+
+class Summoner(object):
+    def summon(self, location, driver):
+        location.insert(npc.NPC("harry", "m"), None)
+        location.luck = random.random()
+
+
+class TestRecovery(unittest.TestCase):
+    def setUp(self):
+        self.storage = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.storage)
+
+    def start_driver(self):
+        driver = the_driver.Driver()
+        driver.config = util.ReadonlyAttributes(dict(the_driver.DEFAULT_CONFIG, name="Test", version="1.0",
+                                                     server_mode="mud", server_tick_time=1.0, journal=True))
+        driver.vfs = tale.io.vfs.VirtualFileSystem(self.storage)
+        driver.vfs.get_userdata_dir = lambda path: os.path.join(self.storage, path)
+        driver.game_clock = util.GameDateTime(datetime.datetime(2013, 7, 18, 15, 0, 0))
+        mud_context.driver = driver
+        mud_context.config = driver.config
+        namespaces = build_world()
+        driver.pristine_world = pristine.PristineWorld(namespaces)
+        driver.open_journal()
+        return driver, namespaces[0][1]["hall"]
+
+    def test_recover(self):
+        driver, hall = self.start_driver()
+        julie = player.Player("julie", "f")
+        julie.io = ConsoleIo(None)
+        julie.move(hall)
+        driver.register_player(julie)
+        driver.defer(1.5, Summoner(), "summon", hall)
+        driver.checkpoint()
+        # what the driver core does for every command, and for every server tick
+        key = [i for i in hall.items if i.name == "key"][0]
+        julie.input_log = []
+        julie.store_input_line("take key")
+        driver.handle_player_command(julie, julie.get_next_input())
+        driver.journal_record("command", julie.name, julie.input_log)
+        self.assertIn(key, julie)
+        for _ in range(3):
+            driver.journal_record("tick")
+            driver.server_tick()
+        driver.journal_tick()
+        luck = hall.luck
+        clock = driver.game_clock.clock
+        self.assertIn("harry", [l.name for l in hall.livings])
+        self.assertTrue(driver.journal.commits > 0)
+        # crash, and start the driver again on a freshly built world
+        driver, hall = self.start_driver()
+        self.assertEqual(clock, driver.game_clock.clock)
+        self.assertEqual([], driver.all_players())
+        self.assertNotIn("julie", [l.name for l in hall.livings])
+        self.assertIn("harry", [l.name for l in hall.livings])
+        self.assertNotIn("key", [i.name for i in hall.items])
+        self.assertEqual(luck, hall.luck)   # the random generator was seeded at the checkpoint
+        with driver.vfs.open_storage_read("test.journal") as f:
+            self.assertEqual(1, len(journal.read_records(f)))   # a new checkpoint was made
+
+    def test_stale_journal_is_not_replayed(self):
+        driver, hall = self.start_driver()
+        hall.exits["kitchen"].opened = True
+        driver.journal_record("tick")
+        driver.journal.commit()
+        stale = driver.vfs.load_from_storage("test.journal")
+        driver.checkpoint()
+        # crash after the checkpoint was written but before the journal was truncated
+        driver.vfs.write_to_storage("test.journal", stale)
+        driver, hall = self.start_driver()
+        self.assertTrue(hall.exits["kitchen"].opened)
+        self.assertEqual(datetime.datetime(2013, 7, 18, 15, 0, 0), driver.game_clock.clock)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,15 +8,16 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 from __future__ import print_function, division, unicode_literals, absolute_import
 import unittest
 import datetime
+import pickle
 from tests.supportstuff import DummyDriver, MsgTraceNPC, Wiretap
-from tale.base import Location, Exit, Item, Living, MudObject, _Limbo, Container, Weapon, Door
+from tale.base import Location, Exit, Item, Living, MudObject, _Limbo, Container, Weapon, Door, heartbeat
 from tale.util import Context, MoneyFormatter
 from tale.errors import ActionRefused
 from tale.npc import NPC, Monster
 from tale.player import Player
 from tale.soul import ParseResult
 from tale.io.iobase import strip_text_styles
-from tale import pubsub, mud_context
+from tale import pubsub, mud_context, base
 
 
 class TestLocations(unittest.TestCase):
@@ -708,7 +709,7 @@ class TestContainer(unittest.TestCase):
             key.insert(thing, player)  # can't add stuf to an Item
         bag.insert(thing, player)
         self.assertTrue(thing in bag)
-        self.assertTrue(isinstance(bag.inventory, (set, frozenset)))
+        self.assertTrue(isinstance(bag.inventory, base.InventoryView))
         self.assertEqual(1, bag.inventory_size)
         with self.assertRaises(AttributeError):
             bag.inventory_size = 5
@@ -825,6 +826,230 @@ class TestMudObject(unittest.TestCase):
             x.read(None)
         x.destroy(Context())
 
+    def test_heartbeat_decorator(self):
+        mud_context.driver = DummyDriver()
+        @heartbeat
+        class Beating(MudObject):
+            pass
+        @heartbeat(interval=5, phase=2)
+        class SlowBeating(MudObject):
+            pass
+        x = Beating("x")
+        y = SlowBeating("y")
+        self.assertEqual({x, y}, mud_context.driver.heartbeats)
+        self.assertEqual(1, x.heartbeat_interval)
+        self.assertIsNone(x.heartbeat_phase)
+        self.assertEqual(5, y.heartbeat_interval)
+        self.assertEqual(2, y.heartbeat_phase)
+        self.assertEqual(1, MudObject.heartbeat_interval)
+
+
+class TestPrototypes(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = DummyDriver()
+
+    def test_spawn_item(self):
+        hall = Location("hall")
+        sword = Weapon("sword", "sharp sword", "A very sharp sword, with a long description. " * 5)
+        sword.aliases = {"blade"}
+        sword.verbs = {"swing": "swing the sword"}
+        sword.move(hall)
+        sword2 = sword.spawn()
+        self.assertIsInstance(sword2, Weapon)
+        self.assertIs(sword.description, sword2.description)   # shared
+        self.assertIsNone(sword2.contained_in)
+        self.assertNotIn(sword2, hall)
+        sword2.aliases.add("knife")
+        sword2.verbs["stab"] = "stab with the sword"
+        self.assertEqual({"blade"}, sword.aliases)
+        self.assertEqual({"swing": "swing the sword"}, sword.verbs)
+
+    def test_init_spawned(self):
+        class Crier(NPC):
+            def init(self):
+                self.inits = getattr(self, "inits", 0) + 1
+                mud_context.driver.defer(2, self, "cry")
+            def init_spawned(self):
+                mud_context.driver.defer(2, self, "cry")
+        crier = Crier("crier", "m")
+        crier2 = crier.spawn()
+        self.addCleanup(_Limbo.remove, crier2, None)
+        self.assertEqual(1, crier2.inits)   # init isn't run again
+        self.assertEqual([crier, crier2], [owner for due, owner, callable in mud_context.driver.deferreds])
+
+    def test_spawn_container_and_living(self):
+        hall = Location("hall")
+        bag = Container("bag")
+        bag.init_inventory([Item("coin"), Item("gem")])
+        rat = NPC("rat", "n", race="elf")
+        Living.insert(rat, bag, rat)
+        rat.move(hall)
+        rat2 = rat.spawn()
+        self.assertIs(_Limbo, rat2.location)
+        self.assertIn(rat2, _Limbo.livings)
+        self.assertNotIn(rat2, hall.livings)
+        rat2.stats["agi"] = 1000
+        self.assertNotEqual(1000, rat.stats["agi"])
+        bag2 = list(rat2.inventory)[0]
+        self.assertIsNot(bag, bag2)
+        self.assertIs(rat2, bag2.contained_in)
+        self.assertEqual({"coin", "gem"}, {item.name for item in bag2.inventory})
+        self.assertTrue(all(item.contained_in is bag2 for item in bag2.inventory))
+        self.assertTrue(bag.inventory.isdisjoint(bag2.inventory))
+        self.assertEqual({"coin", "gem"}, {item.name for item in bag.inventory})
+        rat2.move(hall)
+        self.assertIn(rat2, hall.livings)
+        self.assertNotIn(rat2, _Limbo.livings)
+
+    def test_registry(self):
+        @heartbeat
+        class Rat(NPC):
+            pass
+        rat = Rat("rat", "n").register_prototype("zones.sewer:rat")
+        self.addCleanup(base.prototypes.clear)
+        spawned = base.spawn("zones.sewer:rat")
+        self.addCleanup(_Limbo.remove, spawned, None)
+        self.assertIsInstance(spawned, Rat)
+        self.assertIsNot(rat, spawned)
+        self.assertIn(spawned, mud_context.driver.heartbeats)
+        with self.assertRaises(KeyError):
+            base.spawn("zones.sewer:dragon")
+        with self.assertRaises(TypeError):
+            Player("julie", "f").spawn()
+
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = DummyDriver()
+
+    def test_search_living(self):
+        hall = Location("hall")
+        for i in range(100):
+            NPC("rat%d" % i, "n").move(hall)
+        cat = NPC("cat", "f", title="black cat")
+        cat.aliases = {"kitty"}
+        cat.move(hall)
+        self.assertIs(cat, hall.search_living("CAT"))
+        self.assertIs(cat, hall.search_living("kitty"))
+        self.assertIs(cat, hall.search_living("black cat"))
+        cat.init_names("tiger", "striped tiger", None, None)   # renaming invalidates the index
+        self.assertIsNone(hall.search_living("cat"))
+        self.assertIs(cat, hall.search_living("striped tiger"))
+        cat.aliases = {"tigger"}
+        self.assertIs(cat, hall.search_living("tigger"))
+        self.assertIsNone(hall.search_living("kitty"))
+        cat.move(Location("garden"))
+        self.assertIsNone(hall.search_living("tiger"))
+        self.assertEqual(100, len(hall.livings))
+
+    def test_locate_item(self):
+        hall = Location("hall")
+        hall.init_inventory([Item("chair%d" % i) for i in range(100)])
+        julie = Player("julie", "f")
+        julie.move(hall)
+        paper = Item("paper", "old newspaper")
+        paper.move(hall)
+        paper.aliases = {"newspaper"}   # assigned after it was put somewhere
+        self.assertEqual((paper, hall), julie.locate_item("newspaper"))
+        self.assertEqual((paper, hall), julie.locate_item("old newspaper"))
+        paper.move(julie, julie)
+        self.assertEqual((paper, julie), julie.locate_item("paper"))
+        self.assertEqual((None, None), julie.locate_item("paper", include_inventory=False))
+        bag = Container("bag")
+        bag.init_inventory([Item("coin")])
+        bag.move(julie, julie)
+        self.assertEqual("coin", julie.locate_item("coin")[0].name)
+        self.assertEqual(bag, julie.locate_item("coin")[1])
+
+    def test_dynamic_title(self):
+        class Box(Item):
+            opened = False
+
+            @property
+            def title(self):
+                return "open box" if self.opened else "closed box"
+        box = Box("box")
+        hall = Location("hall")
+        box.move(hall)
+        self.assertEqual("box", base.search_by_name(hall.items, "closed box").name)
+        box.opened = True
+        self.assertIsNone(base.search_by_name(hall.items, "closed box"))
+        self.assertEqual("box", base.search_by_name(hall.items, "open box").name)
+
+    def test_indexed_set(self):
+        rat, cat = NPC("rat", "n"), NPC("cat", "f")
+        livings = base.IndexedSet([rat])
+        self.assertIs(rat, base.search_by_name(livings, "rat"))
+        livings.add(cat)
+        self.assertIs(cat, base.search_by_name(livings, "cat"))
+        livings -= {cat}
+        self.assertIsNone(base.search_by_name(livings, "cat"))
+        livings.discard(rat)
+        livings.discard(rat)
+        self.assertIsNone(base.search_by_name(livings, "rat"))
+        livings.update([rat, cat])
+        self.assertIs(cat, base.search_by_name(livings, "cat"))
+        livings.clear()
+        self.assertIsNone(base.search_by_name(livings, "cat"))
+        self.assertIs(cat, base.search_by_name([rat, cat], "cat"))   # any collection can be searched
+        livings.add(cat)
+        livings.name_index()
+        copied = pickle.loads(pickle.dumps(livings, pickle.HIGHEST_PROTOCOL))
+        self.assertIsInstance(copied, base.IndexedSet)
+        self.assertIsNone(copied._index)
+        self.assertEqual("cat", base.search_by_name(copied, "cat").name)
+
+
+class TestInventoryView(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = DummyDriver()
+
+    def test_view(self):
+        julie = Player("julie", "f")
+        coin, gem = Item("coin"), Item("gem")
+        inventory = julie.inventory
+        self.assertFalse(inventory)
+        julie.insert(coin, julie)
+        self.assertTrue(coin in inventory)    # live
+        self.assertEqual(1, len(inventory))
+        julie.insert(gem, julie)
+        self.assertEqual({coin, gem}, inventory)
+        self.assertEqual(inventory, frozenset([coin, gem]))
+        self.assertEqual(frozenset([gem]), inventory - {coin})
+        self.assertTrue(inventory.isdisjoint([Item("stone")]))
+        self.assertEqual("coin", base.search_by_name(inventory, "coin").name)
+        with self.assertRaises(AttributeError):
+            inventory.add(Item("stone"))
+        copied = pickle.loads(pickle.dumps(inventory))
+        self.assertIsInstance(copied, frozenset)
+        self.assertEqual({"coin", "gem"}, {item.name for item in copied})
+
+    def test_change_while_iterating(self):
+        julie = Player("julie", "f")
+        hall = Location("hall")
+        bag = Container("bag")
+        items = [Item("coin%d" % i) for i in range(20)]
+        bag.init_inventory(items)
+        seen = []
+        for item in bag.inventory:
+            seen.append(item)
+            item.move(julie, julie)
+            if len(seen) == 5:
+                bag.insert(Item("extra"), julie)
+        self.assertEqual(set(items), set(seen))
+        self.assertEqual(20, len(seen))
+        self.assertEqual(1, bag.inventory_size)
+        outer = []
+        for item in julie.inventory:      # nested iterations, each of them sees the inventory as it was when it started
+            outer.append(item)
+            inner = list(julie.inventory)
+            self.assertIn(item, inner)
+            item.move(hall, julie)
+            self.assertNotIn(item, julie.inventory)
+        self.assertEqual(set(items), set(outer))
+        self.assertEqual(0, julie.inventory_size)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -265,6 +265,23 @@ class TestPlayer(unittest.TestCase):
         attic.tell("message for room")
         self.assertEqual(["message for room\n"], player.get_output_paragraphs_raw())
 
+    def test_wiretap_handle(self):
+        attic = Location("Attic", "A dark attic.")
+        julie = NPC("julie", "f")
+        tap = julie.get_wiretap()
+        self.assertIs(tap, julie.get_wiretap())
+        self.assertIs(tap, NPC("julie", "f").get_wiretap())    # taps are by name
+        self.assertIs(attic.get_wiretap(), attic.get_wiretap())
+        self.assertIsNot(tap, attic.get_wiretap())
+        self.assertNotIn("_wiretap", vars(julie))
+        self.assertNotIn("_wiretap", julie.__getstate__())
+        spawned = julie.spawn()
+        self.addCleanup(spawned.location.remove, spawned, None)
+        self.assertIs(tap, spawned.get_wiretap())
+        julie.init_names("julia", None, None, None)
+        self.assertIsNot(tap, julie.get_wiretap())
+        self.assertEqual(("wiretap-living", "julia"), julie.get_wiretap().name)
+
     def test_socialize(self):
         player = Player("fritz", "m")
         attic = Location("Attic", "A dark attic.")
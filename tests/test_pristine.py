@@ -0,0 +1,134 @@
+"""
+Unit tests for the delta savegames
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import io
+import pickle
+from tale import mud_context, base, npc, player, pristine
+from tests.supportstuff import DummyDriver
+
+
+def build_world():
+    hall = base.Location("Hall", "A big hall.")
+    kitchen = base.Location("Kitchen", "A kitchen.")
+    door = base.Door("kitchen", kitchen, "A door to the kitchen.", opened=False)
+    hall.add_exits([door, base.Exit("hall", hall, "The hall.")])
+    kitchen.add_exits([base.Exit("hall", hall, "Back to the hall.")])
+    hall.init_inventory([base.Item("key", "rusty key"), npc.NPC("rat", "n"), npc.NPC("rat", "n")])
+    kitchen.init_inventory([base.Item("knife")])
+    rooms = [base.Location("Room %d" % i, "An empty room, number %d of many." % i) for i in range(50)]
+    for room, next_room in zip(rooms, rooms[1:] + [hall]):
+        room.init_inventory([base.Item("chair"), base.Item("table")])
+        room.add_exits([base.Exit("onward", next_room, "The next room.")])
+    hall.add_exits([base.Exit("rooms", rooms[0], "Many more rooms.")])
+    return [("zones.house", {"hall": hall, "kitchen": kitchen}), ("zones.rooms", {"rooms": rooms, "__doc__": "rooms"})]
+
+
+def save(world, state):
+    stream = io.BytesIO()
+    world.pickler(stream).dump(dict(state, world_changes=world.changes()))
+    return stream.getvalue()
+
+
+def load(world, data):
+    state = world.unpickler(io.BytesIO(data)).load()
+    world.restore()
+    world.apply(state["world_changes"])
+    return state
+
+
+class TestPristineWorld(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = DummyDriver()
+        self.namespaces = build_world()
+        self.world = pristine.PristineWorld(self.namespaces)
+        self.hall = self.namespaces[0][1]["hall"]
+        self.kitchen = self.namespaces[0][1]["kitchen"]
+
+    def test_ids(self):
+        self.assertIs(self.hall, self.world.objects["zones.house:hall"])
+        self.assertIs(self.hall.exits["kitchen"], self.world.objects["zones.house:hall.exits[kitchen]"])
+        self.assertIn("zones.rooms:rooms[49]", self.world.objects)
+        # the same sources give the same ids
+        other = pristine.PristineWorld(build_world())
+        self.assertEqual(sorted(self.world.objects), sorted(other.objects))
+        for path, obj in self.world.objects.items():
+            self.assertEqual(obj.name, other.objects[path].name)
+
+    def test_changes(self):
+        self.assertEqual({}, self.world.changes())
+        key = [i for i in self.hall.items if i.name == "key"][0]
+        key.move(self.kitchen)
+        self.hall.exits["kitchen"].opened = True
+        changes = self.world.changes()
+        key_id = self.world.ids[id(key)]
+        self.assertEqual({"zones.house:hall", "zones.house:kitchen", "zones.house:hall.exits[kitchen]", key_id}, set(changes))
+        self.assertEqual(({"opened": True}, []), changes["zones.house:hall.exits[kitchen]"])
+        self.assertEqual(["items"], list(changes["zones.house:hall"][0]))
+
+    def test_save_and_load(self):
+        julie = player.Player("julie", "f")
+        julie.move(self.hall)
+        key = [i for i in self.hall.items if i.name == "key"][0]
+        julie.insert(key, julie)
+        self.hall.remove(key, julie)
+        self.hall.exits["kitchen"].opened = True
+        rat = [l for l in self.hall.livings if l.name == "rat"][0]
+        rat.move(self.kitchen)
+        data = save(self.world, {"player": julie})
+        full = pickle.dumps({"player": julie}, pickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(data) * 5, len(full))
+        # play on, then load the saved game again
+        julie.move(self.kitchen)
+        self.hall.exits["kitchen"].opened = False
+        julie.remove(key, julie)
+        self.namespaces[1][1]["rooms"][0].insert(key, julie)
+        state = load(self.world, data)
+        loaded = state["player"]
+        self.assertIsNot(julie, loaded)
+        self.assertIs(self.hall, loaded.location)
+        self.assertIn(loaded, self.hall.livings)
+        self.assertNotIn(julie, self.hall.livings)
+        self.assertEqual([self.kitchen.exits["hall"]], list(self.kitchen.exits.values()))
+        self.assertTrue(self.hall.exits["kitchen"].opened)
+        self.assertIn(key, loaded)
+        self.assertNotIn(key, self.namespaces[1][1]["rooms"][0].items)
+        self.assertIs(self.kitchen, rat.location)
+        self.assertEqual(1, len([l for l in self.hall.livings if l.name == "rat"]))
+
+    def test_restore(self):
+        self.hall.exits["kitchen"].opened = True
+        self.hall.items.clear()
+        self.hall.mark_dirty()
+        self.world.restore()
+        self.assertEqual({}, self.world.changes())
+        self.assertFalse(self.hall.exits["kitchen"].opened)
+        self.assertEqual(["key"], [i.name for i in self.hall.items])
+
+    def test_unknown_object(self):
+        data = save(self.world, {"hall": self.hall})
+        other = pristine.PristineWorld([])
+        self.assertRaises(pickle.UnpicklingError, other.unpickler(io.BytesIO(data)).load)
+
+
+class TestTrackedPristineWorld(TestPristineWorld):
+    """the same, with dirty tracking: only the world objects that were marked dirty are compared"""
+    def setUp(self):
+        super(TestTrackedPristineWorld, self).setUp()
+        self.world = pristine.PristineWorld(self.namespaces, track_dirty=True)
+        self.addCleanup(self.world.stop_tracking)
+
+    def test_untouched_skipped(self):
+        vars(self.kitchen)["smell"] = "burnt"    # changed behind the back of the dirty tracking
+        self.hall.exits["kitchen"].opened = True
+        player.Player("julie", "f").move(self.hall)
+        self.assertEqual({"zones.house:hall.exits[kitchen]", "zones.house:hall"}, set(self.world.changes()))
+        self.assertEqual({"zones.house:hall.exits[kitchen]", "zones.house:hall"}, self.world.touched)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,8 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 
 import unittest
 import gc
+import threading
+from tale import pubsub
 from tale.pubsub import topic, unsubscribe_all, Listener
 
 class Subber(Listener):
@@ -105,6 +107,161 @@ class TestPubsub(unittest.TestCase):
         s3.send("three")
         self.assertEqual([], subber.messages)
 
+    def test_no_subscribers(self):
+        s = topic("nobody listens")
+        self.assertEqual((), s.send("hello"))
+        self.assertIs(s.send("hello"), topic("nobody else listens").send("hi"))   # nothing allocated
+        subber = Subber("sub1")
+        s.subscribe(subber)
+        s.unsubscribe(subber)
+        self.assertEqual((), s.send("hello"))
+        self.assertEqual([], subber.messages)
+
+    def test_unsubscribe_while_sending(self):
+        class Once(Subber):
+            def pubsub_event(self, topicname, event):
+                topic(topicname).unsubscribe(self)
+                return super(Once, self).pubsub_event(topicname, event)
+        s = topic("once")
+        subbers = [Once("sub%d" % i) for i in range(5)]
+        for subber in subbers:
+            s.subscribe(subber)
+        self.assertEqual(5, len(s.send("first")))
+        self.assertEqual(0, len(s.send("second")))
+
+    def test_threads(self):
+        topics = []
+        start = threading.Event()
+
+        def create():
+            start.wait()
+            for i in range(200):
+                topics.append(topic(("threads", i)))
+        threads = [threading.Thread(target=create) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(800, len(topics))
+        self.assertEqual(200, len(set(id(t) for t in topics)))   # every name got only one topic
+        for t in topics:
+            self.assertIs(t, topic(t.name))
+
+    def test_topic_lifetime(self):
+        s = topic("owned")
+        self.assertIn("owned", pubsub.all_topics)
+        del s
+        gc.collect()
+        self.assertNotIn("owned", pubsub.all_topics)    # nobody holds on to it
+        subber = Subber("sub1")
+        topic("subscribed").subscribe(subber)
+        gc.collect()
+        self.assertEqual(["sub1"], topic("subscribed").send("x"))   # the subscriber keeps it alive
+        topic("subscribed").unsubscribe(subber)
+        gc.collect()
+        self.assertNotIn("subscribed", pubsub.all_topics)
+        topic("subscribed").subscribe(subber)
+        del subber
+        gc.collect()
+        self.assertNotIn("subscribed", pubsub.all_topics)
+
+    def test_subscriptions(self):
+        subber = Subber("sub1")
+        subber2 = Subber("sub2")
+        s1 = topic("testX")
+        s2 = topic("testY")
+        s1.subscribe(subber)
+        s2.subscribe(subber)
+        s2.subscribe(subber2)
+        self.assertEqual({s1, s2}, pubsub.subscriptions[subber])
+        self.assertEqual({s2}, pubsub.subscriptions[subber2])
+        s1.unsubscribe(subber)
+        self.assertEqual({s2}, pubsub.subscriptions[subber])
+        unsubscribe_all(subber)
+        self.assertNotIn(subber, pubsub.subscriptions)
+        self.assertEqual(["sub2"], s2.send("hi"))
+        del subber2
+        gc.collect()
+        self.assertEqual([], s2.send("hi"))
+        self.assertEqual(set(), s2.subscribers)      # the dead subscriber is cleaned up
+
+    def test_owners(self):
+        class Owner(object):
+            def __init__(self, name):
+                self.tap = topic(("owner", name))
+        owners = [Owner(i) for i in range(100)]
+        gc.collect()
+        count = len(pubsub.all_topics)
+        owners[0].tap.subscribe(Subber("sub1"))
+        del owners
+        gc.collect()
+        self.assertEqual(count - 100, len(pubsub.all_topics))
+
+
+class TestDeferredDelivery(unittest.TestCase):
+    def setUp(self):
+        self.subber = Subber("sub1")
+        self.topic = topic("deferred")
+        self.topic.subscribe(self.subber)
+
+    def tearDown(self):
+        pubsub.set_dispatcher(None)
+        self.topic.unsubscribe(self.subber)
+
+    def test_deferred(self):
+        dispatcher = pubsub.Dispatcher()
+        pubsub.set_dispatcher(dispatcher)
+        self.assertEqual((), self.topic.send("one"))
+        self.assertEqual((), self.topic.send("two"))
+        self.assertEqual((), topic("nobody listens").send("three"))
+        self.assertEqual([], self.subber.messages)
+        self.assertEqual(2, dispatcher.waiting())
+        self.assertEqual(2, dispatcher.drain())
+        self.assertEqual([("deferred", "one"), ("deferred", "two")], self.subber.messages)
+        self.assertEqual(0, dispatcher.drain())
+        self.assertEqual(2, dispatcher.delivered)
+        self.topic.send("three")
+        pubsub.set_dispatcher(None)    # delivers what was still waiting
+        self.assertEqual(("deferred", "three"), self.subber.messages[-1])
+        self.assertEqual(["sub1"], self.topic.send("four"))
+
+    def test_policies(self):
+        for policy, expected in [("drop-oldest", [4, 4, 4]), ("drop-newest", [1, 2, 2]), ("coalesce", [2, 3, 4])]:
+            dispatcher = pubsub.Dispatcher(buffer_size=3, policy=policy)
+            pubsub.set_dispatcher(dispatcher)
+            self.subber.clear()
+            for event in [1, 2, 2, 3, 4, 4, 4]:
+                self.topic.send(event)
+            dispatcher.drain()
+            self.assertEqual(expected, [event for _, event in self.subber.messages], policy)
+            self.assertEqual(7, dispatcher.delivered + dispatcher.dropped + dispatcher.coalesced)
+        with self.assertRaises(ValueError):
+            pubsub.Dispatcher(policy="whatever")
+
+    def test_batches(self):
+        class Echo(Subber):
+            def pubsub_event(self, topicname, event):
+                topic("echo").send(event)    # keeps sending itself events
+                return super(Echo, self).pubsub_event(topicname, event)
+        echo = Echo("echo")
+        topic("echo").subscribe(echo)
+        self.addCleanup(topic("echo").unsubscribe, echo)
+        dispatcher = pubsub.Dispatcher(batch_size=5)
+        pubsub.set_dispatcher(dispatcher)
+        for event in range(8):
+            self.topic.send(event)
+        topic("echo").send("hello")
+        self.assertEqual(5, dispatcher.drain())
+        self.assertEqual(list(range(5)), [event for _, event in self.subber.messages])
+        self.assertEqual([], echo.messages)
+        self.assertEqual(5, dispatcher.drain())    # the topics take turns
+        self.assertEqual(list(range(8)), [event for _, event in self.subber.messages])
+        self.assertEqual(["hello"] * 2, [event for _, event in echo.messages])
+        self.assertEqual(1, dispatcher.waiting())
+        topic("echo").unsubscribe(echo)
+        self.assertEqual(1, dispatcher.drain())
+        self.assertEqual(0, dispatcher.waiting())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+"""
+Unit tests for the savegame inspector tool
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import tale.driver as the_driver
+import tale.io.vfs
+from tale import mud_context, player, pristine
+from tale.tools import saveinspect
+from tests.test_pristine import build_world
+
+
+class Thing(object):
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+
+
+class TestSaveInspect(unittest.TestCase):
+    def inspect(self, obj):
+        return saveinspect.Inspection(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+    def test_no_game_code(self):
+        data = pickle.dumps({"thing": Thing("rock", "A grey rock.")}, pickle.HIGHEST_PROTOCOL)
+        data = data.replace(b"tests.test_saveinspect", b"nosuchgame.zones.rocks")
+        self.assertNotIn(b"tests.test_saveinspect", data)
+        inspection = saveinspect.Inspection(data)
+        rock = inspection.root["thing"]
+        self.assertIsInstance(rock, saveinspect.Stub)
+        self.assertEqual("nosuchgame.zones.rocks.Thing", rock.classname)
+        self.assertEqual({"name": "rock", "description": "A grey rock."}, rock.attributes())
+        self.assertNotIn("nosuchgame", sys.modules)
+        self.assertEqual(1, inspection.classes["nosuchgame.zones.rocks.Thing"][0])
+
+    def test_classes_and_attributes(self):
+        things = [Thing("rock%d" % i, "A grey rock. " * 10) for i in range(5)]
+        inspection = self.inspect({"things": things, "count": 5})
+        count, size = inspection.classes[Thing.__module__ + ".Thing"]
+        self.assertEqual(5, count)
+        self.assertTrue(size > 5 * 130)
+        count, size, largest, obj = inspection.attributes[Thing.__module__ + ".Thing", "description"]
+        self.assertEqual(5, count)
+        self.assertTrue(largest >= 130)
+        self.assertEqual("things", inspection.contents()[0][0])
+
+    def test_strings(self):
+        shared = "The same description, shared by all."
+        things = [Thing("rock", shared) for _ in range(3)]
+        things += [Thing("pebble", "A copy of a description " + str(i // 10)) for i in range(4)]
+        inspection = self.inspect(things)
+        duplicates = inspection.duplicated_strings()
+        self.assertEqual(1, len(duplicates))
+        wasted, copies, string = duplicates[0]
+        self.assertEqual("A copy of a description 0", string)
+        self.assertEqual(4, copies)
+        self.assertEqual(3 * len(string), wasted)
+        self.assertTrue(inspection.shared_strings() >= 4)   # the shared description and the names of the rocks
+        self.assertTrue(inspection.memo_gets >= 4)
+
+    def test_delta_savegame(self):
+        storage = tempfile.mkdtemp()
+        try:
+            driver = the_driver.Driver()
+            driver.vfs = tale.io.vfs.VirtualFileSystem(storage)
+            driver.vfs.get_userdata_dir = lambda path: os.path.join(storage, path)
+            mud_context.driver = driver
+            namespaces = build_world()
+            driver.pristine_world = pristine.PristineWorld(namespaces)
+            hall = namespaces[0][1]["hall"]
+            julie = player.Player("julie", "f")
+            julie.move(hall)
+            hall.exits["kitchen"].opened = True
+            driver.write_savegame("test.savegame", {"version": "1.0", "player": julie})
+            data, file_size, _ = saveinspect.read_savegame(os.path.join(storage, "test.savegame"))
+            self.assertTrue(file_size < len(data))   # it was compressed
+            inspection = saveinspect.Inspection(data)
+            self.assertIn("zones.house:hall", inspection.world_references)
+            self.assertEqual(1, inspection.classes["tale.player.Player"][0])
+            self.assertIn("tale.soul.Soul", inspection.classes)
+            self.assertIn("zones.house:hall.exits[kitchen]", inspection.root["world_changes"])
+            output = io.StringIO()
+            inspection.report(output, top=5)
+            report = output.getvalue()
+            self.assertIn("tale.player.Player", report)
+            self.assertIn("References to world objects: ", report)
+        finally:
+            shutil.rmtree(storage)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -34,6 +34,29 @@ class TestSerializing(unittest.TestCase):
         x = serializecycle(o)
         self.assert_base_attrs(x)
         self.assertEqual(["alias"], x.aliases)
+    def test_static_texts(self):
+        description = "A very long description of a rock. " * 20
+        rock1 = base.Item("rock", "grey rock", description)
+        rock2 = base.Item("rock", "grey rock", description)
+        self.assertIs(rock1.description, rock2.description)
+        data = pickle.dumps([rock1, rock2], pickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(data), 2 * len(description))    # the shared text is in there just once
+        loaded = pickle.loads(data)
+        self.assertIs(rock1.description, loaded[0].description)   # and is shared again
+        self.assertIs(rock1.description, loaded[1].description)
+        self.assertIs(rock1.description, util.clone(rock1).description)
+        # a text that isn't in the table, because it was made while the game runs, is left alone
+        table = base.TextTable()
+        table.seal()
+        self.assertEqual("A rock that was made later on.  " * 2, table.share("A rock that was made later on.  " * 2))
+        self.assertEqual({}, table.texts)
+        # the texts of the sources have changed since it was pickled (a new table, as after a restart)
+        texts, base.static_texts = base.static_texts, base.TextTable()
+        try:
+            self.assertEqual(rock1.description, pickle.loads(data)[0].description)
+        finally:
+            base.static_texts = texts
+
     def test_items_and_container(self):
         o = base.Item("name", "title", "description")
         o.aliases = ["alias"]
@@ -0,0 +1,201 @@
+"""
+Unit tests for the world startup cache
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import datetime
+import io
+import os
+import sys
+import shutil
+import tempfile
+import tale.driver as the_driver
+from tale import mud_context, base, snapshot, util
+
+
+ZONE_SOURCE = """
+from tale.base import Location, Exit
+hall = Location("Hall", "A big hall.")
+kitchen = Location("Kitchen", "A kitchen.")
+hall.add_exits([Exit("kitchen", kitchen, "The kitchen is over there.")])
+kitchen.add_exits([Exit("hall", "house.hall", "The hall.")])
+"""
+
+ZONE_CLASS_SOURCE = """
+from tale.base import Location
+from tale import mud_context
+class Special(Location):
+    def light(self):
+        return darkness
+def built():
+    mud_context.built += 1
+built()
+darkness = "pitch black"
+cellar = Special("Cellar", "A dark cellar.")
+"""
+
+ZONE_TYPE_SOURCE = """
+from tale.base import Location
+Special = type(str("Special"), (Location,), {"__module__": "zones.house"})
+cellar = Special("Cellar", "A dark cellar.")
+"""
+
+
+class MemoryVfs(object):
+    def __init__(self):
+        self.storage = {}
+    def open_storage_write(self, path):
+        vfs = self
+        class Writer(io.BytesIO):
+            def __exit__(self, *args):
+                vfs.storage[path] = self.getvalue()
+        return Writer()
+    def load_from_storage(self, path):
+        if path not in self.storage:
+            raise IOError("not found")
+        return self.storage[path]
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.gamedir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.gamedir, "zones"))
+        with open(os.path.join(self.gamedir, "zones", "__init__.py"), "w") as f:
+            f.write("")
+        sys.path.insert(0, self.gamedir)
+        self.driver = the_driver.Driver()
+        self.driver.game_clock = util.GameDateTime(datetime.datetime(2013, 7, 18, 15, 0, 0), 1)
+        self.driver.vfs = MemoryVfs()
+        mud_context.driver = self.driver
+
+    def tearDown(self):
+        sys.path.remove(self.gamedir)
+        for name in snapshot.zone_module_names():
+            del sys.modules[name]
+        shutil.rmtree(self.gamedir)
+
+    def write_zone(self, name, source):
+        with open(os.path.join(self.gamedir, "zones", name + ".py"), "w") as f:
+            f.write(source)
+
+    def build_world(self):
+        import zones.house
+        self.driver.zones = sys.modules["zones"]
+        self.driver.bind_exits()
+        self.driver.unbound_exits = []
+        return zones.house
+
+    def forget_world(self):
+        for name in snapshot.zone_module_names():
+            del sys.modules[name]
+        self.driver.heartbeat_objects = the_driver.HeartbeatScheduler()
+        self.driver.deferreds = the_driver.TimerWheel()
+
+    def test_source_key(self):
+        self.write_zone("house", ZONE_SOURCE)
+        key = snapshot.source_key({"version": "1.0"}, "if", self.gamedir)
+        self.assertEqual(key, snapshot.source_key({"version": "1.0"}, "if", self.gamedir))
+        self.assertNotEqual(key, snapshot.source_key({"version": "1.1"}, "if", self.gamedir))
+        self.assertNotEqual(key, snapshot.source_key({"version": "1.0"}, "mud", self.gamedir))
+        self.write_zone("house", ZONE_SOURCE + "\n# changed\n")
+        self.assertNotEqual(key, snapshot.source_key({"version": "1.0"}, "if", self.gamedir))
+
+    def test_source_key_library(self):
+        library = os.path.join(self.gamedir, "tale")
+        os.mkdir(library)
+        with open(os.path.join(library, "base.py"), "w") as f:
+            f.write("pass\n")
+        self.addCleanup(setattr, snapshot, "TALE_PATH", snapshot.TALE_PATH)
+        snapshot.TALE_PATH = library
+        key = snapshot.source_key({"version": "1.0"}, "if", os.path.join(self.gamedir, "zones"))
+        with open(os.path.join(library, "base.py"), "w") as f:
+            f.write("pass  # changed\n")
+        self.assertNotEqual(key, snapshot.source_key({"version": "1.0"}, "if", os.path.join(self.gamedir, "zones")))
+
+    def test_roundtrip(self):
+        self.write_zone("house", ZONE_SOURCE)
+        house = self.build_world()
+        house.hall.register_heartbeat()
+        self.driver.defer(10, house.kitchen, "init")
+        base.Item("key").register_prototype("house:key")
+        self.addCleanup(base.prototypes.clear)
+        self.assertTrue(snapshot.save(self.driver, "test.worldcache", "key"))
+        self.forget_world()
+        self.driver.game_clock.add_gametime(datetime.timedelta(hours=1))
+        zones = snapshot.load(self.driver, "test.worldcache", "key")
+        self.assertIs(sys.modules["zones"], zones)
+        restored = sys.modules["zones.house"]
+        self.assertIs(restored, zones.house)
+        self.assertIsNot(house.hall, restored.hall)
+        self.assertIs(restored.kitchen, restored.hall.exits["kitchen"].target)
+        self.assertIs(restored.hall, restored.kitchen.exits["hall"].target)
+        self.assertIn(restored.hall, self.driver.heartbeat_objects)
+        deferred = list(self.driver.deferreds)[0]
+        self.assertIs(restored.kitchen, deferred.owner)
+        self.assertEqual(datetime.timedelta(seconds=10), deferred.when_due(self.driver.game_clock))
+        self.assertEqual("key", base.spawn("house:key").name)
+
+    def test_texts(self):
+        self.write_zone("house", ZONE_SOURCE.replace("A big hall.", "A big hall, with a long description that is shared."))
+        house = self.build_world()
+        self.assertTrue(snapshot.save(self.driver, "test.worldcache", "key"))
+        self.forget_world()
+        texts, base.static_texts = base.static_texts, base.TextTable()   # as after a restart
+        try:
+            snapshot.load(self.driver, "test.worldcache", "key")
+            restored = sys.modules["zones.house"].hall.description
+            self.assertEqual(house.hall.description, restored)
+            self.assertIs(restored, base.static_texts.share("A big hall, with a long description that is shared."))
+        finally:
+            base.static_texts = texts
+
+    def test_stale_or_missing(self):
+        self.assertIsNone(snapshot.load(self.driver, "test.worldcache", "key"))
+        self.write_zone("house", ZONE_SOURCE)
+        self.build_world()
+        self.assertTrue(snapshot.save(self.driver, "test.worldcache", "key"))
+        self.assertIsNone(snapshot.load(self.driver, "test.worldcache", "other-key"))
+        self.driver.vfs.storage["test.worldcache"] = b"garbage"
+        self.assertIsNone(snapshot.load(self.driver, "test.worldcache", "key"))
+
+    def test_zone_classes(self):
+        self.write_zone("house", ZONE_CLASS_SOURCE)
+        mud_context.built = 0
+        self.addCleanup(delattr, mud_context, "built")
+        self.build_world()
+        self.assertTrue(snapshot.save(self.driver, "test.worldcache", "key"))
+        self.forget_world()
+        snapshot.load(self.driver, "test.worldcache", "key")
+        self.assertEqual(1, mud_context.built, "the code that builds the world must not run again")
+        house = sys.modules["zones.house"]
+        self.assertIsInstance(house.cellar, house.Special)
+        self.assertEqual("pitch black", house.cellar.light())
+
+    def test_undefined_zone_classes_not_cached(self):
+        self.write_zone("house", ZONE_TYPE_SOURCE)
+        self.build_world()
+        self.assertFalse(snapshot.save(self.driver, "test.worldcache", "key"))
+        self.assertEqual({}, self.driver.vfs.storage)
+
+    def test_story_timers(self):
+        bell = base.Item("bell")
+        story_deferred = self.driver.defer(5, bell, "init")
+        story_timers = snapshot.registered_timers(self.driver)
+        self.write_zone("house", ZONE_SOURCE)
+        house = self.build_world()
+        self.driver.defer(10, house.kitchen, "init")
+        self.assertTrue(snapshot.save(self.driver, "test.worldcache", "key", story_timers))
+        self.forget_world()
+        story_deferred = self.driver.defer(5, bell, "init")   # the story registers its own again, before the world is loaded
+        snapshot.load(self.driver, "test.worldcache", "key")
+        deferreds = list(self.driver.deferreds)
+        self.assertEqual(2, len(deferreds))
+        self.assertIs(story_deferred, deferreds[0])
+        self.assertIs(sys.modules["zones.house"].kitchen, deferreds[1].owner)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Unittests for the telnet server i/o
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import unittest
+import socket
+try:
+    from tale.io import telnet_io
+except ImportError:
+    telnet_io = None   # no selectors module available
+
+
+class DummyServer(object):
+    def __init__(self):
+        self.woken = []
+    def wakeup(self, connection):
+        self.woken.append(connection)
+    def mainloop(self):
+        self.woken.append("mainloop")
+
+
+@unittest.skipIf(telnet_io is None, "selectors not available")
+class TestSendBuffer(unittest.TestCase):
+    def test_consume(self):
+        buf = telnet_io.SendBuffer()
+        self.assertEqual(0, len(buf))
+        buf.append(b"hello")
+        buf.append(b" world")
+        self.assertEqual(11, len(buf))
+        buf.consume(6)
+        self.assertEqual(5, len(buf))
+        self.assertEqual(6, buf.start)
+        buf.consume(5)
+        self.assertEqual(0, len(buf))
+        self.assertEqual(0, buf.start)
+        self.assertEqual(b"", bytes(buf.data))
+
+    def test_compact(self):
+        buf = telnet_io.SendBuffer()
+        buf.compact_size = 10
+        buf.append(b"x" * 15)
+        buf.consume(8)
+        self.assertEqual(8, buf.start)
+        buf.consume(2)
+        self.assertEqual(0, buf.start)
+        self.assertEqual(b"x" * 5, bytes(buf.data))
+
+    def test_send(self):
+        a, b = socket.socketpair()
+        try:
+            buf = telnet_io.SendBuffer()
+            buf.append(b"hello world")
+            self.assertEqual(11, buf.send(a))
+            self.assertEqual(0, len(buf))
+            buf.append(b"more")    # the buffer must not be locked by a lingering memoryview
+            self.assertEqual(b"hello world", b.recv(100))
+        finally:
+            a.close()
+            b.close()
+
+
+@unittest.skipIf(telnet_io is None, "selectors not available")
+class TestTelnetConnection(unittest.TestCase):
+    def setUp(self):
+        self.server = DummyServer()
+        self.conn = telnet_io.TelnetConnection(self.server, None, ("127.0.0.1", 4000))
+
+    def test_lines(self):
+        self.assertEqual([], self.conn.received(b"hel"))
+        self.assertEqual(["hello", "world"], self.conn.received(b"lo\r\nworld\n  pa"))
+        self.assertEqual(["partial"], self.conn.received(b"rtial\r\x00"))
+        self.assertEqual(["sm\u00f8rrebr\u00f8d"], self.conn.received("sm\u00f8rrebr\u00f8d\r\n".encode("utf-8")))
+
+    def test_long_line(self):
+        self.conn.max_line_length = 10
+        self.assertEqual([], self.conn.received(b"x" * 20))
+        self.assertEqual(["ok"], self.conn.received(b"ok\n"))
+
+    def test_negotiation(self):
+        self.assertEqual(["look"], self.conn.received(b"lo\xff\xfd\x01ok\xff\xfb\x1f\r\n"))
+        self.assertEqual(b"\xff\xfc\x01\xff\xfe\x1f", bytes(self.conn.outbuffer.data))
+        self.assertEqual([self.conn], self.server.woken)
+
+    def test_split_commands(self):
+        self.assertEqual([], self.conn.received(b"a\xff"))
+        self.assertEqual([], self.conn.received(b"\xfa\x1f\x00\x50"))
+        self.assertEqual([], self.conn.received(b"\x00\x18\xff"))
+        self.assertEqual(["ab"], self.conn.received(b"\xf0b\n"))
+        self.assertEqual([], self.conn.received(b"\xff\xfe"))
+        self.assertEqual(["c"], self.conn.received(b"\x01c\n"))
+        self.assertEqual(0, len(self.conn.outbuffer))
+
+    def test_unterminated_subnegotiation(self):
+        self.conn.max_subnegotiation = 10
+        self.assertEqual(["ok"], self.conn.received(b"ok\n\xff\xfa\x1f"))
+        self.assertEqual([], self.conn.received(b"x" * 5))
+        self.assertFalse(self.conn.closing)
+        self.assertEqual([], self.conn.received(b"x" * 10))
+        self.assertTrue(self.conn.closing)
+        self.assertEqual(b"", self.conn.partial_command)
+        self.assertEqual([self.conn], self.server.woken)
+
+    def test_escaped_iac(self):
+        self.assertEqual(["a\ufffdb"], self.conn.received(b"a\xff\xffb\n"))
+
+    def test_io_mainloop(self):
+        io = telnet_io.TelnetIo({}, self.conn)
+        io.mainloop()
+        self.assertEqual(["mainloop"], self.server.woken)
+
+    def test_backpressure(self):
+        self.conn.high_water = 10
+        self.conn.low_water = 4
+        self.conn.max_output = 20
+        self.assertTrue(self.conn.wants_read())
+        self.conn.write(b"x" * 12)
+        self.assertFalse(self.conn.wants_read())
+        self.conn.outbuffer.consume(6)
+        self.assertFalse(self.conn.wants_read())
+        self.conn.outbuffer.consume(2)
+        self.assertTrue(self.conn.wants_read())
+        self.conn.write(b"x" * 30)
+        self.assertTrue(self.conn.closing)
+        self.assertEqual(0, len(self.conn.outbuffer))
+        self.conn.write(b"ignored")
+        self.assertEqual(0, len(self.conn.outbuffer))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Unit tests for the zone resets
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import datetime
+from tale import mud_context, base, npc, player, util, zonereset
+from tests.supportstuff import DummyDriver
+from tests.test_pristine import build_world
+
+
+class TestZoneResets(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = DummyDriver()
+        namespaces = build_world()
+        self.hall = namespaces[0][1]["hall"]
+        self.kitchen = namespaces[0][1]["kitchen"]
+        self.rooms = namespaces[1][1]["rooms"]
+        self.resets = zonereset.ZoneResets(namespaces, 600)
+
+    def test_zones(self):
+        self.assertEqual({"house", "rooms"}, set(self.resets.zones))
+        house = self.resets.zones["house"]
+        self.assertIs(house, self.resets.zone_of(self.kitchen))
+        self.assertIs(self.resets.zones["rooms"], self.resets.zone_of(self.rooms[10]))
+        self.assertIsNone(self.resets.zone_of(base.Location("elsewhere")))
+        self.assertEqual(4, len(house.placements))
+        self.assertTrue(all(prototype.location is None for location, obj, prototype in house.placements))
+        self.assertEqual(1, len(house.doors))
+        self.assertEqual(100, len(self.resets.zones["rooms"].placements))
+
+    def test_without_interval(self):
+        namespaces = build_world()
+        self.assertEqual({}, zonereset.ZoneResets(namespaces, 0).zones)
+        namespaces[1][1]["reset_interval"] = 300
+        resets = zonereset.ZoneResets(namespaces, 0)
+        self.assertEqual(["rooms"], list(resets.zones))
+        self.assertEqual(300, resets.zones["rooms"].interval)
+
+    def test_reset(self):
+        house = self.resets.zones["house"]
+        self.assertEqual(0, house.reset())
+        key = [i for i in self.hall.items if i.name == "key"][0]
+        rat, rat2 = [l for l in self.hall.livings if l.name == "rat"]
+        julie = player.Player("julie", "f")
+        julie.move(self.hall)
+        key.move(julie, julie)
+        rat.move(self.kitchen)
+        rat2.destroy(util.Context(driver=mud_context.driver))
+        self.hall.exits["kitchen"].opened = True
+        junk = base.Item("junk")
+        junk.move(self.hall)
+        self.assertEqual(4, house.reset())
+        self.assertIn(key, julie)            # the player keeps the key, a new one is spawned
+        key2 = [i for i in self.hall.items if i.name == "key"][0]
+        self.assertIsNot(key, key2)
+        self.assertEqual("rusty key", key2.title)
+        self.assertIs(self.hall, key2.contained_in)
+        self.assertIn(rat, self.hall)        # the rat came back
+        self.assertEqual(2, len([l for l in self.hall.livings if l.name == "rat"]))
+        self.assertFalse([l for l in base._Limbo.livings if l.name == "rat"])   # the new rat isn't left behind in Limbo
+        self.assertIn(junk, self.hall)
+        self.assertFalse(self.hall.exits["kitchen"].opened)
+        self.assertEqual(0, house.reset())
+        key2.move(julie, julie)
+        self.assertEqual(1, house.reset())
+        self.assertEqual(2, len([i for i in julie.inventory if i.name == "key"]))
+
+    def test_respawned_npc_acts(self):
+        class Crier(npc.NPC):
+            def init(self):
+                self.cries = 0
+                mud_context.driver.defer(2, self, self.cry)
+            def init_spawned(self):
+                mud_context.driver.defer(2, self, self.cry)
+            def cry(self, driver):
+                self.cries += 1
+                driver.defer(20, self, self.cry)
+        crier = Crier("crier", "m")
+        crier.move(self.kitchen)
+        resets = zonereset.ZoneResets([("zones.house", {"kitchen": self.kitchen})], 600)
+        prototype = resets.zones["house"].placements[-1][2]
+        self.assertEqual([crier], [owner for due, owner, callable in mud_context.driver.deferreds])   # the prototype doesn't cry
+        crier.destroy(util.Context(driver=mud_context.driver))
+        self.kitchen.remove(crier, None)
+        self.assertEqual(1, resets.zones["house"].reset())
+        crier2 = [l for l in self.kitchen.livings if l.name == "crier"][0]
+        self.assertIsNot(prototype, crier2)
+        self.assertEqual([crier2], [owner for due, owner, callable in mud_context.driver.deferreds])
+        due, owner, callable = mud_context.driver.deferreds[0]
+        callable(mud_context.driver)
+        self.assertEqual(1, crier2.cries)
+
+    def test_schedule(self):
+        clock = util.GameDateTime(datetime.datetime(2015, 1, 1), 1)
+        for zone in self.resets.zones.values():
+            zone.interval = 60
+        self.resets.schedule(clock)
+        self.assertEqual(datetime.datetime(2015, 1, 1, 0, 0, 30), self.resets.zones["house"].next_reset)
+        self.assertEqual(datetime.datetime(2015, 1, 1, 0, 1, 0), self.resets.zones["rooms"].next_reset)
+        self.resets.tick(clock)
+        self.assertEqual(0, self.resets.resets)
+        clock.add_realtime(datetime.timedelta(seconds=90))
+        self.resets.tick(clock)
+        self.assertEqual(1, self.resets.resets)    # only one zone per tick
+        self.assertEqual("house", self.resets.last_reset[0])
+        self.resets.tick(clock)
+        self.assertEqual(2, self.resets.resets)
+        self.assertEqual("rooms", self.resets.last_reset[0])
+        self.resets.tick(clock)
+        self.assertEqual(2, self.resets.resets)
+        self.assertEqual(datetime.datetime(2015, 1, 1, 0, 2, 30), self.resets.zones["rooms"].next_reset)
+
+    def test_state(self):
+        chair = [i for i in self.rooms[0].items if i.name == "chair"][0]
+        chair.move(self.rooms[1])
+        self.resets.reset(self.resets.zones["rooms"])
+        state = self.resets.state()
+        chair2 = [i for i in self.rooms[0].items if i.name == "chair"][0]
+        self.assertIn(chair2, state["rooms"][1])
+        self.assertNotIn(chair, state["rooms"][1])
+        resets = zonereset.ZoneResets(build_world(), 600)
+        resets.restore(state)
+        self.assertIn(chair2, resets.state()["rooms"][1])
+
+
+if __name__ == "__main__":
+    unittest.main()